@@ -14,11 +14,13 @@ log = logging.getLogger(__name__)
 class BalanceManager:
 
     @staticmethod
-    def set_hold(user_id, currency, amount, amount_in_orders):
+    def set_hold(user_id, currency, amount, in_orders_delta=None):
         """
-        Decrease amount and increase amount_in_orders
+        Decrease amount and increase amount_in_orders.
+        in_orders_delta is the hold change of the order, equals to amount by default
         """
         amount = to_decimal(abs(amount))
+        in_orders_delta = amount if in_orders_delta is None else to_decimal(abs(in_orders_delta))
 
         result = Balance.objects.filter(
             user_id=user_id,
@@ -26,7 +28,7 @@ class BalanceManager:
             amount__gte=amount
         ).update(
             amount=F('amount') - amount,
-            amount_in_orders=amount_in_orders,
+            amount_in_orders=F('amount_in_orders') + in_orders_delta,
         )
 
         if result != 1:
@@ -35,18 +37,20 @@ class BalanceManager:
         balance_changed.send(sender=BalanceManager, user_id=user_id)
 
     @staticmethod
-    def free_hold(user_id, currency, amount, amount_in_orders):
+    def free_hold(user_id, currency, amount, in_orders_delta=None):
         """
-        Cancel order
+        Cancel order.
+        in_orders_delta is the released hold of the order, equals to amount by default
         """
         amount = to_decimal(abs(amount))
+        in_orders_delta = amount if in_orders_delta is None else to_decimal(abs(in_orders_delta))
 
         result = Balance.objects.filter(
             user_id=user_id,
             currency=currency,
         ).update(
             amount=F('amount') + amount,
-            amount_in_orders=amount_in_orders,
+            amount_in_orders=F('amount_in_orders') - in_orders_delta,
         )
 
         if result != 1:
@@ -65,7 +69,7 @@ class BalanceManager:
             user_id=user_id,
             currency=currency,
         ).update(
-            amount_in_orders=amount,
+            amount_in_orders=F('amount_in_orders') - amount,
         )
 
         if result != 1:
@@ -1,5 +1,9 @@
+import threading
+import time
+
 from cachetools import TTLCache
 from django.conf import settings
+from django.core.cache import cache
 
 from lib.cache import PrefixedRedisCache
 
@@ -9,12 +13,17 @@ KEEPER_BALANCES_CACHE_KEY = 'keep_balances'
 RESEND_VERIFICATION_TOKEN_CACHE_KEY = 'resend-verification-token-'
 RESEND_VERIFICATION_TOKEN_REVERSED_CACHE_KEY = 'resend-verification-token-reversed-'
 COINS_STATIC_DATA_CACHE_KEY = 'coins-static-data-cache'
+CHART_BLOCK_CACHE_KEY = 'block-{}-{}-{}'  # pair, period, block start ts
+CHART_LAST_PRICE_CACHE_KEY = 'last-price-{}-{}'  # pair, ts
+EXTRA_TRANSACTIONS_WATERMARK_CACHE_KEY = 'extra-transactions-watermark'
+CHART_RESPONSE_CACHE_KEY = 'response-{}-{}-{}-{}'  # pair, period, start ts, stop ts
 
 orders_app_cache = PrefixedRedisCache.get_cache(prefix='orders-app-cache-')
 external_exchanges_pairs_price_cache = PrefixedRedisCache.get_cache(prefix='external-exchanges-pairs-price-')
 cryptocompare_pairs_price_cache = PrefixedRedisCache.get_cache(prefix='cryptocompare-pairs-price-')
 facade_cache = PrefixedRedisCache.get_cache(prefix='facade-app-cache-')
 last_pair_price_cache = PrefixedRedisCache.get_cache(prefix='last-pair-price-')
+chart_cache = PrefixedRedisCache.get_cache(prefix='chart-')
 
 
 maxsize = settings.SETTINGS_CACHE_MAXSIZE if hasattr(
@@ -22,3 +31,50 @@ maxsize = settings.SETTINGS_CACHE_MAXSIZE if hasattr(
 ttl = settings.SETTINGS_CACHE_TTL if hasattr(
     settings, 'SETTINGS_CACHE_TTL') else 60*60
 settings_cache = TTLCache(maxsize, ttl)
+
+
+class LocalSettingsCache:
+    """
+    Process-local copy of settings dict stored in redis.
+    Redis version stamp is checked at most once per SETTINGS_VERSION_CHECK_PERIOD,
+    the dict itself is fetched only after writer bumped the version.
+    Returned dict is shared by the process, callers must not modify it.
+    """
+
+    def __init__(self, key: str):
+        self.key = key
+        self.version_key = f'{key}:version'
+        self.data = None
+        self.version = None
+        self.checked = 0
+        self.lock = threading.Lock()
+
+    def get(self, loader) -> dict:
+        now = time.monotonic()
+        if self.data is not None and now - self.checked < settings.SETTINGS_VERSION_CHECK_PERIOD:
+            return self.data
+
+        with self.lock:
+            version = cache.get(self.version_key)
+            if not self.data or version != self.version:
+                data = cache.get(self.key)
+                if not data:
+                    data = loader()
+                    cache.set(self.key, data)
+                self.data = data
+                self.version = version
+            self.checked = now
+        return self.data
+
+    def refresh(self, loader) -> dict:
+        """
+        Rebuilds data from db and makes all processes reload it
+        """
+        data = loader()
+        with self.lock:
+            cache.set(self.key, data)
+            cache.add(self.version_key, 0, timeout=None)
+            self.version = cache.incr(self.version_key)
+            self.data = data
+            self.checked = time.monotonic()
+        return data
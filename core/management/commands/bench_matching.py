@@ -0,0 +1,257 @@
+import logging
+import random
+import time
+from collections import defaultdict
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core import serializers
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.test.utils import override_settings
+
+from core.consts.orders import BUY
+from core.consts.orders import EXCHANGE
+from core.consts.orders import LIMIT
+from core.consts.orders import MARKET
+from core.consts.orders import SELL
+from core.consts.orders import STOP_LIMIT
+from core.models.inouts.balance import Balance
+from core.models.inouts.pair import Pair
+from core.models.inouts.pair_settings import PairSettings
+from core.models.orders import ExecutionResult
+from core.models.orders import Order
+from core.stack_processor import StackProcessor
+from core.tasks import orders as orders_tasks
+from exchange.celery_app import app
+from exchange.notifications import notifications_buffer
+from lib.helpers import to_decimal
+
+log = logging.getLogger(__name__)
+User = get_user_model()
+
+ORDER_TYPES = {
+    'limit': LIMIT,
+    'market': MARKET,
+    'exchange': EXCHANGE,
+    'stop_limit': STOP_LIMIT,
+}
+
+
+def percentile(values, p):
+    if not values:
+        return 0
+    values = sorted(values)
+    return values[min(int(len(values) * p / 100), len(values) - 1)]
+
+
+class Command(BaseCommand):
+    help = 'Matching engine benchmark: fills the book and runs generated orders through StackProcessor'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pair', default='BTC-USDT', type=str)
+        parser.add_argument('--depth', default=500, type=int, help='resting orders per book side')
+        parser.add_argument('--orders', default=2000, type=int, help='incoming orders count')
+        parser.add_argument(
+            '--mix', default='limit=70,market=15,exchange=10,stop_limit=5', type=str,
+            help='incoming order types weights',
+        )
+        parser.add_argument('--bots', default=0.5, type=float, help='share of orders placed by bots')
+        parser.add_argument('--cross', default=0.5, type=float, help='share of limit orders crossing the spread')
+        parser.add_argument('--users', default=20, type=int, help='users (and bots) count')
+        parser.add_argument('--price', default='10000', type=str, help='mid price')
+        parser.add_argument('--tick', default='0.01', type=str, help='price step')
+        parser.add_argument('--levels', default=100, type=int, help='price levels per book side')
+        parser.add_argument('--seed', default=1, type=int)
+        parser.add_argument('--keepdb', action='store_true', help='keep benchmark database')
+
+    def handle(self, *args, **options):
+        # benchmark writes a lot of orders, never run it against the working database
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=1, autoclobber=True, keepdb=options['keepdb'], serialize=False)
+        app.conf.task_always_eager = True
+        try:
+            with override_settings(ORDER_LIMIT=False):
+                self.run(options)
+        finally:
+            app.conf.task_always_eager = False
+            connection.creation.destroy_test_db(old_name, verbosity=1, keepdb=options['keepdb'])
+
+    def run(self, options):
+        self.random = random.Random(options['seed'])
+        self.mid_price = to_decimal(options['price'])
+        self.tick = to_decimal(options['tick'])
+        self.levels = options['levels']
+
+        self.pair = Pair.get(options['pair'])
+        PairSettings.objects.update_or_create(pair=self.pair, defaults={'is_enabled': True, 'deviation': 0})
+        self.users, self.bots = self.make_users(options['users'])
+
+        self.processor = StackProcessor.get_instance(renew=True, pairs=[self.pair])
+        # no background threads, they would keep benchmark database connections till it is dropped
+        notifications_buffer.start(flusher=False)
+        self.last_settle = self.last_flush = time.perf_counter()
+        self.book = self.processor.books[self.pair.code.upper()]
+
+        self.stdout.write(f'Filling {self.pair.code} book, {options["depth"]} orders per side')
+        for _ in range(options['depth']):
+            self.place_limit(SELL, self.resting_price(SELL), self.user(options['bots']))
+            self.place_limit(BUY, self.resting_price(BUY), self.user(options['bots']))
+        self.processor.settle()
+        notifications_buffer.flush()
+
+        mix = dict(i.split('=') for i in options['mix'].split(','))
+        types = list(mix)
+        weights = [float(mix[i]) for i in types]
+
+        self.timings = defaultdict(list)
+        self.queries = defaultdict(int)
+        last_er = ExecutionResult.objects.order_by('-id').values_list('id', flat=True).first() or 0
+
+        self.stdout.write(f'Running {options["orders"]} orders')
+        started = time.perf_counter()
+        for _ in range(options['orders']):
+            order_type = self.random.choices(types, weights)[0]
+            operation = self.random.choice([BUY, SELL])
+            user = self.user(options['bots'])
+            getattr(self, f'run_{order_type}')(operation, user, options['cross'])
+            self.run_background()
+
+        self.measure('settle', self.processor.settle)
+        self.measure('flush', notifications_buffer.flush)
+        elapsed = time.perf_counter() - started
+
+        matches = ExecutionResult.objects.filter(id__gt=last_er, cancelled=False).count() // 2
+        self.report(options['orders'], matches, elapsed)
+
+    def make_users(self, count):
+        users = []
+        bots = []
+        for i in range(count):
+            users.append(User.objects.create_user(username=f'bench{i}@bench.local', email=f'bench{i}@bench.local'))
+            bots.append(User.objects.create_user(username=f'bot{i}@bot.com', email=f'bot{i}@bot.com'))
+
+        for user in users + bots:
+            for currency in (self.pair.base, self.pair.quote):
+                Balance.objects.update_or_create(user=user, currency=currency, defaults={'amount': 10 ** 12})
+        return users, bots
+
+    def user(self, bots_share):
+        return self.random.choice(self.bots if self.random.random() < bots_share else self.users)
+
+    def quantity(self):
+        return to_decimal(self.random.randint(1, 1000)) / 1000
+
+    def resting_price(self, operation):
+        step = self.tick * self.random.randint(1, self.levels)
+        return self.mid_price + step if operation == SELL else self.mid_price - step
+
+    def crossing_price(self, operation):
+        step = self.tick * self.random.randint(1, self.levels // 4 or 1)
+        return self.mid_price + step if operation == BUY else self.mid_price - step
+
+    def run_background(self):
+        """
+        Settles fills and flushes notifications as often as the worker threads do
+        """
+        now = time.perf_counter()
+        if now - self.last_settle >= settings.STACK_SETTLEMENT_PERIOD:
+            self.measure('settle', self.processor.settle)
+            self.last_settle = now
+        if now - self.last_flush >= notifications_buffer.FLUSH_PERIOD:
+            self.measure('flush', notifications_buffer.flush)
+            self.last_flush = now
+
+    def measure(self, stage, fn, *args):
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            result = fn(*args)
+            self.timings[stage].append(time.perf_counter() - started)
+        self.queries[stage] += len(queries)
+        return result
+
+    def create_order(self, order):
+        """
+        Saves order without dispatching place_order task, eager task would match it inside save
+        """
+        with mock.patch.object(orders_tasks.place_order, 'apply_async'):
+            order.save()
+
+    def place_limit(self, operation, price, user):
+        order = Order(
+            user=user,
+            pair=self.pair,
+            operation=operation,
+            type=LIMIT,
+            price=price,
+            quantity=self.quantity(),
+        )
+        self.create_order(order)
+        self.processor.place_order(serializers.serialize('json', [order]))
+
+    def run_limit(self, operation, user, cross):
+        price = self.crossing_price(operation) if self.random.random() < cross else self.resting_price(operation)
+        order = Order(
+            user=user,
+            pair=self.pair,
+            operation=operation,
+            type=LIMIT,
+            price=price,
+            quantity=self.quantity(),
+        )
+        self.measure('create', self.create_order, order)
+        self.measure('match', self.processor.place_order, serializers.serialize('json', [order]))
+
+    def run_market(self, operation, user, cross):
+        data = {
+            'pair': self.pair.code,
+            'operation': operation,
+            'user_id': user.id,
+        }
+        if operation == BUY:
+            data['cost'] = self.quantity() * self.mid_price
+        else:
+            data['quantity'] = self.quantity()
+        self.measure('market', self.processor.market_order, data)
+
+    def run_exchange(self, operation, user, cross):
+        # strict pair exchange has no cost, buys go as exchange of quote currency like for reversed pair
+        strict_pair = operation == SELL
+        self.measure('exchange', self.processor.exchange_order, {
+            'pair': self.pair,
+            'operation': operation,
+            'user_id': user.id,
+            'strict_pair': strict_pair,
+            'quantity': self.quantity() if strict_pair else self.quantity() * self.mid_price,
+            'base_currency': self.pair.base,
+            'quote_currency': self.pair.quote,
+        })
+
+    def run_stop_limit(self, operation, user, cross):
+        stop = self.crossing_price(operation)
+        self.measure('stop_limit', self.processor.stop_limit_order, {
+            'pair': self.pair.code,
+            'operation': operation,
+            'user_id': user.id,
+            'price': stop,
+            'stop': stop,
+            'quantity': self.quantity(),
+        })
+
+    def report(self, orders, matches, elapsed):
+        self.stdout.write(f'Settlement: {"on" if settings.STACK_SETTLEMENT_ENABLED else "off"}')
+        self.stdout.write(f'Orders: {orders}, matches: {matches}, time: {elapsed:.2f}s')
+        self.stdout.write(f'Orders/sec: {orders / elapsed:.1f}, matches/sec: {matches / elapsed:.1f}')
+        self.stdout.write(f'{"stage":<12}{"count":>8}{"p50 ms":>10}{"p99 ms":>10}{"queries":>10}')
+        for stage, timings in self.timings.items():
+            self.stdout.write(
+                f'{stage:<12}{len(timings):>8}'
+                f'{percentile(timings, 50) * 1000:>10.2f}'
+                f'{percentile(timings, 99) * 1000:>10.2f}'
+                f'{self.queries[stage]:>10}'
+            )
+        total_queries = sum(self.queries.values())
+        if matches:
+            self.stdout.write(f'Queries per match: {total_queries / matches:.1f}')
@@ -0,0 +1,63 @@
+import datetime
+import logging
+
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+from django.utils import timezone
+
+from core.utils.partitions import PARTITIONED_TABLES
+from core.utils.partitions import convert_to_partitioned
+from core.utils.partitions import create_partitions
+from core.utils.partitions import detach_partitions
+from core.utils.partitions import is_partitioned
+
+log = logging.getLogger(__name__)
+
+
+def parse_day(value):
+    return datetime.datetime.strptime(value, '%Y-%m-%d').replace(tzinfo=timezone.utc)
+
+
+class Command(BaseCommand):
+    help = (
+        'Converts tables to monthly partitions, creates future partitions, detaches old ones. '
+        'Conversion drops foreign keys referencing converted tables and extends unique constraints '
+        'with partition key, it is not reflected in migrations'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('action', choices=['convert', 'create', 'detach'])
+        parser.add_argument('--tables', type=str, help='comma separated tables, all partitioned ones by default')
+        parser.add_argument('--months', type=int, help='partitions to create ahead')
+        parser.add_argument('--before', type=parse_day, help='detach partitions older than day, YYYY-MM-DD')
+        parser.add_argument('--drop', action='store_true', help='drop detached partitions instead of archiving')
+
+    def handle(self, *args, **options):
+        tables = list(PARTITIONED_TABLES)
+        if options['tables']:
+            tables = [i.strip() for i in options['tables'].split(',')]
+            unknown = set(tables) - set(PARTITIONED_TABLES)
+            if unknown:
+                raise CommandError(f'Unknown tables: {", ".join(unknown)}')
+
+        if options['action'] == 'detach' and not options['before']:
+            raise CommandError('--before is required to detach partitions')
+
+        for table in tables:
+            partitioned = is_partitioned(table)
+            if options['action'] == 'convert':
+                if partitioned:
+                    log.info('%s: already partitioned', table)
+                    continue
+                convert_to_partitioned(table, PARTITIONED_TABLES[table])
+                continue
+
+            if not partitioned:
+                log.info('%s: not partitioned, skip', table)
+                continue
+
+            if options['action'] == 'create':
+                create_partitions(table, options['months'])
+            else:
+                detached = detach_partitions(table, options['before'], drop=options['drop'])
+                log.info('%s: %s partitions detached', table, len(detached))
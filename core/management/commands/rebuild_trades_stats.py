@@ -0,0 +1,86 @@
+import datetime
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import Q
+from django.db.transaction import atomic
+from django.utils import timezone
+
+from core.cache import chart_cache
+from core.models.inouts.pair import Pair
+from core.models.stats import TradesAggregatedStats
+from core.models.stats import TradesAggregationWatermark
+from core.utils.stats.trades_aggregate import TradesAggregator
+
+log = logging.getLogger(__name__)
+
+
+def parse_day(value):
+    return datetime.datetime.strptime(value, '%Y-%m-%d').replace(tzinfo=timezone.utc)
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds trades aggregated stats of a date range in parallel day chunks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', required=True, type=parse_day, help='first day, YYYY-MM-DD')
+        parser.add_argument('--stop', type=parse_day, help='day after the last one, YYYY-MM-DD, today by default')
+        parser.add_argument('--pairs', type=str, help='comma separated pairs, all by default')
+        parser.add_argument('--chunk-days', default=1, type=int)
+        parser.add_argument('--workers', default=4, type=int)
+
+    def handle(self, *args, **options):
+        start = options['start']
+        stop = options['stop'] or TradesAggregator.trunc(timezone.now(), 'day')
+        step = datetime.timedelta(days=options['chunk_days'])
+
+        if options['pairs']:
+            pairs = [Pair.get(i.strip()) for i in options['pairs'].split(',')]
+        else:
+            pairs = list(Pair.objects.all())
+
+        chunks = []
+        chunk_start = start
+        while chunk_start < stop:
+            chunks.append((chunk_start, min(chunk_start + step, stop)))
+            chunk_start += step
+
+        with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+            for pair in pairs:
+                # rollups need all source candles of the range
+                for period in TradesAggregator.PERIODS:
+                    log.info('%s %s: %s chunks', pair.code, period, len(chunks))
+                    list(executor.map(lambda chunk: self.rebuild(pair, period, *chunk), chunks))
+                    self.move_watermark(pair, period, start, stop)
+
+        # cached closed candles could be rebuilt
+        chart_cache.delete_pattern('*')
+
+    def rebuild(self, pair, period, start, stop):
+        try:
+            with atomic():
+                TradesAggregator(pair, period).rebuild(start, stop)
+            log.info('%s %s: %s - %s done', pair.code, period, start, stop)
+        finally:
+            # every worker thread has its own connection
+            connection.close()
+
+    def move_watermark(self, pair, period, start, stop):
+        """
+        Regular aggregation continues after the rebuilt range.
+        Watermark before the range is kept, otherwise the gap before start would be never aggregated
+        """
+        watermark, _ = TradesAggregationWatermark.objects.get_or_create(
+            pair=pair,
+            period=TradesAggregatedStats.PERIODS[period],
+        )
+        moved = TradesAggregationWatermark.objects.filter(
+            Q(ts__isnull=True) | Q(ts__gte=start, ts__lt=stop),
+            id=watermark.id,
+        ).update(ts=stop)
+        if not moved:
+            watermark.refresh_from_db()
+            if watermark.ts < start:
+                log.warning('%s %s: watermark %s is before rebuilt range, not moved', pair.code, period, watermark.ts)
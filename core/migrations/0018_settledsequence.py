@@ -0,0 +1,24 @@
+# Generated by Django 3.2.23 on 2026-10-17 10:12
+
+from django.db import migrations, models
+import django.db.models.deletion
+import core.models.inouts.pair
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0017_new_pair_params'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SettledSequence',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('seq', models.BigIntegerField(default=0)),
+                ('updated', models.DateTimeField(auto_now=True)),
+                ('pair', core.models.inouts.pair.PairModelField(on_delete=django.db.models.deletion.CASCADE, to='core.pair', unique=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 3.2.23 on 2026-10-17 14:40
+
+from django.db import migrations, models
+import django.db.models.deletion
+import core.models.inouts.pair
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0018_settledsequence'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TradesAggregationWatermark',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.PositiveSmallIntegerField(choices=[(1, 'minute'), (2, 'hour'), (3, 'day')])),
+                ('ts', models.DateTimeField(null=True)),
+                ('updated', models.DateTimeField(auto_now=True)),
+                ('pair', core.models.inouts.pair.PairModelField(on_delete=django.db.models.deletion.CASCADE, to='core.pair')),
+            ],
+            options={
+                'unique_together': {('pair', 'period')},
+            },
+        ),
+    ]
@@ -30,9 +30,11 @@ from core.models.orders import Order
 from core.models.orders import OrderChangeHistory
 from core.models.orders import OrderRevert
 from core.models.orders import OrderStateChangeHistory
+from core.models.orders import SettledSequence
 from core.models.settings import Settings
 from core.models.stats import ExternalPricesHistory
 from core.models.stats import TradesAggregatedStats
+from core.models.stats import TradesAggregationWatermark
 from core.models.stats import UserPairDailyStat
 from core.models.wallet_history import WalletHistoryItem
 
@@ -69,8 +71,10 @@ __all__ = [
     'OrderChangeHistory',
     'OrderRevert',
     'OrderStateChangeHistory',
+    'SettledSequence',
     'ExternalPricesHistory',
     'TradesAggregatedStats',
+    'TradesAggregationWatermark',
     'UserPairDailyStat',
     'WalletHistoryItem',
     'Settings',
@@ -55,6 +55,19 @@ class Balance(UserMixinModel):
 
         return result
 
+    @classmethod
+    def for_users(cls, user_ids):
+        """ balances of several users with one query: {user_id: for_user() result} """
+        result = {
+            user_id: {i.code: {'actual': 0, 'orders': 0} for i in ALL_CURRENCIES}
+            for user_id in user_ids
+        }
+
+        for i in cls.objects.filter(user_id__in=user_ids).only('user_id', 'currency', 'amount', 'amount_in_orders'):
+            result[i.user_id][i.currency.code] = {'actual': i.amount, 'orders': i.amount_in_orders}
+
+        return result
+
     @classmethod
     def portfolio_for_user(cls, user, currency_code='USDT'):
         pairs_data = get_filtered_pairs_24h_stats()
@@ -1,7 +1,9 @@
-from datetime import datetime
+from collections import defaultdict
 
+from django.conf import settings
 from django.db import models
-from django.db.models import Sum, Q
+from django.db.models import Max, Min, Sum, Q
+from django.utils import timezone
 
 from core.consts.dif_balance import TYPES, TYPE_BALANCE
 from core.currency import CurrencyModelField
@@ -51,51 +53,106 @@ class DifBalanceAbstract(UserMixinModel):
         )
 
     @classmethod
-    def process(cls):
-        current_time = datetime.now()
+    def process(cls, start_user_id=None, stop_user_id=None, current_time=None):
+        """
+        Saves balance differences of users in [start_user_id, stop_user_id) range, all users by default.
+        Users are processed in batches with a few grouped queries per batch
+        """
+        current_time = current_time or timezone.now()
         balances = Balance.objects.all()
-        for balance in balances:
-            curr_balance = balance.amount
-            old_balance: cls = cls.objects.filter(
-                user=balance.user,
-                currency=balance.currency,
-                type=TYPE_BALANCE
-            ).last()
+        if start_user_id is not None:
+            balances = balances.filter(user_id__gte=start_user_id)
+        if stop_user_id is not None:
+            balances = balances.filter(user_id__lt=stop_user_id)
+
+        user_ids = balances.aggregate(start=Min('user_id'), stop=Max('user_id'))
+        if user_ids['start'] is None:
+            return
+
+        for batch_start in range(user_ids['start'], user_ids['stop'] + 1, settings.DIF_BALANCE_BATCH_SIZE):
+            batch = balances.filter(
+                user_id__gte=batch_start,
+                user_id__lt=batch_start + settings.DIF_BALANCE_BATCH_SIZE,
+            )
+            difs = cls.process_batch(list(batch.values_list('user_id', 'currency', 'amount')), current_time)
+            with suppress_autotime(cls, ['created']):
+                cls.objects.bulk_create(difs)
+
+    @classmethod
+    def process_batch(cls, balances, current_time):
+        user_ids = {user_id for user_id, _, _ in balances}
+
+        # the latest snapshot of every balance
+        old_balances = {
+            (i.user_id, i.currency): i for i in cls.objects.filter(
+                user_id__in=user_ids,
+                type=TYPE_BALANCE,
+            ).order_by('user_id', 'currency', '-id').distinct('user_id', 'currency')
+        }
+
+        def group_sums(qs):
+            return {
+                (i['user_id'], i['currency']): i['sum'] for i in qs.values(
+                    'user_id', 'currency'
+                ).annotate(sum=Sum('amount')).order_by()
+            }
+
+        # snapshots are usually made at once, so only one or two distinct periods per batch
+        periods = defaultdict(set)
+        for (user_id, _), old_balance in old_balances.items():
+            periods[old_balance.created].add(user_id)
+
+        sums = {}
+        cancelled_sums = {}
+        for since, period_user_ids in periods.items():
+            period_sums = group_sums(Transaction.objects.filter(
+                (
+                    Q(created__lte=current_time) &
+                    Q(created__gt=since) &
+                    Q(state__in=[TRANSACTION_COMPLETED, TRANSACTION_PENDING])
+                ),
+                user_id__in=period_user_ids,
+            ))
+            # skip created/pending and then cancelled/failed txs in same period
+            period_cancelled_sums = group_sums(Transaction.objects.filter(
+                (
+                    Q(updated__lte=current_time) &
+                    Q(updated__gt=since) &
+                    Q(state__in=[TRANSACTION_CANCELED, TRANSACTION_FAILED])
+                ),
+                ~Q(
+                    Q(created__lte=current_time) &
+                    Q(created__gt=since) &
+                    Q(state__in=[TRANSACTION_CANCELED, TRANSACTION_FAILED]),
+                ),
+                user_id__in=period_user_ids,
+            ))
+            for key, old_balance in old_balances.items():
+                if old_balance.created == since:
+                    sums[key] = period_sums.get(key) or 0
+                    cancelled_sums[key] = period_cancelled_sums.get(key) or 0
+
+        new_user_ids = {user_id for user_id, currency, _ in balances if (user_id, currency) not in old_balances}
+        if new_user_ids:
+            total_sums = group_sums(Transaction.objects.filter(
+                user_id__in=new_user_ids,
+                created__lte=current_time  # get transaction only before start process
+            ))
+
+        difs = []
+        for user_id, currency, curr_balance in balances:
+            key = (user_id, currency)
+            old_balance = old_balances.get(key)
 
             if old_balance:
-                sum_amount = Transaction.objects.filter(
-                    (
-                        Q(created__lte=current_time) &
-                        Q(created__gt=old_balance.created) &
-                        Q(state__in=[TRANSACTION_COMPLETED, TRANSACTION_PENDING])
-                    ),
-                    user=balance.user,
-                    currency=balance.currency,
-                ).aggregate(sum=Sum('amount'))['sum'] or 0
-
-                # skip created/pending and then cancelled/failed txs in same period
-                cancelled_amount = Transaction.objects.filter(
-                    (
-                        Q(updated__lte=current_time) &
-                        Q(updated__gt=old_balance.created) &
-                        Q(state__in=[TRANSACTION_CANCELED, TRANSACTION_FAILED])
-                    ),
-                    ~Q(
-                        Q(created__lte=current_time) &
-                        Q(created__gt=old_balance.created) &
-                        Q(state__in=[TRANSACTION_CANCELED, TRANSACTION_FAILED]),
-                    ),
-                    user=balance.user,
-                    currency=balance.currency,
-                ).aggregate(sum=Sum('amount'))['sum'] or 0
-
-                calculated_balance = old_balance.balance + sum_amount - cancelled_amount
+                sum_amount = sums[key]
+                calculated_balance = old_balance.balance + sum_amount - cancelled_sums[key]
                 diff = curr_balance - calculated_balance
                 diff_percent = diff / curr_balance if curr_balance else 0
 
                 dif = cls(
-                    user=balance.user,
-                    currency=balance.currency,
+                    user_id=user_id,
+                    currency=currency,
                     diff=diff,
                     diff_percent=diff_percent,
                     balance=curr_balance,
@@ -104,22 +161,15 @@ class DifBalanceAbstract(UserMixinModel):
                     calc_balance=calculated_balance,
                     sum_diff=old_balance.sum_diff + diff
                 )
-                with suppress_autotime(dif, ['created']):
-                    dif.created = current_time
-                    dif.save()
             else:
-                sum_amount = Transaction.objects.filter(
-                    user=balance.user,
-                    currency=balance.currency,
-                    created__lte=current_time  # get transaction only before start process
-                ).aggregate(sum=Sum('amount'))['sum'] or 0
+                sum_amount = total_sums.get(key) or 0
 
                 diff = curr_balance - sum_amount
                 diff_percent = diff / curr_balance if curr_balance else 0
 
                 dif = cls(
-                    user=balance.user,
-                    currency=balance.currency,
+                    user_id=user_id,
+                    currency=currency,
                     diff=curr_balance - sum_amount,
                     diff_percent=diff_percent,
                     balance=curr_balance,
@@ -128,9 +178,9 @@ class DifBalanceAbstract(UserMixinModel):
                     calc_balance=sum_amount,
                     sum_diff=0
                 )
-                with suppress_autotime(dif, ['created']):
-                    dif.created = current_time
-                    dif.save()
+            dif.created = current_time
+            difs.append(dif)
+        return difs
 
 
 class DifBalance(DifBalanceAbstract):
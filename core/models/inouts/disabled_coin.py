@@ -1,6 +1,6 @@
-from django.core.cache import cache
 from django.db import models
 
+from core.cache import LocalSettingsCache
 from core.consts.inouts import DISABLE_ALL
 from core.consts.inouts import DISABLE_COIN_STATES
 from core.consts.inouts import DISABLE_EXCHANGE
@@ -13,6 +13,8 @@ from core.currency import CurrencyModelField
 
 DISABLED_COINS_CACHE_KEY = 'disabled_coins_cache'
 
+disabled_coins_cache = LocalSettingsCache(DISABLED_COINS_CACHE_KEY)
+
 
 class DisabledCoin(models.Model):
     DISABLE_ALL = DISABLE_ALL
@@ -53,18 +55,22 @@ class DisabledCoin(models.Model):
 
     @classmethod
     def _cache_data(cls, set_cache=False):
-        data = cache.get(DISABLED_COINS_CACHE_KEY, {})
-        if set_cache or not data:
-            for coin in cls.objects.all():
-                data[coin.currency.code] = {
-                    DISABLE_TOPUPS: coin.disable_topups,
-                    DISABLE_WITHDRAWALS: coin.disable_withdrawals,
-                    DISABLE_EXCHANGE: coin.disable_exchange,
-                    DISABLE_PAIRS: coin.disable_pairs,
-                    DISABLE_STACK: coin.disable_stack,
-                    DISABLE_ALL: coin.disable_all,
-                }
-            cache.set(DISABLED_COINS_CACHE_KEY, data)
+        if set_cache:
+            return disabled_coins_cache.refresh(cls._load_data)
+        return disabled_coins_cache.get(cls._load_data)
+
+    @classmethod
+    def _load_data(cls):
+        data = {}
+        for coin in cls.objects.all():
+            data[coin.currency.code] = {
+                DISABLE_TOPUPS: coin.disable_topups,
+                DISABLE_WITHDRAWALS: coin.disable_withdrawals,
+                DISABLE_EXCHANGE: coin.disable_exchange,
+                DISABLE_PAIRS: coin.disable_pairs,
+                DISABLE_STACK: coin.disable_stack,
+                DISABLE_ALL: coin.disable_all,
+            }
         return data
 
     @classmethod
@@ -1,11 +1,13 @@
-from django.core.cache import cache
 from django.db import models
 from lib.helpers import to_decimal
 
+from core.cache import LocalSettingsCache
 from core.currency import CurrencyModelField, Currency
 
 FEES_AND_LIMITS_CACHE_KEY = 'fees_and_limits_cache'
 
+fees_and_limits_cache = LocalSettingsCache(FEES_AND_LIMITS_CACHE_KEY)
+
 
 class FeesAndLimits(models.Model):
 
@@ -64,51 +66,55 @@ class FeesAndLimits(models.Model):
 
     @classmethod
     def _cache_data(cls, set_cache=False):
-        data = cache.get(FEES_AND_LIMITS_CACHE_KEY, {})
-        if set_cache or not data:
-            for entry in cls.objects.all():
-                data[entry.currency.code] = {
-                    'limits': {
-                        cls.DEPOSIT: {
-                            cls.MIN_VALUE: entry.limits_deposit_min,
-                            cls.MAX_VALUE: entry.limits_deposit_max
-                        },
-                        cls.WITHDRAWAL: {
-                            cls.MIN_VALUE: entry.limits_withdrawal_min,
-                            cls.MAX_VALUE: entry.limits_withdrawal_max
-                        },
-                        cls.ORDER: {
-                            cls.MIN_VALUE: entry.limits_order_min,
-                            cls.MAX_VALUE: entry.limits_order_max
-                        },
-                        cls.CODE: {
-                            cls.MAX_VALUE: entry.limits_code_max
-                        },
-                        cls.ACCUMULATION: {
-                            cls.MIN_VALUE: entry.limits_accumulation_min,
-                            cls.KEEPER: entry.limits_keeper_accumulation_balance,
-                            cls.MAX_GAS_PRICE: entry.limits_accumulation_max_gas_price,
-                        }
+        if set_cache:
+            return fees_and_limits_cache.refresh(cls._load_data)
+        return fees_and_limits_cache.get(cls._load_data)
+
+    @classmethod
+    def _load_data(cls):
+        data = {}
+        for entry in cls.objects.all():
+            data[entry.currency.code] = {
+                'limits': {
+                    cls.DEPOSIT: {
+                        cls.MIN_VALUE: entry.limits_deposit_min,
+                        cls.MAX_VALUE: entry.limits_deposit_max
+                    },
+                    cls.WITHDRAWAL: {
+                        cls.MIN_VALUE: entry.limits_withdrawal_min,
+                        cls.MAX_VALUE: entry.limits_withdrawal_max
+                    },
+                    cls.ORDER: {
+                        cls.MIN_VALUE: entry.limits_order_min,
+                        cls.MAX_VALUE: entry.limits_order_max
+                    },
+                    cls.CODE: {
+                        cls.MAX_VALUE: entry.limits_code_max
+                    },
+                    cls.ACCUMULATION: {
+                        cls.MIN_VALUE: entry.limits_accumulation_min,
+                        cls.KEEPER: entry.limits_keeper_accumulation_balance,
+                        cls.MAX_GAS_PRICE: entry.limits_accumulation_max_gas_price,
+                    }
+                },
+                'fee': {
+                    cls.DEPOSIT: {
+                        cls.ADDRESS: entry.fee_deposit_address,
+                        cls.CODE: entry.fee_deposit_code
+                    },
+                    cls.WITHDRAWAL: {
+                        cls.ADDRESS: WithdrawalFee.get_blockchains_by_currency(entry.currency),
+                        cls.CODE: entry.fee_withdrawal_code
+                    },
+                    cls.ORDER: {
+                        cls.LIMIT_ORDER: entry.fee_order_limits,
+                        cls.MARKET_ORDER: entry.fee_order_market
                     },
-                    'fee': {
-                        cls.DEPOSIT: {
-                            cls.ADDRESS: entry.fee_deposit_address,
-                            cls.CODE: entry.fee_deposit_code
-                        },
-                        cls.WITHDRAWAL: {
-                            cls.ADDRESS: WithdrawalFee.get_blockchains_by_currency(entry.currency),
-                            cls.CODE: entry.fee_withdrawal_code
-                        },
-                        cls.ORDER: {
-                            cls.LIMIT_ORDER: entry.fee_order_limits,
-                            cls.MARKET_ORDER: entry.fee_order_market
-                        },
-                        cls.EXCHANGE: {
-                            cls.VALUE: entry.fee_exchange_value
-                        }
+                    cls.EXCHANGE: {
+                        cls.VALUE: entry.fee_exchange_value
                     }
                 }
-            cache.set(FEES_AND_LIMITS_CACHE_KEY, data)
+            }
         return data
 
     @classmethod
@@ -1,7 +1,11 @@
 from rest_framework.fields import Field
 
+import copy
 import decimal
+import threading
+import time
 
+from django.core.cache import cache
 from django.db import models
 from django.db.models import UniqueConstraint
 
@@ -15,6 +19,9 @@ PAIRS_LIST = [
     (BNB_USDT, 'BNB-USDT'),
 ]
 
+PAIRS_REGISTRY_VERSION_KEY = 'pairs_registry_version'
+
+
 class PairNotFound(CurrencyNotFound):
     default_detail = 'pair not found'
 
@@ -24,6 +31,14 @@ class Pair(models.Model):
     base = CurrencyModelField()
     quote = CurrencyModelField()
 
+    # process-local registry like Currency has, reloaded when pairs version in cache is changed
+    REGISTRY_CHECK_PERIOD = 5  # in seconds
+    _by_id = {}
+    _by_code = {}
+    _registry_version = None
+    _registry_checked = 0
+    _registry_lock = threading.Lock()
+
     @property
     def code(self):
         return f'{self.base}-{self.quote}'
@@ -41,21 +56,61 @@ class Pair(models.Model):
         if isinstance(obj, cls):
             return obj
 
-        try:
-            if isinstance(obj, str):
-                if obj.isdigit():
-                    return cls.objects.get(id=int(obj))
-                else:
-                    base, quote = obj.upper().split('-')
-                    return cls.objects.get(base=base, quote=quote)
-
-            if isinstance(obj, (int, decimal.Decimal)):
-                return cls.objects.get(id=int(obj))
-        except Pair.DoesNotExist:
-            raise PairNotFound()
+        if isinstance(obj, str):
+            if obj.isdigit():
+                return cls._get_by_id(obj)
+            else:
+                return cls._get_by_code(obj)
+
+        if isinstance(obj, (int, decimal.Decimal)):
+            return cls._get_by_id(obj)
 
         raise PairNotFound()
 
+    @classmethod
+    def _from_registry(cls, index, key):
+        cls.check_registry()
+        pair = getattr(cls, index).get(key)
+        if pair is None:
+            # pair could be added after last check
+            if time.monotonic() - cls._registry_checked > 1:
+                cls.load_registry()
+                pair = getattr(cls, index).get(key)
+            if pair is None:
+                raise PairNotFound()
+        # registry instances are shared by the process, callers get their own copy
+        return copy.copy(pair)
+
+    @classmethod
+    def check_registry(cls):
+        now = time.monotonic()
+        if cls._registry_version is not None and now - cls._registry_checked < cls.REGISTRY_CHECK_PERIOD:
+            return
+
+        cls._registry_checked = now
+        cache.add(PAIRS_REGISTRY_VERSION_KEY, 1, timeout=None)
+        if cache.get(PAIRS_REGISTRY_VERSION_KEY) != cls._registry_version:
+            cls.load_registry()
+
+    @classmethod
+    def load_registry(cls):
+        with cls._registry_lock:
+            version = cache.get(PAIRS_REGISTRY_VERSION_KEY)
+            pairs = list(cls.objects.all())
+            cls._by_id = {i.id: i for i in pairs}
+            cls._by_code = {i.code.upper(): i for i in pairs}
+            cls._registry_version = version
+            cls._registry_checked = time.monotonic()
+
+    @classmethod
+    def invalidate_registry(cls):
+        """
+        Makes all processes reload pairs
+        """
+        cache.add(PAIRS_REGISTRY_VERSION_KEY, 1, timeout=None)
+        cache.incr(PAIRS_REGISTRY_VERSION_KEY)
+        cls._registry_version = None
+
     @classmethod
     def exists(cls, obj):
         try:
@@ -64,19 +119,13 @@ class Pair(models.Model):
         except:
             return False
 
-    def _get_by_code(self, code):
-        base, quote = code.upper().split('-')
-        try:
-            return self.objects.get(base=base, quote=quote)
-        except Pair.DoesNotExist:
-            raise PairNotFound()
+    @classmethod
+    def _get_by_code(cls, code):
+        return cls._from_registry('_by_code', code.upper())
 
-    def _get_by_id(self, _id):
-        _id = int(_id)
-        try:
-            return self.objects.get(id=id)
-        except Pair.DoesNotExist:
-            raise PairNotFound()
+    @classmethod
+    def _get_by_id(cls, _id):
+        return cls._from_registry('_by_id', int(_id))
 
     def __str__(self):
         return self.code
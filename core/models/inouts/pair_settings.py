@@ -1,14 +1,17 @@
 from typing import Dict
 
-from django.core.cache import cache
 from django.db import models
 
+from core.cache import LocalSettingsCache
+
 from core.models.inouts.pair import Pair, PairModelField
 from lib.fields import MoneyField
 from django.contrib.postgres.fields import ArrayField
 
 PAIRS_SETTINGS_CACHE_KEY = 'pairs_settings_cache'
 
+pairs_settings_cache = LocalSettingsCache(PAIRS_SETTINGS_CACHE_KEY)
+
 
 class PairSettings(models.Model):
 
@@ -37,22 +40,26 @@ class PairSettings(models.Model):
 
     @classmethod
     def _cache_data(cls, set_cache=False) -> Dict[str, dict]:
-        data = cache.get(PAIRS_SETTINGS_CACHE_KEY, {})
-        if set_cache or not data:
-            for entry in cls.objects.all():
-                data[entry.pair.code] = {
-                    'is_enabled': entry.is_enabled,
-                    'is_autoorders_enabled': entry.is_autoorders_enabled,
-                    'price_source': entry.price_source,
-                    'custom_price': entry.custom_price,
-                    'deviation': entry.deviation,
-                    'enable_alerts': entry.enable_alerts,
-                    'precisions': entry.precisions,
-                    'min_order_size': entry.min_order_size,
-                    'min_base_amount_increment': entry.min_base_amount_increment,
-                    'min_price_increment': entry.min_price_increment,
-                }
-            cache.set(PAIRS_SETTINGS_CACHE_KEY, data)
+        if set_cache:
+            return pairs_settings_cache.refresh(cls._load_data)
+        return pairs_settings_cache.get(cls._load_data)
+
+    @classmethod
+    def _load_data(cls) -> Dict[str, dict]:
+        data = {}
+        for entry in cls.objects.select_related('pair'):
+            data[entry.pair.code] = {
+                'is_enabled': entry.is_enabled,
+                'is_autoorders_enabled': entry.is_autoorders_enabled,
+                'price_source': entry.price_source,
+                'custom_price': entry.custom_price,
+                'deviation': entry.deviation,
+                'enable_alerts': entry.enable_alerts,
+                'precisions': entry.precisions,
+                'min_order_size': entry.min_order_size,
+                'min_base_amount_increment': entry.min_base_amount_increment,
+                'min_price_increment': entry.min_price_increment,
+            }
         return data
 
     @classmethod
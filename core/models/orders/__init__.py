@@ -1,4 +1,5 @@
 import logging
+from collections import defaultdict
 from decimal import Decimal
 
 from django.conf import settings
@@ -50,6 +51,7 @@ from core.models.inouts.transaction import REASON_ORDER_OPENED
 from core.models.inouts.transaction import TRANSACTION_COMPLETED
 from core.models.inouts.transaction import Transaction
 from core.models.inouts.pair import Pair, PairModelField
+from core.orderbook.structs import FillSide
 from core.signals.orders import order_changed
 from core.utils.inouts import is_coin_disabled
 from core.utils.limits import OrderLimitChecker
@@ -160,18 +162,31 @@ class Order(UserMixinModel, BaseModel):
 
         return super(Order, self).save(*args, **kwargs)
 
-    def get_balance_in_order(self):
+    def get_hold_amount(self, quantity):
+        """
+        Part of amount_in_orders held by the order for given quantity.
+        Market and exchange orders are not counted in amount_in_orders
+        """
+        if self.type in [MARKET, EXCHANGE, ]:
+            return to_decimal(0)
         if self.operation == SELL:
-            currency = self.pair.base
-        else:
-            currency = self.pair.quote
+            return to_decimal(quantity)
+        return to_decimal(to_decimal(quantity) * to_decimal(self.price))
 
-        pair_sum = self.user.order_set.filter(
-            state=self.STATE_OPENED,
+    @classmethod
+    def get_balances_in_orders(cls, user_ids):
+        """
+        Holds of opened orders for several users at once: {(user_id, currency_id): amount}
+        """
+        pair_sum = cls.objects.filter(
+            user_id__in=user_ids,
+            state=cls.STATE_OPENED,
         ).exclude(
             type__in=[Order.ORDER_TYPE_EXCHANGE, Order.ORDER_TYPE_MARKET]
         ).values(
-            'pair'
+            'user_id',
+            'pair__base',
+            'pair__quote',
         ).annotate(
             q_left=Sum(
                 Case(
@@ -195,16 +210,12 @@ class Order(UserMixinModel, BaseModel):
             ),
         )
 
-        amount = to_decimal(0)
-
+        result = defaultdict(lambda: to_decimal(0))
         for item in pair_sum:
-            pair = Pair.get(item['pair'])
-            if pair.base == currency:
-                amount += to_decimal(item['q_left'] or 0)
-            if pair.quote == currency:
-                amount += to_decimal(item['sum'] or 0)
+            result[(item['user_id'], item['pair__base'].id)] += to_decimal(item['q_left'] or 0)
+            result[(item['user_id'], item['pair__quote'].id)] += to_decimal(item['sum'] or 0)
 
-        return to_decimal(amount)
+        return result
 
     def create_order(self, *args, **kwargs):
         if self.is_pair_disabled():
@@ -251,7 +262,7 @@ class Order(UserMixinModel, BaseModel):
             self.in_transaction = t
             super(Order, self).save(*args, **kwargs)
 
-            BalanceManager.set_hold(self.user_id, currency, amount, self.get_balance_in_order())
+            BalanceManager.set_hold(self.user_id, currency, amount, self.get_hold_amount(self.quantity))
 
             special_data = {
                 'limit': self.otc_limit,
@@ -664,11 +675,9 @@ class Order(UserMixinModel, BaseModel):
                 t.save(update_balance_on_adding=False, atomic=False)
 
                 if reason == REASON_ORDER_EXTRA_CHARGE:
-                    BalanceManager.set_hold(self.user_id, currency, amount,
-                                            self.get_balance_in_order())
+                    BalanceManager.set_hold(self.user_id, currency, amount)
                 else:
-                    BalanceManager.free_hold(self.user_id, currency, amount,
-                                             self.get_balance_in_order())
+                    BalanceManager.free_hold(self.user_id, currency, amount)
             if not is_external:
                 self.add_to_order_change_history(price, quantity, special_data)
 
@@ -699,7 +708,7 @@ class Order(UserMixinModel, BaseModel):
                     self.user_id,
                     r.transaction.currency,
                     r.transaction.amount,
-                    self.get_balance_in_order()
+                    self.get_hold_amount(self.quantity_left),
                 )
 
             order_changed.send(sender=self.__class__, order=self)
@@ -767,10 +776,7 @@ class Order(UserMixinModel, BaseModel):
         if self.type == self.ORDER_TYPE_LIMIT:
             last_pair_price_cache.set(self.pair, self.price)
 
-    def _execute(self, matched, quantity, price):
-        quantity = to_decimal(quantity)
-        price = to_decimal(price)
-
+    def _apply_execution(self, quantity, price):
         if self.type in [MARKET, EXCHANGE, ]:
             if self.operation == BUY:
                 self.cost -= to_decimal(price * quantity)
@@ -784,6 +790,33 @@ class Order(UserMixinModel, BaseModel):
 
         self.quantity_left = to_decimal(self.quantity_left)
 
+    def _update_execution_state(self):
+        self.executed = True
+        if (self.type in [MARKET, EXCHANGE, ] and self.cost == to_decimal(0)) or \
+                (to_decimal(self.quantity_left) == to_decimal(0)):
+            self.state = ORDER_CLOSED
+
+        # todo: findout reason
+        if to_decimal(self.quantity_left) == 0:
+            self.state = ORDER_CLOSED
+
+    def _execute(self, matched, quantity, price):
+        quantity = to_decimal(quantity)
+        price = to_decimal(price)
+
+        if not self.can_execute_in_memory(quantity, price):
+            # something goes wrong, nothing is applied yet:
+            # cancel releases the whole hold of order including this match quantity
+            log.error("Try to cancel order #%s due execution error", self.id)
+
+            from core.tasks.orders import cancel_order
+            cancel_order.apply([{
+                'order_id': self.id,
+            }])
+            return
+
+        self._apply_execution(quantity, price)
+
         r = ExecutionResult(order=self,
                             user_id=self.user_id,  # ?
                             price=price,
@@ -803,49 +836,79 @@ class Order(UserMixinModel, BaseModel):
                     self.user_id,
                     self.pair.quote,
                     r.cacheback_transaction.amount,
-                    self.get_balance_in_order()
+                    0,
                 )
 
         r.transaction = self.transaction(REASON_ORDER_EXECUTED, quantity, price)
         amount = self.get_executed_amount(quantity, price)
         r.fee_amount = self.calculate_fee_amount(amount)
-        # try:
-
-        if r.transaction is None:
-            # something goes wrong
-            log.error("Try to cancel order #%s due execution error", self.id)
-
-            from core.tasks.orders import cancel_order
-            cancel_order.apply([{
-                'order_id': self.id,
-            }])
-            return
-
-        # except Exception:
-        #     log.exception('Unknown error')
-        #     return
 
         r.save()
 
-        self.executed = True
-        if (self.type in [MARKET, EXCHANGE, ] and self.cost == to_decimal(0)) or \
-                (to_decimal(self.quantity_left) == to_decimal(0)):
-            self.state = ORDER_CLOSED
-
-        # todo: findout reason
-        if to_decimal(self.quantity_left) == 0:
-            self.state = ORDER_CLOSED
-
+        self._update_execution_state()
         self.save()
 
         if self.operation == Order.OPERATION_SELL:
-            BalanceManager.spend_hold(self.user_id, self.pair.base, self.get_balance_in_order())
+            BalanceManager.spend_hold(self.user_id, self.pair.base, self.get_hold_amount(quantity))
         else:
-            BalanceManager.spend_hold(self.user_id, self.pair.quote, self.get_balance_in_order())
+            BalanceManager.spend_hold(self.user_id, self.pair.quote, self.get_hold_amount(quantity))
 
         BalanceManager.increase_amount(self.user_id, r.transaction.currency, r.transaction.amount)
         self.notify(is_executed=True, matched_amount=amount)
 
+    def can_execute_in_memory(self, quantity, price):
+        """
+        Zero executed amount cancels order in _execute, such matches are not settled in memory
+        """
+        amount = self.get_executed_amount(to_decimal(quantity), to_decimal(price))
+        return to_decimal(amount - self.calculate_fee_amount(amount)) != 0
+
+    def execute_in_memory(self, matched, quantity, price) -> FillSide:
+        """
+        Applies match to order without database writes.
+        Returns data to be persisted by stack worker settlement
+        """
+        quantity = to_decimal(quantity)
+        price = to_decimal(price)
+        prev_state = self.state
+
+        cacheback_amount = None
+        if self.operation == BUY and self.type not in [MARKET, EXCHANGE, ]:
+            cacheback_amount = to_decimal((self.price - price) * quantity) or None
+
+        amount = self.get_executed_amount(quantity, price)
+        fee_amount = self.calculate_fee_amount(amount)
+        hold_amount = self.get_hold_amount(quantity)
+
+        self._apply_execution(quantity, price)
+        self._update_execution_state()
+
+        return FillSide(
+            order_id=self.id,
+            user_id=self.user_id,
+            pair_id=self.pair_id,
+            operation=self.operation,
+            type=self.type,
+            matched_order_id=matched.id,
+            matched_order_price=to_decimal(matched.price or 1),
+            price=price,
+            quantity=quantity,
+            fee_rate=to_decimal(self.get_fee()),
+            fee_amount=fee_amount,
+            executed_currency=(self.pair.base if self.operation == BUY else self.pair.quote).id,
+            executed_amount=to_decimal(amount - fee_amount),
+            cacheback_currency=self.pair.quote.id if cacheback_amount else None,
+            cacheback_amount=cacheback_amount,
+            hold_currency=(self.pair.base if self.operation == SELL else self.pair.quote).id,
+            hold_amount=hold_amount,
+            prev_state=prev_state,
+            state=self.state,
+            quantity_left=self.quantity_left,
+            order_quantity=self.quantity,
+            order_price=self.price,
+            cost=self.cost,
+        )
+
     def transaction(self, reason, quantity, price):
         quantity = to_decimal(quantity)
         price = to_decimal(price or 1)
@@ -1130,6 +1193,20 @@ class ExecutionResult(UserMixinModel, BaseModel):
         return to_decimal(to_decimal(self.result_amount) * to_decimal(self.fee_rate))
 
 
+class SettledSequence(models.Model):
+    """
+    Last match sequence persisted by the stack worker settlement, per pair
+    """
+    pair = PairModelField(Pair, on_delete=models.CASCADE, unique=True)
+    seq = models.BigIntegerField(default=0)
+    updated = models.DateTimeField(auto_now=True)
+
+    @classmethod
+    def get_seq(cls, pair_id):
+        entry = cls.objects.filter(pair_id=pair_id).only('seq').first()
+        return entry.seq if entry else 0
+
+
 # order signal handlers
 @receiver(order_changed)
 def update_order_vwap(sender, order: Order, **kwargs):
@@ -87,6 +87,19 @@ class TradesAggregatedStats(models.Model):
         unique_together = (['pair', 'ts', 'period'], )
 
 
+class TradesAggregationWatermark(models.Model):
+    """
+    End of the range already aggregated to TradesAggregatedStats, per pair and period
+    """
+    pair = PairModelField(Pair, on_delete=models.CASCADE)
+    period = models.PositiveSmallIntegerField(choices=[(k[1], k[0]) for k in TradesAggregatedStats.PERIODS.items()])
+    ts = models.DateTimeField(null=True)
+    updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = (['pair', 'period'], )
+
+
 class ExternalPricesHistory(models.Model):
     created = models.DateTimeField(auto_now_add=True)
     pair = PairModelField(Pair, on_delete=models.CASCADE)
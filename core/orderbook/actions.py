@@ -5,9 +5,16 @@ import simplejson
 from django.conf import settings
 from django.core.cache import cache
 
+from core.orderbook.helpers import diff_levels
+from core.orderbook.helpers import get_stack_levels
 from core.orderbook.helpers import group_by_precision
+from core.orderbook.helpers import stack_levels
+from core.orderbook.helpers import stack_levels_key
+from core.orderbook.snapshot import encode_stack
+from core.orderbook.snapshot import snapshot_key
 
 from lib.utils import threaded_daemon
+from exchange.notifications import stack_diff_notificator
 from exchange.notifications import stack_notificator
 
 
@@ -24,25 +31,36 @@ class Actions(object):
         self.stack_cache_update_enabled = True
         self.down_multiplier = 1
         self.down_send_time: Optional[float] = None
+        self.levels = {}  # {precision: {'seq': int, 'buys': {price: qty}, 'sells': {price: qty}}}
 
     def start_updater(self):
+        self.drop_legacy_cache()
         self.updater_thread = self.stack_cache_updater()
 
+    def drop_legacy_cache(self):
+        """
+        Text snapshots of previous versions are not updated anymore
+        """
+        from core.models import PairSettings
+        pair_code = self.book.pair
+        precisions = PairSettings.get_stack_precisions_by_pair(pair_code)
+        cache.delete_many([f'stack:{pair_code}'] + [f'stack:{pair_code}:{i}' for i in precisions])
+
     def set_cache(self):
         if not self.stack_cache_update_enabled:
             return
 
         data = self.book.export(settings.STACK_EXPORT_LIMIT)
         pair_code = data['pair']
-        key = f'stack:{pair_code}'
-        cache.set(key, simplejson.dumps(data), timeout=None)
+        cache.set(snapshot_key(pair_code), encode_stack(data), timeout=None)
         self.notify_stack(data)
+        self.update_levels(data)
 
         groped_by_precisions_stack_data = group_by_precision(data['pair'], data)
         for precision, grouped_data in groped_by_precisions_stack_data.items():
-            key = f'stack:{pair_code}:{precision}'
-            cache.set(key, simplejson.dumps(grouped_data), timeout=None)
+            cache.set(snapshot_key(pair_code, precision), encode_stack(grouped_data), timeout=None)
             self.notify_stack(grouped_data, precision=precision)
+            self.update_levels(grouped_data, precision=precision)
 
         self.last_cache_update = time.time()
 
@@ -75,6 +93,9 @@ class Actions(object):
             ):
                 self.send_alert(pair)
 
+            self.book.stats.publish()
+            self.book.candles.publish()
+
             if self.last_cache_update > self.last_stack_update:
                 continue
 
@@ -86,7 +107,49 @@ class Actions(object):
                 self.set_cache()
 
     def notify_stack(self, data, precision=None):
-        stack_notificator.notify(data, pair_name=self.book.pair, precision=precision)
+        if settings.STACK_SNAPSHOT_NOTIFY_ENABLED:
+            stack_notificator.notify(data, pair_name=self.book.pair, precision=precision)
+
+    def update_levels(self, data, precision=None):
+        """
+        Stores price levels snapshot and sends changed levels with the next sequence number
+        """
+        previous = self.levels.get(precision)
+        if previous is None:
+            # continue sequence of the previous worker run
+            snapshot = get_stack_levels(self.book.pair, precision)
+            previous = {
+                'seq': snapshot.get('seq', 0),
+                'buys': dict(map(tuple, snapshot.get('buys', []))),
+                'sells': dict(map(tuple, snapshot.get('sells', []))),
+            }
+
+        levels = {
+            'seq': previous['seq'],
+            'buys': stack_levels(data['buys']),
+            'sells': stack_levels(data['sells']),
+        }
+        diff = {
+            'buys': diff_levels(previous['buys'], levels['buys']),
+            'sells': diff_levels(previous['sells'], levels['sells']),
+        }
+        self.levels[precision] = levels
+        if not diff['buys'] and not diff['sells'] and previous['seq']:
+            return
+
+        levels['seq'] += 1
+        snapshot = {
+            'pair': data['pair'],
+            'precision': precision,
+            'seq': levels['seq'],
+            'buys': [[price, qty] for price, qty in levels['buys'].items()],
+            'sells': [[price, qty] for price, qty in levels['sells'].items()],
+        }
+        # snapshot goes first, so subscribers can't get diff newer than snapshot
+        cache.set(stack_levels_key(data['pair'], precision), simplejson.dumps(snapshot), timeout=None)
+
+        diff['seq'] = levels['seq']
+        stack_diff_notificator.notify(diff, pair_name=self.book.pair, precision=precision)
 
     def order_processed(self, order):
         self.last_stack_update = time.time()
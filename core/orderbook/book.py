@@ -12,10 +12,14 @@ from core.models.orders import Order
 from core.models.orders import SELL
 from lib.helpers import to_decimal
 from .actions import Actions
+from .settlement import Settlement
 from .stack import ASC
-from .stack import BaseStack
 from .stack import DESC
+from .stack import PriceLevelStack
+from .stops import StopLimitIndex
 from ..utils.facade import is_bot_user
+from ..utils.stats.candles import PairCandles
+from ..utils.stats.rolling import PairRollingStats
 
 
 class OrderProcessor(object):
@@ -101,18 +105,18 @@ class OrderProcessor(object):
             return self.add_to_book()
 
         if self.order.cost and self.order.cost > 0:
+            self.book.settle()
             self.order.close_market()
 
         self.logger.debug('Executed totally! {}'.format(self.order))
 
     def execute_order_with_matched(self, orders):
-        from django.core import serializers
-        from core.tasks.orders import stop_limit_processor
+        prices = []
 
         for order in orders:
             self.execute_order_with(order)
-            data = serializers.serialize('json', [order])
-            stop_limit_processor.apply_async([data])
+            # trade price is the price of order from stack
+            prices.append(to_decimal(order.price))
             if order.operation == SELL and (
                     order.quantity_left * order.price) < getattr(settings, 'MIN_COST_ORDER_CANCEL', 0.0000001):
                 # order from stack
@@ -126,24 +130,31 @@ class OrderProcessor(object):
             else:
                 self.book.cancel_order(self.order)
 
-        data = serializers.serialize('json', [self.order])
-        stop_limit_processor.apply_async([data])
+        if prices:
+            self.book.trigger_stop_limits(min(prices), max(prices))
 
         self.logger.debug('processed updated {}'.format(self.order))
 
     def execute_order_with(self, order: Order):
         self.logger.debug('matched order {}'.format(order))
-        self.order.execute(order)
+        quantity_left = order.quantity_left
+        if not self.book.settlement or not self.book.settlement.execute(self.order, order):
+            self.book.settle()
+            self.order.execute(order)
+        self.book.add_trade(self.order.determine_price(order), quantity_left - order.quantity_left)
 
         if order.state == ORDER_CLOSED:
             self.stack.remove(order)
             self.logger.debug('totaly executeed matched order {}'.format(order))
             self.book.actions.order_processed(order)
+        else:
+            self.stack.update(order)
 
         self.logger.debug('matched updated {}'.format(order))
 
     def cancel_market(self):
         self.logger.debug('Market cancel')
+        self.book.settle()
         self.order.cancel_order()
 
     def cancel(self):
@@ -151,6 +162,7 @@ class OrderProcessor(object):
         self.logger.debug('Cancel {}'.format(self.order))
 
         self.this_order_stack.remove(self.order)
+        self.book.settle()
         self.order.cancel_order()
         self.book.actions.order_cancelled(self.order)
 
@@ -201,9 +213,10 @@ class OrderProcessor(object):
 
 
 class OrderBook(object):
-    STACK_CLASS = BaseStack
+    STACK_CLASS = PriceLevelStack
     ORDER_PROCESSOR_CLASS = OrderProcessor
     ACTIONS_CLASS = Actions
+    SETTLEMENT_CLASS = Settlement
 
     def __init__(self, pair, loglevel=logging.DEBUG):
         self.pair: str = pair
@@ -212,6 +225,12 @@ class OrderBook(object):
         self.bot_sells = self.STACK_CLASS(ASC)  # ask
         self.bot_buys = self.STACK_CLASS(DESC)  # bid
         self.actions = self.ACTIONS_CLASS(self)
+        self.settlement = self.SETTLEMENT_CLASS(self) if settings.STACK_SETTLEMENT_ENABLED else None
+        self.stop_limits = StopLimitIndex()
+        self.triggered_stop_limits = []
+        self.placing_stop_limits = False
+        self.stats = PairRollingStats(pair)
+        self.candles = PairCandles(pair)
         self.logger = logging.getLogger('book:' + self.pair)
         # self.logger.info('Book init')
         # self.logger.setLevel(loglevel)
@@ -221,10 +240,55 @@ class OrderBook(object):
         result = processor.process()
         self.actions.order_processed(order)
 
+        if not self.placing_stop_limits:
+            self.place_stop_limits()
+
         return result
 
+    def add_trade(self, price, quantity):
+        self.stats.add_trade(price, quantity)
+        self.candles.add_trade(price, quantity)
+
+    def add_stop_limit(self, order: Order):
+        """
+        Stop limit order is kept out of the stack till the trade price reaches its stop
+        """
+        if order.state == ORDER_OPENED and not order.in_stack:
+            self.stop_limits.add(order)
+
+    def trigger_stop_limits(self, low, high):
+        self.triggered_stop_limits.extend(self.stop_limits.pop_triggered(low, high))
+
+    def place_stop_limits(self):
+        self.placing_stop_limits = True
+        try:
+            # placed stop limits can trigger the next ones
+            while self.triggered_stop_limits:
+                ids, self.triggered_stop_limits = self.triggered_stop_limits, []
+                orders = list(Order.objects.filter(
+                    id__in=ids,
+                    state=ORDER_OPENED,
+                    in_stack=False,
+                ).select_related('user').order_by('id'))
+                Order.objects.filter(id__in=[i.id for i in orders]).update(in_stack=True)
+
+                for order in orders:
+                    order.in_stack = True
+                    self.logger.info('stop limit triggered: {}'.format(order))
+                    self.process_order(order)
+        finally:
+            self.placing_stop_limits = False
+
+    def settle(self):
+        """
+        Persists fills made in memory, call before any db write or read of book orders
+        """
+        if self.settlement:
+            self.settlement.settle()
+
     def cancel_order(self, order: Order):
         self.logger.debug('Cancel {}'.format(order))
+        self.stop_limits.remove(order)
 
         processor: OrderProcessor = self.ORDER_PROCESSOR_CLASS(self, order)
         processor.cancel()
@@ -258,27 +322,19 @@ class OrderBook(object):
         return to_decimal(1.0) * sum(values) / len(values)
 
     def get_stats(self, stack):
-        amounts = [i.quantity_left for i in stack]
-        total_volume = sum(amounts)
-        prices = [i.price for i in stack]
+        total_volume = stack.volume
         if total_volume > 0:
-            weighted_avg = sum(x * y for x, y in zip(prices, amounts)) / total_volume
+            weighted_avg = stack.notional / total_volume
         else:
             weighted_avg = None
 
         return total_volume, weighted_avg
 
     def get_stats_buys(self, stack):
-        amounts = [i.quantity_left for i in stack]
-        total_volume = sum(amounts)
-        prices = [i.price for i in stack]
-        if total_volume > 0:
-            weighted_avg = sum(x * y for x, y in zip(prices, amounts)) / total_volume
-        else:
-            weighted_avg = None
+        total_volume, weighted_avg = self.get_stats(stack)
 
         if weighted_avg:
-            return weighted_avg * total_volume, weighted_avg
+            return stack.notional, weighted_avg
         else:
             return total_volume, weighted_avg
 
@@ -1,22 +1,54 @@
-import json
+from decimal import Decimal
 from itertools import chain
+from typing import Optional
 
+import simplejson
 from django.core.cache import cache
 
 from core.models.inouts.pair import Pair
-from lib.helpers import decimalize, round_by_precision
+from core.orderbook.snapshot import StackSnapshot
+from core.orderbook.snapshot import snapshot_key
+from lib.helpers import decimalize
 
 
-def get_stack_by_pair(pair, precision=None):
+def get_stack_snapshot(pair, precision=None) -> Optional[StackSnapshot]:
     pair = Pair.get(pair)
-    pair = pair.code.upper()
-    key = f'stack:{pair}'
+    try:
+        raw = cache.get(snapshot_key(pair.code.upper(), precision))
+        return StackSnapshot(raw) if raw else None
+
+    except Exception:
+        return None
+
+
+def get_stack_by_pair(pair, precision=None, sell_limit=None, buy_limit=None):
+    snapshot = get_stack_snapshot(pair, precision)
+    if not snapshot:
+        return {}
+
+    try:
+        return snapshot.to_dict(sell_limit=sell_limit, buy_limit=buy_limit)
+
+    except Exception:
+        return {}
+
+
+def stack_levels_key(pair_code, precision=None):
+    key = f'stack_levels:{pair_code}'
     if precision:
-        key = f'stack:{pair}:{precision}'
+        key = f'stack_levels:{pair_code}:{precision}'
+    return key
+
+
+def get_stack_levels(pair, precision=None):
+    """
+    Price levels snapshot of the stack with sequence number of the last diff
+    """
+    pair = Pair.get(pair)
     try:
-        data = cache.get(key)
+        data = cache.get(stack_levels_key(pair.code.upper(), precision))
         if data:
-            data = json.loads(data)
+            data = simplejson.loads(data, use_decimal=True)
         data = data or {}
 
     except Exception:
@@ -25,6 +57,26 @@ def get_stack_by_pair(pair, precision=None):
     return data
 
 
+def stack_levels(entries):
+    """
+    Aggregates exported stack entries to {price: quantity}, keeping stack order
+    """
+    levels = {}
+    for i in entries:
+        price = decimalize(i['price'])
+        levels[price] = levels.get(price, 0) + decimalize(i['quantity'])
+    return levels
+
+
+def diff_levels(old, new):
+    """
+    Changed levels as [price, quantity] pairs, removed levels have zero quantity
+    """
+    changes = [[price, qty] for price, qty in new.items() if old.get(price) != qty]
+    changes.extend([price, 0] for price in old if price not in new)
+    return changes
+
+
 def mark_self_stack(stack, user_id):
     for i in chain(stack.get('buys', []), stack.get('sells', [])):
         if 'user_id' in i:
@@ -38,61 +90,99 @@ def mark_self_stack(stack, user_id):
     return stack
 
 
-def group_by_precision(pair_code, stack_data):
-    res = {}
-    buys = stack_data['buys']
-    sells = stack_data['sells']
+PRICE_SCALE = 10 ** 8  # prices are stored with 8 decimals
 
-    from core.models import PairSettings
-    stack_precisions = PairSettings.get_stack_precisions_by_pair(pair_code)
+# {(pair_code, side): (signature, precisions, levels)}, grouped levels of the last update
+_grouped_levels_cache = {}
 
-    for precision in stack_precisions:
-        stack_data_copy = stack_data.copy()
-        new_buys = {}
-        new_sells = {}
 
-        for buy in buys:
-            recalculate_stack_quantity(new_buys, buy, precision, is_bid=True)
+def price_step(precision) -> Decimal:
+    """
+    Grouping step of precision, same as round_by_precision does
+    """
+    base = decimalize(precision)
+    step = decimalize(10 ** base.as_tuple().exponent)
+    if base > 1:
+        step *= base
+    return step
 
-        for sell in sells:
-            recalculate_stack_quantity(new_sells, sell, precision, is_bid=False)
 
-        stack_data_copy['buys'] = sorted(new_buys.values(), key=lambda k: k['price'])
-        stack_data_copy['sells'] = sorted(new_sells.values(), key=lambda k: k['price'])
+def group_by_precision(pair_code, stack_data):
+    from core.models import PairSettings
+    stack_precisions = PairSettings.get_stack_precisions_by_pair(pair_code)
+    if not stack_precisions:
+        return {}
+
+    buys = group_stack_side(pair_code, 'buys', stack_data['buys'], stack_precisions, is_bid=True)
+    sells = group_stack_side(pair_code, 'sells', stack_data['sells'], stack_precisions, is_bid=False)
 
-        stack_data_copy['buys'] = sorted(recalculate_depth(stack_data_copy['buys']),
-                                         key=lambda k: k['price'], reverse=True)
-        stack_data_copy['sells'] = sorted(recalculate_depth(stack_data_copy['sells']),
-                                          key=lambda k: k['price'], reverse=True)
+    res = {}
+    for precision in stack_precisions:
+        stack_data_copy = stack_data.copy()
+        stack_data_copy['buys'] = [level_to_dict(i) for i in buys[precision]]
+        stack_data_copy['sells'] = [level_to_dict(i) for i in sells[precision]]
         res[precision] = stack_data_copy
     return res
 
 
-def recalculate_depth(data_list):
-    depth = 0
-    result = []
-    for i in data_list:
-        depth += decimalize(i['quantity'])
-        i['depth'] = depth
-        result.append(i)
+def group_stack_side(pair_code, side, entries, precisions, is_bid):
+    """
+    Groups one side of the stack by all precisions in one pass.
+    Entries should be sorted from the top of the stack, as exported by the book,
+    so levels of every precision are built by merging with the last one.
+    Returns {precision: [(price, quantity, user_ids, ids, timestamp, depth), ...]} sorted by price desc
+    """
+    precisions = tuple(precisions)
+    signature = tuple((i['id'], i['price'], i['quantity']) for i in entries)
+    cached = _grouped_levels_cache.get((pair_code, side))
+    if cached and cached[0] == signature and cached[1] == precisions:
+        return cached[2]
+
+    ticks = [(precision, max(int(price_step(precision) * PRICE_SCALE), 1)) for precision in precisions]
+    grouped = {precision: [] for precision in precisions}
+
+    for entry in entries:
+        units = int(decimalize(entry['price']) * PRICE_SCALE)
+        quantity = decimalize(entry['quantity'])
+        for precision, tick in ticks:
+            # bids are rounded down, asks up
+            level_units = units // tick * tick if is_bid else -(-units // tick) * tick
+            levels = grouped[precision]
+            if levels and levels[-1][0] == level_units:
+                level = levels[-1]
+                level[1] += quantity
+                level[2].append(entry['user_id'])
+                level[3].append(entry['id'])
+                level[4] = entry['timestamp']
+            else:
+                levels.append([level_units, quantity, [entry['user_id']], [entry['id']], entry['timestamp']])
+
+    result = {}
+    for precision, levels in grouped.items():
+        quantum = decimalize(1).scaleb(min(price_step(precision).as_tuple().exponent, 0))
+        # depth is accumulated from the lowest price
+        if is_bid:
+            levels.reverse()
+        depth = 0
+        precision_levels = []
+        for level_units, quantity, user_ids, ids, timestamp in levels:
+            depth += quantity
+            price = decimalize(level_units).scaleb(-8).quantize(quantum)
+            precision_levels.append((price, quantity, tuple(user_ids), tuple(ids), timestamp, depth))
+        precision_levels.reverse()
+        result[precision] = precision_levels
+
+    _grouped_levels_cache[(pair_code, side)] = (signature, precisions, result)
     return result
 
 
-def recalculate_stack_quantity(new_data, current_value_dict, precision, is_bid):
-    new_price = round_by_precision(current_value_dict['price'], precision, is_bid=is_bid)
-    if new_price in new_data:
-        updated = {
-            'quantity': decimalize(new_data[new_price]['quantity']) + decimalize(current_value_dict['quantity']),
-            'user_ids': new_data[new_price]['user_ids'] + [current_value_dict['user_id']],
-            'ids': new_data[new_price]['ids'] + [current_value_dict['id']],
-            'timestamp': current_value_dict['timestamp'],
-        }
-        new_data[new_price].update(updated)
-    else:
-        new_data[new_price] = {
-            'price': new_price,
-            'quantity': decimalize(current_value_dict['quantity']),
-            'user_ids': [current_value_dict['user_id']],
-            'timestamp': current_value_dict['timestamp'],
-            'ids': [current_value_dict['id']]
-        }
+def level_to_dict(level):
+    price, quantity, user_ids, ids, timestamp, depth = level
+    return {
+        'price': price,
+        'quantity': quantity,
+        'user_ids': list(user_ids),
+        'timestamp': timestamp,
+        'ids': list(ids),
+        'depth': depth,
+    }
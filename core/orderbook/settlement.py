@@ -0,0 +1,294 @@
+import logging
+import threading
+import time
+from collections import defaultdict
+from typing import List
+
+import simplejson
+from django.conf import settings
+from django.db import connection
+from django.db.transaction import atomic
+from django.utils import timezone
+from psycopg2.extras import execute_values
+
+from core.balance_manager import BalanceManager
+from core.cache import last_pair_price_cache
+from core.consts.orders import BUY
+from core.consts.orders import EXCHANGE
+from core.consts.orders import LIMIT
+from core.consts.orders import MARKET
+from core.currency import Currency
+from core.models.inouts.balance import Balance
+from core.models.inouts.pair import Pair
+from core.models.inouts.transaction import REASON_ORDER_CACHEBACK
+from core.models.inouts.transaction import REASON_ORDER_EXECUTED
+from core.models.inouts.transaction import TRANSACTION_COMPLETED
+from core.models.inouts.transaction import Transaction
+from core.models.orders import ExecutionResult
+from core.models.orders import Order
+from core.models.orders import OrderStateChangeHistory
+from core.models.orders import SettledSequence
+from core.signals.inouts import balance_changed
+from core.signals.orders import order_changed
+from lib.cache import redis_client
+from lib.helpers import to_decimal
+from lib.utils import threaded_daemon
+from .structs import Fill
+
+log = logging.getLogger(__name__)
+
+JOURNAL_KEY = 'settlement-journal:{}'
+
+UPDATE_BALANCES_SQL = """
+update {table} b
+set amount = b.amount + v.delta,
+    amount_in_orders = b.amount_in_orders + v.in_orders_delta
+from (values %s) as v(user_id, currency, delta, in_orders_delta)
+where b.user_id = v.user_id and b.currency = v.currency
+"""
+
+
+class Settlement(object):
+    """
+    Write-behind persistence of matches made in memory by the stack worker.
+
+    Every fill gets pair sequence number and is journaled to redis before the book goes on.
+    Batches of fills are persisted in one db transaction together with the last settled sequence,
+    so after restart unsettled fills are replayed from the journal.
+    """
+    PERIOD = settings.STACK_SETTLEMENT_PERIOD  # in seconds
+    BATCH_SIZE = settings.STACK_SETTLEMENT_BATCH_SIZE
+
+    def __init__(self, book):
+        self.book = book
+        self.journal_key = JOURNAL_KEY.format(book.pair.upper())
+        self.fills: List[Fill] = []
+        self.seq = 0
+        self.lock = threading.RLock()  # guards fills buffer
+        self.settle_lock = threading.RLock()  # one batch at a time
+
+    def execute(self, order: Order, matched: Order) -> bool:
+        """
+        Matches orders in memory. Returns False if match should go through Order.execute
+        """
+        assert order.operation != matched.operation, 'Operations should be different!'
+        if order.type in [MARKET, EXCHANGE, ] and order.operation == BUY:
+            quantity = to_decimal(min(order.quantity_from_cost(matched), matched.quantity_left))
+        else:
+            quantity = to_decimal(min(order.quantity_left, matched.quantity_left))
+        price = order.determine_price(matched)
+
+        if not (order.can_execute_in_memory(quantity, price) and matched.can_execute_in_memory(quantity, price)):
+            return False
+
+        with self.lock:
+            self.seq += 1
+            fill = Fill(
+                seq=self.seq,
+                pair_id=order.pair_id,
+                taker=order.execute_in_memory(matched, quantity, price),
+                maker=matched.execute_in_memory(order, quantity, price),
+                ts=time.time(),
+            )
+            redis_client.rpush(self.journal_key, simplejson.dumps(fill.to_dict()))
+            self.fills.append(fill)
+            batch_full = len(self.fills) >= self.BATCH_SIZE
+
+        if batch_full:
+            self.settle()
+        return True
+
+    def settle(self):
+        with self.settle_lock:
+            with self.lock:
+                fills, self.fills = self.fills, []
+
+            if not fills:
+                return
+
+            try:
+                settled, execution_results = self.persist(fills)
+            except Exception:
+                # fills stay in journal, retry with next batch
+                with self.lock:
+                    self.fills = fills + self.fills
+                raise
+
+            redis_client.ltrim(self.journal_key, len(fills), -1)
+
+        if settled:
+            self.after_settle(settled, execution_results)
+
+    def replay(self):
+        """
+        Settles fills left in journal by the previous worker run
+        """
+        pair = Pair.get(self.book.pair)
+        settled_seq = SettledSequence.get_seq(pair.id)
+        fills = [Fill.from_dict(simplejson.loads(i)) for i in redis_client.lrange(self.journal_key, 0, -1)]
+
+        with self.lock:
+            self.seq = max([settled_seq, self.seq] + [i.seq for i in fills])
+            self.fills = fills + self.fills
+
+        if fills:
+            log.warning('%s: replay %s fills after seq %s', self.book.pair, len(fills), settled_seq)
+            self.settle()
+
+    def persist(self, fills: List[Fill]):
+        with atomic():
+            settled_seq, _ = SettledSequence.objects.select_for_update().get_or_create(pair_id=fills[0].pair_id)
+            fills = [i for i in fills if i.seq > settled_seq.seq]
+            if not fills:
+                return fills, []
+
+            sides = [side for fill in fills for side in (fill.taker, fill.maker)]
+
+            transactions = []
+            execution_results = []
+            for side in sides:
+                tx = Transaction(
+                    user_id=side.user_id,
+                    reason=REASON_ORDER_EXECUTED,
+                    state=TRANSACTION_COMPLETED,
+                    currency=Currency.get(side.executed_currency),
+                    amount=side.executed_amount,
+                )
+                transactions.append(tx)
+                cacheback_tx = None
+                if side.cacheback_amount:
+                    cacheback_tx = Transaction(
+                        user_id=side.user_id,
+                        reason=REASON_ORDER_CACHEBACK,
+                        state=TRANSACTION_COMPLETED,
+                        currency=Currency.get(side.cacheback_currency),
+                        amount=side.cacheback_amount,
+                    )
+                    transactions.append(cacheback_tx)
+
+                execution_results.append(ExecutionResult(
+                    order_id=side.order_id,
+                    user_id=side.user_id,
+                    pair_id=side.pair_id,
+                    price=side.price,
+                    quantity=side.quantity,
+                    matched_order_id=side.matched_order_id,
+                    matched_order_price=side.matched_order_price,
+                    fee_rate=side.fee_rate,
+                    fee_amount=side.fee_amount,
+                    transaction=tx,
+                    cacheback_transaction=cacheback_tx,
+                ))
+
+            Transaction.objects.bulk_create(transactions)
+            ExecutionResult.objects.bulk_create(execution_results)
+
+            self.update_orders(sides)
+            self.update_balances(sides)
+
+            settled_seq.seq = fills[-1].seq
+            settled_seq.save()
+
+        return fills, execution_results
+
+    def update_orders(self, sides):
+        now = timezone.now()
+        last_sides = {}
+        prev_states = {}
+        for side in sides:
+            last_sides[side.order_id] = side
+            prev_states.setdefault(side.order_id, side.prev_state)
+
+        orders = [
+            Order(
+                id=side.order_id,
+                quantity_left=side.quantity_left,
+                quantity=side.order_quantity,
+                price=side.order_price,
+                cost=side.cost,
+                state=side.state,
+                executed=True,
+                updated=now,
+            ) for side in last_sides.values()
+        ]
+        Order.objects.bulk_update(
+            orders,
+            ['quantity_left', 'quantity', 'price', 'cost', 'state', 'executed', 'updated'],
+        )
+
+        OrderStateChangeHistory.objects.bulk_create([
+            OrderStateChangeHistory(
+                order_id=order_id,
+                prev_state=prev_states[order_id],
+                prev_status=Order.STATUS_NOT_SET,
+            ) for order_id, side in last_sides.items() if side.state != prev_states[order_id]
+        ])
+
+    def update_balances(self, sides):
+        deltas = defaultdict(lambda: to_decimal(0))
+        in_orders_deltas = defaultdict(lambda: to_decimal(0))
+        for side in sides:
+            in_orders_deltas[(side.user_id, side.hold_currency)] -= side.hold_amount
+            deltas[(side.user_id, side.hold_currency)] += 0
+            deltas[(side.user_id, side.executed_currency)] += side.executed_amount
+            if side.cacheback_amount:
+                deltas[(side.user_id, side.cacheback_currency)] += side.cacheback_amount
+
+        Balance.objects.bulk_create(
+            [Balance(user_id=user_id, currency=Currency.get(currency)) for user_id, currency in deltas],
+            ignore_conflicts=True,
+        )
+
+        values = [
+            (user_id, currency, delta, in_orders_deltas[(user_id, currency)])
+            for (user_id, currency), delta in deltas.items()
+        ]
+        with connection.cursor() as cursor:
+            execute_values(
+                cursor,
+                UPDATE_BALANCES_SQL.format(table=Balance._meta.db_table),
+                values,
+                template='(%s, %s, %s::numeric, %s::numeric)',
+            )
+
+    def after_settle(self, fills: List[Fill], execution_results: List[ExecutionResult]):
+        from core.tasks.orders import send_api_callback
+        from exchange.notifications import trades_notificator
+
+        matched_amounts = defaultdict(lambda: to_decimal(0))
+        user_ids = set()
+        for fill in fills:
+            for side in (fill.taker, fill.maker):
+                matched_amounts[side.order_id] += side.executed_amount + side.fee_amount
+                user_ids.add(side.user_id)
+
+        orders = Order.objects.filter(id__in=list(matched_amounts)).select_related('user', 'pair').in_bulk()
+
+        for order in orders.values():
+            order_changed.send(sender=Order, order=order)
+            send_api_callback(order.user_id, order.id)
+            order.notify(is_executed=True, matched_amount=matched_amounts[order.id])
+
+        for user_id in user_ids:
+            balance_changed.send(sender=BalanceManager, user_id=user_id)
+
+        for er in execution_results:
+            if er.order_id - er.matched_order_id > 0:
+                er.order = orders[er.order_id]
+                trades_notificator.add_data(entry=er)
+
+        last_limit_fill = next((i for i in reversed(fills) if i.taker.type == LIMIT), None)
+        if last_limit_fill:
+            last_pair_price_cache.set(orders[last_limit_fill.taker.order_id].pair, last_limit_fill.taker.order_price)
+
+    @threaded_daemon
+    def settler(self):
+        while True:
+            time.sleep(self.PERIOD)
+            try:
+                self.settle()
+            except Exception:
+                log.exception('%s: settlement failed', self.book.pair)
+
+    def start_settler(self):
+        self.settler_thread = self.settler()
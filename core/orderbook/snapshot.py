@@ -0,0 +1,138 @@
+from array import array
+from decimal import Decimal
+
+import msgpack
+
+SNAPSHOT_VERSION = 2
+SCALE = 10 ** 8  # prices and quantities are stored with 8 decimals
+INT64_MAX = 2 ** 63 - 1
+
+# column name: array typecode, scaled decimals are stored as int64 or decimal strings if they do not fit
+COLUMNS = {
+    'id': 'q',
+    'price': 'q',
+    'quantity': 'q',
+    'user_id': 'q',
+    'timestamp': 'd',
+    'depth': 'q',
+}
+SCALED_COLUMNS = ('price', 'quantity', 'depth')
+# grouped by precision levels have lists of orders instead of id and user_id
+LIST_COLUMNS = ('ids', 'user_ids')
+SIDES = ('sells', 'buys')
+
+
+def snapshot_key(pair_code, precision=None):
+    key = f'stack:v{SNAPSHOT_VERSION}:{pair_code}'
+    if precision:
+        key = f'{key}:{precision}'
+    return key
+
+
+def _scalar(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    return value
+
+
+def _scaled(value):
+    return int(Decimal(str(value)) * SCALE)
+
+
+def _scaled_column(values):
+    scaled = [_scaled(i) for i in values]
+    if all(-INT64_MAX <= i <= INT64_MAX for i in scaled):
+        return array('q', scaled).tobytes()
+    # high supply tokens amounts
+    return [str(i) for i in values]
+
+
+def encode_stack(data) -> bytes:
+    """
+    Packs exported stack to msgpack with parallel int64/float64 arrays per side column
+    """
+    packed = {'meta': {k: _scalar(v) for k, v in data.items() if k not in SIDES}}
+
+    for side in SIDES:
+        entries = data.get(side, [])
+        columns = {'n': len(entries)}
+        if entries:
+            for name, typecode in COLUMNS.items():
+                if name not in entries[0]:
+                    continue
+                if name in SCALED_COLUMNS:
+                    columns[name] = _scaled_column([i[name] for i in entries])
+                else:
+                    columns[name] = array(typecode, [i[name] for i in entries]).tobytes()
+
+            for name in LIST_COLUMNS:
+                if name not in entries[0]:
+                    continue
+                # flat values with per-entry lengths
+                columns[f'{name}_len'] = array('q', [len(i[name]) for i in entries]).tobytes()
+                columns[name] = array('q', [j for i in entries for j in i[name]]).tobytes()
+        packed[side] = columns
+
+    return msgpack.packb(packed, use_bin_type=True)
+
+
+class StackSnapshot:
+    """
+    Lazily decoded stack snapshot, columns are decoded only up to the requested limit
+    """
+
+    def __init__(self, raw: bytes):
+        self.data = msgpack.unpackb(raw, raw=False)
+        self.meta = self.data['meta']
+
+    def size(self, side):
+        return self.data[side]['n']
+
+    def column(self, side, name, limit=None):
+        columns = self.data[side]
+        if name not in columns:
+            return None
+        if isinstance(columns[name], list):
+            return [float(i) for i in columns[name][:limit]]
+        typecode = 'q' if name in LIST_COLUMNS else COLUMNS[name]
+        values = memoryview(columns[name]).cast(typecode)
+        if name in LIST_COLUMNS:
+            return values
+        if limit is not None:
+            values = values[:limit]
+        if name in SCALED_COLUMNS:
+            return [i / SCALE for i in values]
+        return values.tolist()
+
+    def entries(self, side, limit=None):
+        n = self.size(side)
+        if limit is not None:
+            n = min(n, limit)
+        if not n:
+            return []
+
+        columns = {}
+        for name in COLUMNS:
+            values = self.column(side, name, n)
+            if values is not None:
+                columns[name] = values
+
+        for name in LIST_COLUMNS:
+            values = self.column(side, name)
+            if values is None:
+                continue
+            lengths = memoryview(self.data[side][f'{name}_len']).cast('q')[:n]
+            lists = []
+            offset = 0
+            for length in lengths:
+                lists.append(values[offset:offset + length].tolist())
+                offset += length
+            columns[name] = lists
+
+        return [{name: values[i] for name, values in columns.items()} for i in range(n)]
+
+    def to_dict(self, sell_limit=None, buy_limit=None):
+        data = dict(self.meta)
+        data['sells'] = self.entries('sells', sell_limit)
+        data['buys'] = self.entries('buys', buy_limit)
+        return data
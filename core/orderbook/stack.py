@@ -1,5 +1,7 @@
 import logging
+from itertools import islice
 
+from sortedcontainers import SortedDict
 from sortedcontainers import SortedListWithKey
 
 ASC = 0  # возрастает
@@ -64,3 +66,169 @@ class BaseStack(object):
             return price >= self.top_price
         else:
             return price <= self.top_price
+
+    def update(self, order):
+        self.add(order)
+
+    @property
+    def volume(self):
+        return sum(i.quantity_left for i in self)
+
+    @property
+    def notional(self):
+        return sum(i.price * i.quantity_left for i in self)
+
+
+class PriceLevel(object):
+    """
+    Orders with the same price, kept in id (arrival) order,
+    with running totals of quantity and notional
+    """
+    def __init__(self, price):
+        self.price = price
+        self.orders = SortedDict()
+        self.quantity = 0
+        self.notional = 0
+
+    def add(self, order, quantity):
+        self.orders[order.id] = order
+        self.quantity += quantity
+        self.notional += self.price * quantity
+
+    def remove(self, order, quantity):
+        del self.orders[order.id]
+        self.quantity -= quantity
+        self.notional -= self.price * quantity
+
+    def update(self, order, delta):
+        self.orders[order.id] = order
+        self.quantity += delta
+        self.notional += self.price * delta
+
+    def __iter__(self):
+        return iter(self.orders.values())
+
+    def __len__(self):
+        return len(self.orders)
+
+    def __bool__(self):
+        return bool(self.orders)
+
+
+class PriceLevelStack(object):
+    """
+    Stack of price levels.
+    Top of book, depth and volume stats are taken from level totals
+    instead of scanning every order
+    """
+    def __init__(self, direction=ASC):
+        self.direction = direction
+        self.levels = SortedDict()
+        self.orders = {}
+        # (price, quantity) accounted in level totals, cause orders are mutated outside of stack
+        self.accounted = {}
+        self.volume = 0
+        self.notional = 0
+
+    def level_key(self, price):
+        if self.direction == ASC:
+            return price
+        else:
+            return -price
+
+    def add(self, order):
+        if order.id in self.orders:
+            return self.update(order)
+
+        key = self.level_key(order.price)
+        level = self.levels.get(key)
+        if level is None:
+            level = self.levels[key] = PriceLevel(order.price)
+
+        quantity = order.quantity_left
+        level.add(order, quantity)
+        self.orders[order.id] = order
+        self.accounted[order.id] = (order.price, quantity)
+        self.volume += quantity
+        self.notional += order.price * quantity
+
+    def update(self, order):
+        """
+        Sync level totals with changed order quantity
+        """
+        if order.id not in self.orders:
+            return self.add(order)
+
+        price, quantity = self.accounted[order.id]
+        if price != order.price:
+            self.remove(order)
+            return self.add(order)
+
+        delta = order.quantity_left - quantity
+        self.levels[self.level_key(price)].update(order, delta)
+        self.orders[order.id] = order
+        self.accounted[order.id] = (price, order.quantity_left)
+        self.volume += delta
+        self.notional += price * delta
+
+    def remove(self, order):
+        try:
+            cached_order = self.orders[order.id]
+            price, quantity = self.accounted[order.id]  # order removed from level it was accounted in
+            key = self.level_key(price)
+            level = self.levels[key]
+            level.remove(cached_order, quantity)
+            if not level:
+                del self.levels[key]
+            del self.orders[order.id]
+            del self.accounted[order.id]
+            self.volume -= quantity
+            self.notional -= price * quantity
+        except Exception as e:
+            logger.info(str(e), exc_info=True)
+
+    def __iter__(self):
+        for level in self.levels.values():
+            yield from level
+
+    def __contains__(self, key):
+        return key in self.orders
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return list(islice(self, idx.start, idx.stop, idx.step))
+        if idx < 0:
+            return list(self)[idx]
+        try:
+            return next(islice(self, idx, None))
+        except StopIteration:
+            raise IndexError('stack index out of range')
+
+    @property
+    def top_price(self):
+        if not self.levels:
+            return None
+        return self.levels.peekitem(0)[1].price
+
+    def __bool__(self):
+        return bool(self.orders)
+
+    def __len__(self):
+        return len(self.orders)
+
+    def stack_iter(self):
+        for i in self:
+            yield (i.price, i.quantity_left)
+
+    def depth(self, limit=None):
+        """
+        Aggregated (price, quantity, orders count) per level
+        """
+        for level in islice(self.levels.values(), limit):
+            yield (level.price, level.quantity, len(level))
+
+    def match_price(self, price):
+        if self.direction == ASC:
+            return price >= self.top_price
+        else:
+            return price <= self.top_price
@@ -0,0 +1,57 @@
+from sortedcontainers import SortedList
+
+from core.consts.orders import BUY
+from lib.helpers import to_decimal
+
+
+class StopLimitIndex(object):
+    """
+    Opened stop limit orders waiting for trigger, sorted by stop price.
+    Buy stop is triggered by trade price >= stop, sell stop by trade price <= stop
+    """
+
+    def __init__(self):
+        self.buys = SortedList()  # (stop, order_id)
+        self.sells = SortedList()  # (stop, order_id)
+        self.orders = {}  # {order_id: (side, (stop, order_id))}
+
+    def __len__(self):
+        return len(self.orders)
+
+    def __contains__(self, order_id):
+        return order_id in self.orders
+
+    def add(self, order):
+        self.remove(order)
+        side = self.buys if order.operation == BUY else self.sells
+        entry = (to_decimal(order.stop), order.id)
+        side.add(entry)
+        self.orders[order.id] = (side, entry)
+
+    def remove(self, order):
+        if order.id not in self.orders:
+            return
+        side, entry = self.orders.pop(order.id)
+        side.remove(entry)
+
+    def pop_triggered(self, low, high):
+        """
+        Removes and returns ids of orders triggered by trades in [low, high] price range
+        """
+        low = to_decimal(low)
+        high = to_decimal(high)
+
+        # stop <= high
+        buys_end = self.buys.bisect_left((high, float('inf')))
+        triggered = self.buys[:buys_end]
+        del self.buys[:buys_end]
+
+        # stop >= low
+        sells_start = self.sells.bisect_left((low, float('-inf')))
+        triggered.extend(self.sells[sells_start:])
+        del self.sells[sells_start:]
+
+        ids = [order_id for _, order_id in triggered]
+        for order_id in ids:
+            del self.orders[order_id]
+        return ids
@@ -0,0 +1,80 @@
+from dataclasses import asdict
+from dataclasses import dataclass
+from decimal import Decimal
+from typing import ClassVar
+from typing import Optional
+
+
+@dataclass
+class FillSide:
+    """
+    Result of a match for one order, calculated in memory by the stack worker
+    """
+    order_id: int
+    user_id: int
+    pair_id: int
+    operation: int
+    type: int
+    matched_order_id: int
+    matched_order_price: Decimal
+    price: Decimal
+    quantity: Decimal
+    fee_rate: Decimal
+    fee_amount: Decimal
+    executed_currency: int
+    executed_amount: Decimal
+    cacheback_currency: Optional[int]
+    cacheback_amount: Optional[Decimal]
+    hold_currency: int
+    hold_amount: Decimal
+    # order state after the match
+    prev_state: int
+    state: int
+    quantity_left: Decimal
+    order_quantity: Decimal
+    order_price: Optional[Decimal]
+    cost: Optional[Decimal]
+
+    DECIMAL_FIELDS: ClassVar[tuple] = (
+        'matched_order_price', 'price', 'quantity', 'fee_rate', 'fee_amount', 'executed_amount',
+        'cacheback_amount', 'hold_amount', 'quantity_left', 'order_quantity', 'order_price', 'cost',
+    )
+
+    def to_dict(self):
+        return {k: str(v) if isinstance(v, Decimal) else v for k, v in asdict(self).items()}
+
+    @classmethod
+    def from_dict(cls, data):
+        data = dict(data)
+        for name in cls.DECIMAL_FIELDS:
+            if data[name] is not None:
+                data[name] = Decimal(data[name])
+        return cls(**data)
+
+
+@dataclass
+class Fill:
+    seq: int
+    pair_id: int
+    taker: FillSide
+    maker: FillSide
+    ts: float
+
+    def to_dict(self):
+        return {
+            'seq': self.seq,
+            'pair_id': self.pair_id,
+            'taker': self.taker.to_dict(),
+            'maker': self.maker.to_dict(),
+            'ts': self.ts,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(
+            seq=data['seq'],
+            pair_id=data['pair_id'],
+            taker=FillSide.from_dict(data['taker']),
+            maker=FillSide.from_dict(data['maker']),
+            ts=data['ts'],
+        )
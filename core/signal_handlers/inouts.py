@@ -1,8 +1,11 @@
+from django.db import transaction
+from django.db.models.signals import post_delete
 from django.db.models.signals import post_save
 from django.dispatch import receiver
 
 from core.balance_manager import BalanceManager
 from core.utils.wallet_history import create_or_update_wallet_history_item_from_transaction
+from core.models.inouts.pair import Pair
 from core.models.inouts.sci import PayGateTopup
 from core.models.inouts.transaction import Transaction
 from core.models.inouts.wallet import WalletTransactions
@@ -33,6 +36,13 @@ def create_wallet_history_item_paygate_topup(sender, instance: PayGateTopup, cre
         create_or_update_wallet_history_item_from_transaction(instance.tx)
 
 
+@receiver(post_save, sender=Pair)
+@receiver(post_delete, sender=Pair)
+def on_pair_changed(sender, instance, **kwargs):
+    # other processes should not reload registry before the change is visible
+    transaction.on_commit(Pair.invalidate_registry)
+
+
 @receiver(balance_changed, sender=BalanceManager)
 def on_balance_changed(sender, user_id, **kwargs):
     balance_notificator.add_data(user_id=user_id)
\ No newline at end of file
@@ -18,6 +18,7 @@ from core.orderbook.book import OrderBook
 from core.models.inouts.pair import Pair
 from core.serializers.orders import ExchangeResultSerialzier
 from core.serializers.orders import OrderSerializer
+from exchange.notifications import notifications_buffer
 
 log = logging.getLogger(__name__)
 
@@ -47,6 +48,12 @@ class StackProcessor:
         for pair_name in self.pairs:
             pair = Pair.get(pair_name)
 
+            settlement = self.books[pair_name].settlement
+            if settlement:
+                settlement.replay()
+            self.books[pair_name].stats.load()
+            self.books[pair_name].candles.load()
+
             orders = Order.objects.filter(
                 state=ORDER_OPENED,
                 pair=pair,
@@ -60,6 +67,16 @@ class StackProcessor:
             for order in orders:
                 self.books[pair_name].process_order(order)
 
+            stop_limits = Order.objects.filter(
+                state=ORDER_OPENED,
+                pair=pair,
+                type=STOP_LIMIT,
+                in_stack=False,
+            ).only('id', 'operation', 'stop', 'state', 'in_stack')
+
+            for order in stop_limits:
+                self.books[pair_name].add_stop_limit(order)
+
     def place_order(self, order_data):
         # TODO check if exist order -> except
         order: Order = self.get_order_from_json(order_data)
@@ -81,8 +98,16 @@ class StackProcessor:
         return self.books[pair_name]
 
     def start_cache_updaters(self):
+        # websocket messages are sent in background, matching doesn't wait for channel layer
+        notifications_buffer.start()
         for book in self.books.values():
             book.actions.start_updater()
+            if book.settlement:
+                book.settlement.start_settler()
+
+    def settle(self):
+        for book in self.books.values():
+            book.settle()
 
     @staticmethod
     def _pair_name_by_id(pair_id):
@@ -101,12 +126,14 @@ class StackProcessor:
         if key in cache:
             log.info(f'on cancel {order_id}')
             return
+        self.settle()
         order: Order = self.get_order_from_data(order_data)
         book: OrderBook = self.get_book_for_order(order)
         book.cancel_order(order)
         cache.set(key, True, 60)
 
     def update_order(self, order_data):
+        self.settle()
         order = self.get_order_from_data(order_data)
         book = self.get_book_for_order(order)
         exist_in_stack = book.is_exists_in_stack(order)
@@ -114,6 +141,9 @@ class StackProcessor:
         order._update_order(order_data)
         if exist_in_stack:
             book.process_order(order)
+        elif order.type == STOP_LIMIT:
+            # stop could be changed
+            book.add_stop_limit(order)
 
     @classmethod
     def get_instance(cls, loglevel=logging.INFO, renew=False, pairs=None):
@@ -143,6 +173,7 @@ class StackProcessor:
         )
 
         order.save()
+        self._book_by_pair(pair).add_stop_limit(order)
         return order
 
     def market_order(self, data):
@@ -150,6 +181,7 @@ class StackProcessor:
         if not order:
             return {}
         book.process_order(order)
+        book.settle()
         order = OrderSerializer(instance=order).data
         return order
 
@@ -199,6 +231,7 @@ class StackProcessor:
             return {}
 
         book.process_order(order)
+        book.settle()
 
         # is correct?
         order_cost = order.executionresult_set.aggregate(
@@ -220,6 +253,8 @@ class StackProcessor:
 
     def otc_bulk_update(self, pair='BTC-USDT'):
         pair = Pair.get(pair)
+        book = self._book_by_pair(pair)
+        book.settle()
 
         orders = list(Order.objects.filter(
             type=EXTERNAL,
@@ -227,8 +262,6 @@ class StackProcessor:
             pair=pair)
         )
 
-        book = self._book_by_pair(pair)
-
         updater = OtcOrdersBulkUpdater(orders, pair)
         orders2reload = updater.start()
 
@@ -6,11 +6,16 @@ from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.contrib.sites.models import Site
 from django.core.mail import send_mail
+from django.db.models import Max
+from django.db.models import Min
+from django.db.models import Q
+from django.db.transaction import atomic
 from django.template import loader
 from django.utils import timezone
 from django.utils.translation import ugettext_lazy as _
 
 from core.consts.currencies import CURRENCIES_LIST
+from core.models.inouts.balance import Balance
 from core.models.inouts.dif_balance import DifBalance
 from core.models.inouts.dif_balance import DifBalanceMonth
 from core.models.inouts.disabled_coin import DisabledCoin
@@ -18,8 +23,10 @@ from core.models.inouts.sci import PayGateTopup
 from core.models.inouts.transaction import TRANSACTION_PENDING
 from core.models.inouts.withdrawal import CREATED
 from core.models.inouts.withdrawal import WithdrawalRequest
+from core.models.orders import Order
 from core.serializers.orders import ExchangeRequestSerializer
 from core.withdrawal_processor import SCIPayoutsProcessor
+from lib.batch import chunks
 from lib.helpers import to_decimal, pretty_decimal
 from lib.orders_helper import get_cost_and_price
 from lib.utils import memcache_lock
@@ -101,15 +108,38 @@ def process_withdrawal_requests():
             SCIPayoutsProcessor().start()
 
 
+DIF_BALANCE_MODELS = {
+    '1d': DifBalance,
+    '1m': DifBalanceMonth,
+}
+
+
 @shared_task
 def calculate_dif_balances(period='1d'):
+    """
+    Splits users into id ranges processed in parallel, all ranges share snapshot time
+    """
     lock_id = 'dif_balance'
     with memcache_lock(lock_id, lock_id, expire=10 * 60) as acquired:
         if acquired:
-            if period == '1d':
-                DifBalance.process()
-            elif period == '1m':
-                DifBalanceMonth.process()
+            if period not in DIF_BALANCE_MODELS:
+                return
+            current_time = timezone.now()
+            user_ids = Balance.objects.aggregate(start=Min('user_id'), stop=Max('user_id'))
+            if user_ids['start'] is None:
+                return
+
+            step = (user_ids['stop'] - user_ids['start']) // settings.DIF_BALANCE_WORKERS + 1
+            for start in range(user_ids['start'], user_ids['stop'] + 1, step):
+                calculate_dif_balances_range.apply_async(
+                    args=(period, start, start + step, current_time),
+                    queue='stats',
+                )
+
+
+@shared_task
+def calculate_dif_balances_range(period, start_user_id, stop_user_id, current_time):
+    DIF_BALANCE_MODELS[period].process(start_user_id, stop_user_id, current_time)
 
 
 @shared_task
@@ -124,6 +154,52 @@ def clean_old_difbalances():
     log.info(f'{count} difbalance entries with 0 difference will be cleaned')
 
 
+@shared_task
+def reconcile_amount_in_orders(fix=None):
+    """
+    Compares incrementally tracked amount_in_orders with holds of opened orders and reports drift
+    """
+    fix = settings.IN_ORDERS_RECONCILE_FIX if fix is None else fix
+    lock_id = 'reconcile_amount_in_orders'
+    with memcache_lock(lock_id, lock_id, expire=10 * 60) as acquired:
+        if not acquired:
+            return
+
+        user_ids = Balance.objects.filter(
+            ~Q(amount_in_orders=0) | Q(user__order__state=Order.STATE_OPENED),
+        ).values_list('user_id', flat=True).distinct().order_by('user_id')
+
+        drifted = 0
+        for users_chunk in chunks(user_ids.iterator(), settings.IN_ORDERS_RECONCILE_BATCH_SIZE):
+            with atomic():
+                # balances are locked first, so order changes in progress can't slip between reads
+                balances = list(Balance.objects.select_for_update().filter(
+                    user_id__in=users_chunk,
+                ).only('id', 'user_id', 'currency', 'amount_in_orders'))
+                in_orders = Order.get_balances_in_orders(users_chunk)
+
+                for balance in balances:
+                    expected = in_orders.get((balance.user_id, balance.currency.id), to_decimal(0))
+                    diff = to_decimal(balance.amount_in_orders - expected)
+                    if diff == 0:
+                        continue
+
+                    drifted += 1
+                    log.warning(
+                        'amount_in_orders drift: user %s, %s: %s, expected %s, diff %s',
+                        balance.user_id,
+                        balance.currency,
+                        pretty_decimal(balance.amount_in_orders, 8),
+                        pretty_decimal(expected, 8),
+                        pretty_decimal(diff, 8),
+                    )
+                    if fix:
+                        Balance.objects.filter(id=balance.id).update(amount_in_orders=expected)
+
+        log.info('amount_in_orders reconciliation done, %s balances drifted', drifted)
+        return drifted
+
+
 @shared_task
 def send_withdrawal_confirmation_email(withdrawal_request_id):
     withdrawal_request = WithdrawalRequest.objects.filter(id=withdrawal_request_id).first()
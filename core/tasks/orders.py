@@ -5,8 +5,6 @@ import requests
 from celery import shared_task
 from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.contrib.postgres.aggregates import ArrayAgg
-from django.contrib.postgres.fields.jsonb import KeyTextTransform
 from django.contrib.sites.models import Site
 from django.core import serializers
 from django.core.mail import send_mail
@@ -20,10 +18,10 @@ from core.cache import orders_app_cache
 from core.consts.currencies import ALL_CURRENCIES
 from core.consts.orders import STOP_LIMIT
 from core.currency import Currency
-from core.orderbook.helpers import get_stack_by_pair
+from core.orderbook.helpers import get_stack_snapshot
 from core.models import PairSettings
 from core.models.facade import Profile
-from core.models.inouts.transaction import REASON_FEE_TOPUP, REASON_ORDER_EXTRA_CHARGE, REASON_ORDER_CHARGE_RETURN
+from core.models.inouts.transaction import REASON_FEE_TOPUP
 from core.models.inouts.transaction import TRANSACTION_COMPLETED
 from core.models.inouts.transaction import Transaction
 from core.models.orders import ExecutionResult
@@ -33,7 +31,9 @@ from core.models.inouts.pair import Pair
 from core.serializers.orders import OrderSerializer, ExecutionResultApiSerializer
 from core.stack_processor import StackProcessor
 from core.utils.cleanup_utils import get_orders_to_delete_ids, strip_orders
+from core.utils.cleanup_utils import collapse_extra_transactions
 from core.utils.cleanup_utils import get_transactions_to_delete_ids, strip_transactions
+from core.utils.partitions import cleanup_before
 from core.utils.stats.daily import get_pairs_24h_stats
 from exchange.notifications import pairs_volume_notificator
 from lib.backup_utils import finish_backup
@@ -120,16 +120,19 @@ def stop_limit_order_wrapped(data):
 
 @shared_task
 def stop_limit_processor(data):
+    """
+    Places stop limit orders triggered by the last match of the order.
+    Stack worker triggers stop limits itself (OrderBook.stop_limits), task is kept for queued messages
+    """
     stack_processor: StackProcessor = StackProcessor.get_instance()
     order: Order = stack_processor.get_order_from_json(data)
     log.info(f'stop_limit_processor: %s' % order)
 
     matched: ExecutionResult = order.executionresult_set.last()
     if matched:
-        stacks = get_stack_by_pair(matched.pair.code)
+        snapshot = get_stack_snapshot(matched.pair.code)
         if order.operation == order.OPERATION_SELL:
-            stack = stacks.get('buys', [])
-            ids = [i['id'] for i in stack]
+            ids = snapshot.column('buys', 'id') if snapshot else []
 
             orders = Order.objects.exclude(
                 pk__in=ids
@@ -142,8 +145,7 @@ def stop_limit_processor(data):
                 operation=order.OPERATION_BUY,
             ).all()
         else:
-            stack = stacks.get('sells', [])
-            ids = [i['id'] for i in stack]
+            ids = snapshot.column('sells', 'id') if snapshot else []
 
             orders = Order.objects.exclude(
                 pk__in=ids
@@ -311,9 +313,7 @@ def bot_matches_cleanup(only_backup=False):
 def cleanup_old_order_changes():
     log.info('Cleanup old orders changes history')
     month_ago = timezone.now() - datetime.timedelta(days=30)
-    res = OrderChangeHistory.objects.filter(
-        created__lt=month_ago,
-    ).delete()
+    res = cleanup_before(OrderChangeHistory.objects.all(), month_ago)
     if res:
         log.info(f'{res[0]} user change items deleted')
 
@@ -321,58 +321,5 @@ def cleanup_old_order_changes():
 @shared_task()
 def cleanup_extra_transactions():
     """Collapse update order transaction to one transaction"""
-    ts_start = timezone.now()
     ago = timezone.now() - datetime.timedelta(days=3)
-
-    #  aggreggates transactions by order_id
-    grouped_extra_transactions = Transaction.objects.filter(
-        state=TRANSACTION_COMPLETED,
-        reason__in=(
-            REASON_ORDER_EXTRA_CHARGE,
-            REASON_ORDER_CHARGE_RETURN,
-        ),
-        created__lt=ago,
-    ).annotate(
-        oid=KeyTextTransform('order_id', 'data')
-    ).values('oid').annotate(
-        summ=Sum('amount'),
-        tx_ids=ArrayAgg('id')
-    ).values(
-        'oid', 'summ', 'tx_ids'
-    ).order_by('oid')
-
-    log.info(f'query time: %s' % (timezone.now() - ts_start))
-
-    for_start = timezone.now()
-    count_tr: int = 0
-    count_or: int = 0
-
-    for entry in grouped_extra_transactions:
-        order_start = timezone.now()
-        tr_list = entry['tx_ids']
-        order_id = int(entry['oid'])
-        if len(tr_list) <= 1:
-            continue
-
-        first_tx_id = tr_list[0]
-        to_delete_tx_ids = tr_list[1:]
-        sum_amount = entry['summ']
-
-        reason = REASON_ORDER_CHARGE_RETURN if sum_amount > 0 else REASON_ORDER_EXTRA_CHARGE
-        with atomic():
-            # Update only first tx in group
-            Transaction.objects.filter(id=first_tx_id).update(reason=reason, amount=sum_amount)
-            deleted_count = len(to_delete_tx_ids)
-
-            # delete other group txs
-            q = Transaction.objects.filter(pk__in=to_delete_tx_ids)
-            q.delete()
-            log.info(f'==order id: {order_id}, time: {timezone.now() - order_start}, deleted txs: {deleted_count}')
-            count_or += 1
-            log.info(f'Checked {count_or}/{len(grouped_extra_transactions)}')
-
-    log.info(f'for time: %s' % (timezone.now() - for_start))
-
-    log.info(f'count orders: %s' % (count_or))
-    log.info(f'count transactions: %s' % (count_tr))
-    log.info(f'Duration: %s' % (timezone.now() - ts_start))
+    collapse_extra_transactions(ts_before=ago)
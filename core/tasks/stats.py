@@ -25,6 +25,10 @@ from core.models.stats import TradesAggregatedStats
 from core.models.stats import UserPairDailyStat
 from core.models.inouts.pair import Pair
 from core.tasks.orders import run_otc_orders_price_update
+from core.utils.partitions import PARTITIONED_TABLES
+from core.utils.partitions import cleanup_before
+from core.utils.partitions import create_partitions
+from core.utils.partitions import is_partitioned
 from core.utils.stats.trades_aggregate import TradesAggregator
 from lib.batch import BatchProcessor
 from lib.batch import chunks
@@ -121,26 +125,26 @@ def update_cryptocompare_pairs_price_cache():
 
 
 @shared_task
-def plan_trades_aggregation(period):
+def plan_trades_aggregation(period=None):
+    """Aggregates trades of all periods, period argument is left for already scheduled tasks"""
     if not settings.PLAN_TRADES_STATS_AGGRREGATION:
         return
     for pair in Pair.objects.all():
         if DisabledCoin.is_coin_disabled(pair.base.code) or DisabledCoin.is_coin_disabled(pair.quote.code):
             continue
-        do_trades_aggregation_for_pair.apply_async((pair, period))
+        do_trades_aggregation_for_pair.apply_async((pair,))
 
 
 @shared_task
-def do_trades_aggregation_for_pair(pair, period):
-    TradesAggregator(pair, period).start()
+def do_trades_aggregation_for_pair(pair, period=None):
+    """Minute candles of closed minutes, hour and day candles of closed hours and days"""
+    TradesAggregator.aggregate_pair(pair)
 
 
 @shared_task
 def cleanup_old_prices_history():
     week_ago = timezone.now() - datetime.timedelta(days=7)
-    res = ExternalPricesHistory.objects.filter(
-        created__lt=week_ago,
-    ).delete()
+    cleanup_before(ExternalPricesHistory.objects.all(), week_ago)
 
 
 @shared_task
@@ -161,6 +165,13 @@ def vacuum_database():
         cursor.execute('VACUUM (ANALYZE, FULL);')
 
 
+@shared_task
+def create_future_partitions():
+    for table in PARTITIONED_TABLES:
+        if is_partitioned(table):
+            create_partitions(table)
+
+
 @shared_task
 def fill_inout_coin_stats():
     from core.models.stats import InoutsStats
@@ -1,3 +1,665 @@
-from django.test import TestCase
+from datetime import datetime
+from datetime import timedelta
+from datetime import timezone
+from decimal import Decimal
+from types import SimpleNamespace
 
-# Create your tests here.
+import pytest
+import simplejson
+from django.contrib.auth import get_user_model
+from django.db import IntegrityError
+from django.db import connection
+from django.db.transaction import atomic
+from django.utils import timezone as dj_timezone
+
+from core.consts.orders import BUY
+from core.consts.orders import LIMIT
+from core.consts.orders import ORDER_CLOSED
+from core.consts.orders import ORDER_OPENED
+from core.consts.orders import SELL
+from core.management.commands.rebuild_trades_stats import Command as RebuildTradesStatsCommand
+from core.models.inouts.balance import Balance
+from core.models.inouts.pair import Pair
+from core.models.inouts.pair_settings import PairSettings
+from core.models.inouts.transaction import REASON_ORDER_CACHEBACK
+from core.models.inouts.transaction import REASON_ORDER_EXECUTED
+from core.models.inouts.transaction import Transaction
+from core.models.orders import ExecutionResult
+from core.models.orders import Order
+from core.models.orders import SettledSequence
+from core.models.stats import TradesAggregatedStats
+from core.models.stats import TradesAggregationWatermark
+from core.orderbook.helpers import diff_levels
+from core.orderbook.helpers import group_stack_side
+from core.orderbook.settlement import Settlement
+from core.orderbook.stack import ASC
+from core.orderbook.stack import BaseStack
+from core.orderbook.stack import DESC
+from core.orderbook.snapshot import StackSnapshot
+from core.orderbook.snapshot import encode_stack
+from core.orderbook.stack import PriceLevelStack
+from core.orderbook.stops import StopLimitIndex
+from core.orderbook.structs import Fill
+from core.orderbook.structs import FillSide
+from core.tasks import orders as orders_tasks
+from core.utils.partitions import PARTITIONED_TABLES
+from core.utils.partitions import convert_to_partitioned
+from core.utils.partitions import get_partitions
+from core.utils.partitions import is_partitioned
+from core.utils.partitions import next_month
+from core.utils.stats import trades_aggregate
+from core.utils.stats.candles import PairCandles
+from core.utils.stats.rolling import PairRollingStats
+from core.utils.stats.rolling import WINDOW
+from core.utils.stats.trades_aggregate import TradesAggregator
+from lib.cache import redis_client
+
+User = get_user_model()
+
+
+def make_order(id, price, quantity):
+    return SimpleNamespace(id=id, price=Decimal(price), quantity_left=Decimal(quantity))
+
+
+class TestPriceLevelStack:
+
+    def fill(self, stack):
+        orders = [
+            make_order(3, '10', '1'),
+            make_order(1, '11', '2'),
+            make_order(2, '10', '3'),
+            make_order(4, '12', '0.5'),
+        ]
+        for order in orders:
+            stack.add(order)
+        return orders
+
+    def test_same_order_as_base_stack(self):
+        for direction in (ASC, DESC):
+            levels, base = PriceLevelStack(direction), BaseStack(direction)
+            self.fill(levels)
+            self.fill(base)
+            assert [i.id for i in levels] == [i.id for i in base]
+            assert [i.id for i in levels[:2]] == [i.id for i in base[:2]]
+            assert levels.top_price == base.top_price
+
+    def test_running_totals(self):
+        stack = PriceLevelStack(ASC)
+        orders = self.fill(stack)
+        assert stack.volume == Decimal('6.5')
+        assert stack.notional == Decimal('68')
+        assert list(stack.depth(1)) == [(Decimal('10'), Decimal('4'), 2)]
+
+        # partial fill of order from stack
+        orders[0].quantity_left = Decimal('0.25')
+        stack.update(orders[0])
+        assert stack.volume == Decimal('5.75')
+        assert list(stack.depth(1)) == [(Decimal('10'), Decimal('3.25'), 2)]
+
+        stack.remove(orders[0])
+        stack.remove(orders[2])
+        assert stack.top_price == Decimal('11')
+        assert len(stack) == 2
+        assert stack.notional == Decimal('28')
+
+
+class TestStackSnapshot:
+
+    def make_stack(self, price, quantity):
+        return {
+            'pair': 'BTC-USDT',
+            'last_id': 5,
+            'sells': [
+                {'id': 1, 'price': price, 'quantity': quantity, 'user_id': 7, 'timestamp': 1.5, 'depth': quantity},
+                {'id': 2, 'price': price + 1, 'quantity': Decimal('0.5'), 'user_id': 8, 'timestamp': 2.5,
+                 'depth': quantity + Decimal('0.5')},
+            ],
+            'buys': [],
+        }
+
+    def assert_round_trip(self, data):
+        snapshot = StackSnapshot(encode_stack(data))
+        result = snapshot.to_dict()
+        assert result['last_id'] == 5
+        assert result['buys'] == []
+        for entry, expected in zip(result['sells'], data['sells']):
+            assert entry['id'] == expected['id']
+            assert entry['user_id'] == expected['user_id']
+            for name in ('price', 'quantity', 'depth'):
+                assert entry[name] == float(expected[name])
+        assert len(snapshot.to_dict(sell_limit=1)['sells']) == 1
+
+    def test_round_trip(self):
+        self.assert_round_trip(self.make_stack(Decimal('27000.12345678'), Decimal('1.25')))
+
+    def test_values_out_of_int64(self):
+        # high supply tokens quantities do not fit int64 after scaling
+        self.assert_round_trip(self.make_stack(Decimal('0.00000001'), Decimal('123456789012345678.5')))
+
+
+class TestDiffLevels:
+
+    def test_diff_levels(self):
+        old = {'10': '1', '11': '2', '12': '3'}
+        new = {'10': '1', '11': '2.5', '13': '1'}
+        assert sorted(diff_levels(old, new)) == [['11', '2.5'], ['12', 0], ['13', '1']]
+        assert diff_levels(new, new) == []
+
+
+class TestGroupStackSide:
+
+    def entries(self):
+        # sorted from the top of the stack
+        return [
+            {'id': 1, 'price': Decimal('10.26'), 'quantity': Decimal('1'), 'user_id': 7, 'timestamp': 1},
+            {'id': 2, 'price': Decimal('10.21'), 'quantity': Decimal('2'), 'user_id': 8, 'timestamp': 2},
+            {'id': 3, 'price': Decimal('9.5'), 'quantity': Decimal('4'), 'user_id': 7, 'timestamp': 3},
+        ]
+
+    def test_bids(self):
+        grouped = group_stack_side('test-bids', 'buys', self.entries(), ['0.1', '1'], is_bid=True)
+        assert [i[:4] for i in grouped['0.1']] == [
+            (Decimal('10.2'), Decimal('3'), (7, 8), (1, 2)),
+            (Decimal('9.5'), Decimal('4'), (7,), (3,)),
+        ]
+        # depth is accumulated from the lowest price
+        assert [(i[0], i[5]) for i in grouped['1']] == [(Decimal('10'), Decimal('7')), (Decimal('9'), Decimal('4'))]
+
+    def test_asks(self):
+        entries = self.entries()[::-1]
+        grouped = group_stack_side('test-asks', 'sells', entries, ['0.1'], is_bid=False)
+        assert [(i[0], i[1], i[4], i[5]) for i in grouped['0.1']] == [
+            (Decimal('10.3'), Decimal('3'), 1, Decimal('7')),
+            (Decimal('9.5'), Decimal('4'), 3, Decimal('4')),
+        ]
+
+    def test_cached_until_changed(self):
+        entries = self.entries()
+        grouped = group_stack_side('test-cache', 'buys', entries, ['1'], is_bid=True)
+        assert group_stack_side('test-cache', 'buys', self.entries(), ['1'], is_bid=True) is grouped
+
+        entries[0]['quantity'] = Decimal('0.5')
+        regrouped = group_stack_side('test-cache', 'buys', entries, ['1'], is_bid=True)
+        assert regrouped is not grouped
+        assert regrouped['1'][0][1] == Decimal('2.5')
+
+
+def make_stop_order(id, operation, stop):
+    return SimpleNamespace(id=id, operation=operation, stop=Decimal(stop))
+
+
+class TestStopLimitIndex:
+
+    def test_pop_triggered(self):
+        index = StopLimitIndex()
+        for order in [
+            make_stop_order(1, BUY, '105'),
+            make_stop_order(2, BUY, '110'),
+            make_stop_order(3, BUY, '100'),
+            make_stop_order(4, SELL, '95'),
+            make_stop_order(5, SELL, '90'),
+        ]:
+            index.add(order)
+        assert len(index) == 5
+
+        # buys by trade price >= stop, sells by trade price <= stop
+        assert sorted(index.pop_triggered(Decimal('96'), Decimal('105'))) == [1, 3]
+        assert index.pop_triggered(Decimal('96'), Decimal('105')) == []
+        assert sorted(index.pop_triggered(Decimal('90'), Decimal('90'))) == [4, 5]
+        assert list(index.orders) == [2]
+
+    def test_update_and_remove(self):
+        index = StopLimitIndex()
+        order = make_stop_order(1, BUY, '105')
+        index.add(order)
+
+        # changed stop replaces the entry
+        order.stop = Decimal('120')
+        index.add(order)
+        assert len(index) == 1
+        assert index.pop_triggered(Decimal('100'), Decimal('110')) == []
+
+        index.remove(order)
+        index.remove(order)
+        assert 1 not in index
+        assert index.pop_triggered(Decimal('0'), Decimal('1000')) == []
+
+
+class TestPairCandles:
+
+    def test_candles(self):
+        candles = PairCandles('BTC-USDT')
+        start = 1_700_000_000 // 86400 * 86400
+        candles.add_trade('10', '1', start + 5)
+        candles.add_trade('12', '2', start + 30)
+        candles.add_trade('9', '1', start + 61)
+        candles.add_trade('11', '0', start + 62)
+
+        closed = candles.closed['minute'][0].to_dict()
+        assert closed['ts'] == datetime.fromtimestamp(start, tz=timezone.utc)
+        assert (closed['open_price'], closed['max_price'], closed['min_price'], closed['close_price']) == (
+            Decimal('10'), Decimal('12'), Decimal('10'), Decimal('12'))
+        assert closed['amount'] == Decimal('3')
+        assert closed['volume'] == Decimal('34')
+        assert candles.open['minute'].ts == start + 60
+
+        hour = candles.open['hour'].to_dict()
+        assert hour['num_trades'] == 3
+        assert (hour['min_price'], hour['close_price']) == (Decimal('9'), Decimal('9'))
+        assert candles.closed['hour'] == []
+
+    def test_roll(self):
+        candles = PairCandles('BTC-USDT')
+        candles.KEEP_CLOSED = 2
+        start = 1_700_000_000 // 60 * 60
+        for minute in range(4):
+            candles.add_trade('10', '1', start + minute * 60)
+
+        candles.roll('minute', start + 3 * 60 + 59)
+        assert candles.open['minute'] is not None
+        candles.roll('minute', start + 4 * 60)
+        assert candles.open['minute'] is None
+        assert [i.ts for i in candles.closed['minute']] == [start + 2 * 60, start + 3 * 60]
+
+
+class TestPairRollingStats:
+
+    def test_window(self):
+        stats = PairRollingStats('BTC-USDT')
+        assert stats.to_dict()['price'] is None
+
+        start = 1_700_000_000 // 60 * 60
+        stats.add_trade('10', '1', start)
+        stats.add_trade('12', '2', start + 30)
+        stats.add_trade('8', '1', start + 60)
+        assert stats.to_dict() == {
+            'volume': Decimal('42'),
+            'base_volume': Decimal('4'),
+            'high': Decimal('12'),
+            'low': Decimal('8'),
+            'open': Decimal('10'),
+            'price': Decimal('8'),
+            'price_24h_ago': None,
+        }
+
+        # the first minute leaves the window
+        stats.expire(start + (WINDOW + 1) * 60)
+        result = stats.to_dict()
+        assert (result['volume'], result['base_volume']) == (Decimal('8'), Decimal('1'))
+        assert (result['open'], result['price_24h_ago']) == (Decimal('8'), Decimal('12'))
+
+        stats.expire(start + (WINDOW + 2) * 60)
+        assert stats.to_dict()['volume'] is None
+        assert stats.to_dict()['price'] == Decimal('8')
+
+
+class FakeStatsQuerySet:
+
+    def __init__(self, rows):
+        self.rows = rows
+
+    def filter(self, **kwargs):
+        return self
+
+    def order_by(self, *args):
+        return self
+
+    def values(self, *args):
+        return self
+
+    def iterator(self):
+        return iter(self.rows)
+
+
+def make_stats_row(ts, price, num_trades):
+    price = Decimal(price)
+    return {
+        'ts': ts,
+        'min_price': price - 1,
+        'max_price': price + 1,
+        'avg_price': price,
+        'open_price': price,
+        'close_price': price + Decimal('0.5'),
+        'volume': price * 2,
+        'amount': Decimal('2'),
+        'num_trades': num_trades,
+        'fee_base': Decimal('0.01'),
+        'fee_quoted': Decimal('0.02'),
+    }
+
+
+class TestTradesAggregatorRollup:
+
+    def rollup(self, monkeypatch, period, rows):
+        monkeypatch.setattr(
+            trades_aggregate.TradesAggregatedStats, 'objects', SimpleNamespace(filter=FakeStatsQuerySet(rows).filter)
+        )
+        # pair lookup needs db
+        aggregator = TradesAggregator.__new__(TradesAggregator)
+        aggregator.period = period
+        aggregator.pair = SimpleNamespace(id=1)
+        return list(aggregator.rollup(None, None))
+
+    def test_hours_from_minutes(self, monkeypatch):
+        hour = datetime(2023, 11, 14, 10, tzinfo=timezone.utc)
+        rows = [
+            make_stats_row(hour.replace(minute=0), '10', 1),
+            make_stats_row(hour.replace(minute=59), '13', 3),
+            make_stats_row(hour.replace(hour=11, minute=5), '20', 0),
+        ]
+
+        result = self.rollup(monkeypatch, 'hour', rows)
+
+        assert [i['ts'] for i in result] == [hour, hour.replace(hour=11)]
+        first = result[0]
+        assert first['pair_id'] == 1
+        assert (first['open_price'], first['close_price']) == (Decimal('10'), Decimal('13.5'))
+        assert (first['min_price'], first['max_price']) == (Decimal('9'), Decimal('14'))
+        # average is weighted by trades
+        assert first['avg_price'] == Decimal('12.25')
+        assert first['num_trades'] == 4
+        assert (first['volume'], first['amount']) == (Decimal('46'), Decimal('4'))
+        assert (first['fee_base'], first['fee_quoted']) == (Decimal('0.02'), Decimal('0.04'))
+        # candle without trades keeps plain average
+        assert result[1]['avg_price'] == Decimal('20')
+
+    def test_days_from_hours(self, monkeypatch):
+        day = datetime(2023, 11, 14, tzinfo=timezone.utc)
+        rows = [make_stats_row(day.replace(hour=h), '10', 1) for h in (0, 12, 23)]
+        rows.append(make_stats_row(day.replace(day=15), '11', 1))
+
+        result = self.rollup(monkeypatch, 'day', rows)
+
+        assert [(i['ts'], i['num_trades']) for i in result] == [(day, 3), (day.replace(day=15), 1)]
+
+
+@pytest.mark.django_db
+class TestRebuildTradesStatsWatermark:
+
+    def move(self, ts):
+        pair = Pair.get('BTC-USDT')
+        period = TradesAggregatedStats.PERIODS['hour']
+        TradesAggregationWatermark.objects.update_or_create(pair=pair, period=period, defaults={'ts': ts})
+        start = datetime(2023, 11, 10, tzinfo=timezone.utc)
+        RebuildTradesStatsCommand().move_watermark(pair, 'hour', start, start + timedelta(days=5))
+        return TradesAggregationWatermark.objects.get(pair=pair, period=period).ts
+
+    def test_move_watermark(self):
+        stop = datetime(2023, 11, 15, tzinfo=timezone.utc)
+        assert self.move(None) == stop
+        assert self.move(datetime(2023, 11, 10, tzinfo=timezone.utc)) == stop
+        assert self.move(datetime(2023, 11, 12, tzinfo=timezone.utc)) == stop
+        assert self.move(datetime(2023, 11, 20, tzinfo=timezone.utc)) == datetime(2023, 11, 20, tzinfo=timezone.utc)
+        # gap before the rebuilt range is left for regular aggregation
+        assert self.move(datetime(2023, 11, 1, tzinfo=timezone.utc)) == datetime(2023, 11, 1, tzinfo=timezone.utc)
+
+
+def make_fill_side(order, matched, quantity, price):
+    return FillSide(
+        order_id=order.id,
+        user_id=order.user_id,
+        pair_id=order.pair_id,
+        operation=order.operation,
+        type=order.type,
+        matched_order_id=matched.id,
+        matched_order_price=matched.price,
+        price=price,
+        quantity=quantity,
+        fee_rate=Decimal('0.001'),
+        fee_amount=quantity * Decimal('0.001'),
+        executed_currency=1,
+        executed_amount=quantity * Decimal('0.999'),
+        cacheback_currency=None,
+        cacheback_amount=None,
+        hold_currency=2,
+        hold_amount=quantity * price,
+        prev_state=0,
+        state=0,
+        quantity_left=order.quantity_left - quantity,
+        order_quantity=order.quantity_left,
+        order_price=order.price,
+        cost=None,
+    )
+
+
+class FakeMatchOrder(SimpleNamespace):
+    """
+    Order of the stack worker without db access
+    """
+
+    def determine_price(self, order):
+        return order.price
+
+    def can_execute_in_memory(self, quantity, price):
+        return self.in_memory
+
+    def execute_in_memory(self, matched, quantity, price):
+        return make_fill_side(self, matched, quantity, price)
+
+
+def make_match_order(id, operation, price, quantity, in_memory=True):
+    return FakeMatchOrder(
+        id=id,
+        user_id=id * 10,
+        pair_id=1,
+        operation=operation,
+        type=LIMIT,
+        price=Decimal(price),
+        quantity_left=Decimal(quantity),
+        in_memory=in_memory,
+    )
+
+
+class TestSettlement:
+
+    @pytest.fixture
+    def settlement(self):
+        settlement = Settlement(SimpleNamespace(pair='test-settlement'))
+        settlement.BATCH_SIZE = 100
+        redis_client.delete(settlement.journal_key)
+        yield settlement
+        redis_client.delete(settlement.journal_key)
+
+    def test_fill_journaled(self, settlement):
+        taker = make_match_order(1, BUY, '101', '2')
+        maker = make_match_order(2, SELL, '100', '0.5')
+
+        assert settlement.execute(taker, maker)
+        assert settlement.execute(make_match_order(3, BUY, '100', '1'), maker)
+
+        fills = [Fill.from_dict(simplejson.loads(i)) for i in redis_client.lrange(settlement.journal_key, 0, -1)]
+        assert fills == settlement.fills
+        assert [i.seq for i in fills] == [1, 2]
+        fill = fills[0]
+        # maker price, quantity of the smaller order
+        assert (fill.taker.price, fill.taker.quantity) == (Decimal('100'), Decimal('0.5'))
+        assert fill.taker.quantity_left == Decimal('1.5')
+        assert fill.maker.quantity_left == Decimal('0')
+        assert (fill.taker.matched_order_id, fill.maker.matched_order_id) == (2, 1)
+
+    def test_not_in_memory(self, settlement):
+        taker = make_match_order(1, BUY, '101', '2')
+        maker = make_match_order(2, SELL, '100', '0.5', in_memory=False)
+
+        assert not settlement.execute(taker, maker)
+        assert settlement.fills == []
+        assert settlement.seq == 0
+        assert redis_client.llen(settlement.journal_key) == 0
+
+    def test_fill_side_round_trip(self):
+        taker = make_match_order(1, BUY, '101', '2')
+        side = make_fill_side(taker, make_match_order(2, SELL, '100', '1'), Decimal('1'), Decimal('100'))
+        assert FillSide.from_dict(simplejson.loads(simplejson.dumps(side.to_dict()))) == side
+
+
+@pytest.mark.django_db
+class TestSettlementPersist:
+
+    @pytest.fixture(autouse=True)
+    def setup(self, settings, monkeypatch):
+        settings.ORDER_LIMIT = False
+        self.pair = Pair.get('BTC-USDT')
+        PairSettings.objects.update_or_create(pair=self.pair, defaults={'is_enabled': True, 'deviation': 0})
+        self.seller = User.objects.create_user(username='seller@test.local', email='seller@test.local')
+        self.buyer = User.objects.create_user(username='buyer@test.local', email='buyer@test.local')
+        for user in (self.seller, self.buyer):
+            for currency in (self.pair.base, self.pair.quote):
+                Balance.objects.update_or_create(user=user, currency=currency, defaults={'amount': 1000})
+
+        # settled orders are matched by the test, not by the stack worker
+        monkeypatch.setattr(orders_tasks.place_order, 'apply_async', lambda *args, **kwargs: None)
+        self.after_settle = []
+        monkeypatch.setattr(Settlement, 'after_settle', lambda _, *args: self.after_settle.append(args))
+
+        self.book = SimpleNamespace(pair='btc-usdt')
+        redis_client.delete(Settlement(self.book).journal_key)
+        yield
+        redis_client.delete(Settlement(self.book).journal_key)
+
+    def make_order(self, user, operation, price, quantity):
+        order = Order(
+            user=user,
+            pair=self.pair,
+            operation=operation,
+            type=LIMIT,
+            price=Decimal(price),
+            quantity=Decimal(quantity),
+        )
+        order.save()
+        return order
+
+    def balances(self):
+        return {
+            (i.user_id, i.currency.id): (i.amount, i.amount_in_orders)
+            for i in Balance.objects.filter(user__in=[self.seller, self.buyer])
+        }
+
+    def match(self, settlement):
+        sell = self.make_order(self.seller, SELL, '100', '1')
+        buy = self.make_order(self.buyer, BUY, '101', '2')
+        balances = self.balances()
+        assert settlement.execute(buy, sell)
+        return balances, settlement.fills[0]
+
+    def assert_settled(self, balances, fill):
+        assert SettledSequence.get_seq(self.pair.id) == fill.seq
+        assert redis_client.llen(Settlement(self.book).journal_key) == 0
+        assert ExecutionResult.objects.filter(pair=self.pair).count() == 2
+        assert Transaction.objects.filter(reason=REASON_ORDER_EXECUTED, user__in=[self.seller, self.buyer]).count() == 2
+
+        sell = Order.objects.get(id=fill.maker.order_id)
+        buy = Order.objects.get(id=fill.taker.order_id)
+        assert (sell.state, sell.quantity_left, sell.executed) == (ORDER_CLOSED, Decimal('0'), True)
+        assert (buy.state, buy.quantity_left, buy.executed) == (ORDER_OPENED, Decimal('1'), True)
+
+        base, quote = self.pair.base.id, self.pair.quote.id
+        seller, buyer = self.seller.id, self.buyer.id
+        taker, maker = fill.taker, fill.maker
+        # taker buys at maker price, price difference of the hold is returned as cacheback
+        assert taker.cacheback_amount == Decimal('1')
+        assert Transaction.objects.get(reason=REASON_ORDER_CACHEBACK).amount == Decimal('1')
+
+        expected = dict(balances)
+        amount, in_orders = balances[(seller, base)]
+        expected[(seller, base)] = (amount, in_orders - Decimal('1'))
+        amount, in_orders = balances[(seller, quote)]
+        expected[(seller, quote)] = (amount + maker.executed_amount, in_orders)
+        amount, in_orders = balances[(buyer, quote)]
+        expected[(buyer, quote)] = (amount + Decimal('1'), in_orders - Decimal('101'))
+        amount, in_orders = balances[(buyer, base)]
+        expected[(buyer, base)] = (amount + taker.executed_amount, in_orders)
+        assert self.balances() == expected
+
+    def test_persist(self):
+        settlement = Settlement(self.book)
+        balances, fill = self.match(settlement)
+
+        settlement.settle()
+
+        assert settlement.fills == []
+        self.assert_settled(balances, fill)
+        [(fills, execution_results)] = self.after_settle
+        assert fills == [fill]
+        assert sorted(i.order_id for i in execution_results) == sorted([fill.taker.order_id, fill.maker.order_id])
+
+    def test_failed_persist_keeps_fills(self, monkeypatch):
+        settlement = Settlement(self.book)
+        balances, fill = self.match(settlement)
+
+        def fail(fills):
+            raise RuntimeError('db is down')
+
+        monkeypatch.setattr(settlement, 'persist', fail)
+        with pytest.raises(RuntimeError):
+            settlement.settle()
+        assert settlement.fills == [fill]
+        assert redis_client.llen(settlement.journal_key) == 1
+
+        monkeypatch.undo()
+        settlement.settle()
+        self.assert_settled(balances, fill)
+
+    def test_replay_after_restart(self):
+        balances, fill = self.match(Settlement(self.book))
+
+        # worker is restarted before settling the buffered fill
+        settlement = Settlement(self.book)
+        settlement.replay()
+
+        assert settlement.seq == fill.seq
+        self.assert_settled(balances, fill)
+
+    def test_replay_of_persisted_fills(self):
+        settlement = Settlement(self.book)
+        balances, fill = self.match(settlement)
+        # worker is stopped after commit, before the journal is trimmed
+        settlement.persist(settlement.fills)
+
+        settlement = Settlement(self.book)
+        settlement.replay()
+
+        # fills with settled sequence are not applied twice
+        self.assert_settled(balances, fill)
+        assert len(self.after_settle) == 0
+
+
+@pytest.mark.django_db
+class TestConvertToPartitioned:
+
+    def constraints(self, table, contype):
+        with connection.cursor() as cursor:
+            cursor.execute("""
+                select pg_get_constraintdef(oid) from pg_constraint
+                where conrelid = %s::regclass and contype = %s
+            """, [table, contype])
+            return sorted(row[0] for row in cursor.fetchall())
+
+    def test_convert(self):
+        foreign_keys = self.constraints('core_executionresult', 'f')
+
+        # referenced tables go after referencing ones
+        for table, column in PARTITIONED_TABLES.items():
+            convert_to_partitioned(table, column)
+            assert is_partitioned(table)
+            assert get_partitions(table)
+
+        # foreign key to partitioned transactions is dropped
+        assert self.constraints('core_executionresult', 'f') == [
+            i for i in foreign_keys if 'core_transaction' not in i
+        ]
+        assert self.constraints('core_executionresult', 'u') == ['UNIQUE (order_id, matched_order_id, created)']
+
+    def test_unique_fills(self):
+        convert_to_partitioned('core_executionresult', 'created')
+        user = User.objects.create_user(username='fills@test.local', email='fills@test.local')
+        created = next_month(dj_timezone.now())
+        for _ in range(2):
+            er = ExecutionResult.objects.create(user=user, pair=Pair.get('BTC-USDT'), order_id=1, matched_order_id=2,
+                                                quantity=1)
+            # legacy partition keeps the old constraint, new rows go to monthly ones
+            with atomic():
+                ExecutionResult.objects.filter(id=er.id).update(created=created)
+            created += timedelta(seconds=1)
+
+        with pytest.raises(IntegrityError), atomic():
+            ExecutionResult.objects.filter(id=er.id).update(created=created - timedelta(seconds=2))
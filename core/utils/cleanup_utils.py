@@ -6,9 +6,13 @@ from django.db.models import Case, When, Q, F, Count, IntegerField
 from django.db.transaction import atomic
 from django.utils import timezone
 
+from core.cache import EXTRA_TRANSACTIONS_WATERMARK_CACHE_KEY
+from core.cache import orders_app_cache
 from core.consts.orders import ORDER_OPENED, ORDER_CANCELED
 from core.models import WalletHistoryItem
 from core.models.inouts.transaction import REASON_ORDER_OPENED, REASON_ORDER_EXECUTED, REASON_ORDER_CANCELED
+from core.models.inouts.transaction import REASON_ORDER_CHARGE_RETURN, REASON_ORDER_EXTRA_CHARGE
+from core.models.inouts.transaction import TRANSACTION_COMPLETED
 from core.models.inouts.transaction import Transaction
 from core.models.orders import ExecutionResult, Order, OrderChangeHistory, OrderStateChangeHistory
 from lib.backup_utils import backup_qs_to_csv
@@ -39,6 +43,45 @@ where o.id = any(%s)
 group by o.id;
 """
 
+create_extra_tx_groups_sql = """
+create temporary table extra_tx_groups as
+select
+       (data->>'order_id')::bigint as order_id,
+       min(id) as first_id,
+       sum(amount) as amount,
+       array_agg(id) as tx_ids
+from core_transaction
+where state = %(state)s
+  and reason = any(%(reasons)s)
+  and created < %(ts_before)s
+  and data ? 'order_id'
+  and (data->>'order_id')::bigint > %(watermark)s
+group by 1
+having count(*) > 1;
+create index on extra_tx_groups (order_id);
+analyze extra_tx_groups;
+"""
+
+update_extra_tx_groups_sql = """
+update core_transaction t
+set amount = g.amount,
+    reason = case when g.amount > 0 then %(return_reason)s else %(charge_reason)s end
+from extra_tx_groups g
+where t.id = g.first_id
+  and g.order_id > %(start)s and g.order_id <= %(stop)s;
+"""
+
+delete_extra_tx_groups_sql = """
+delete from core_transaction t
+using (
+    select first_id, unnest(tx_ids) as id
+    from extra_tx_groups
+    where order_id > %(start)s and order_id <= %(stop)s
+) d
+where t.id = d.id and d.id <> d.first_id;
+"""
+
+
 def get_bot_matches_qs(ts_before):
     """
     Specific function to process bot-bot matches cleanup
@@ -288,3 +331,66 @@ def strip_orders(order_ids, only_backup=False):
                 log.info('All Order count: %s', all_or)
                 log.info('All WalletHistoryItem count: %s', all_whi)
                 log.info('=' * 10)
+
+
+def collapse_extra_transactions(ts_before, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Collapses order extra charge and charge return transactions to the first one of each order.
+    Orders are processed in batches by id, the last finished one is kept as watermark,
+    so interrupted run goes on from it
+    """
+    start_time = timezone.now()
+    watermark = orders_app_cache.get(EXTRA_TRANSACTIONS_WATERMARK_CACHE_KEY) or 0
+    log.info('Collapse extra transactions after order %s', watermark)
+
+    with connection.cursor() as cursor:
+        cursor.execute('drop table if exists extra_tx_groups')
+        cursor.execute(create_extra_tx_groups_sql, {
+            'state': TRANSACTION_COMPLETED,
+            'reasons': [REASON_ORDER_EXTRA_CHARGE, REASON_ORDER_CHARGE_RETURN],
+            'ts_before': ts_before,
+            'watermark': watermark,
+        })
+        cursor.execute('select count(*), coalesce(sum(cardinality(tx_ids)), 0) from extra_tx_groups')
+        all_orders, all_txs = cursor.fetchone()
+        log.info('Orders to collapse: %s, transactions: %s, query time: %s',
+                 all_orders, all_txs, timezone.now() - start_time)
+
+        orders_count = 0
+        deleted_count = 0
+        try:
+            while True:
+                cursor.execute(
+                    'select count(*), max(order_id) from ('
+                    'select order_id from extra_tx_groups where order_id > %s order by order_id limit %s) t',
+                    [watermark, batch_size],
+                )
+                batch_orders, stop = cursor.fetchone()
+                if not batch_orders:
+                    break
+
+                params = {'start': watermark, 'stop': stop}
+                with atomic():
+                    cursor.execute(update_extra_tx_groups_sql, dict(
+                        params,
+                        return_reason=REASON_ORDER_CHARGE_RETURN,
+                        charge_reason=REASON_ORDER_EXTRA_CHARGE,
+                    ))
+                    cursor.execute(delete_extra_tx_groups_sql, params)
+                    deleted_count += cursor.rowcount
+
+                watermark = stop
+                orders_app_cache.set(EXTRA_TRANSACTIONS_WATERMARK_CACHE_KEY, watermark, timeout=None)
+                orders_count += batch_orders
+                elapsed = timezone.now() - start_time
+                log.info('Orders %s/%s, deleted txs %s/%s, %.1f orders/s',
+                         orders_count, all_orders, deleted_count, all_txs - all_orders,
+                         orders_count / max(elapsed.total_seconds(), 1))
+        finally:
+            cursor.execute('drop table if exists extra_tx_groups')
+
+    # every order is collapsed, next run starts over
+    orders_app_cache.delete(EXTRA_TRANSACTIONS_WATERMARK_CACHE_KEY)
+    log.info('Collapsed orders: %s, deleted transactions: %s, duration: %s',
+             orders_count, deleted_count, timezone.now() - start_time)
+    return orders_count, deleted_count
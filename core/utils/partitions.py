@@ -0,0 +1,205 @@
+import datetime
+import logging
+import re
+
+from django.conf import settings
+from django.db import connection
+from django.db.transaction import atomic
+from django.utils import timezone
+
+log = logging.getLogger(__name__)
+
+# table: partition key column
+PARTITIONED_TABLES = {
+    'core_executionresult': 'created',
+    'core_transaction': 'created',
+    'core_orderchangehistory': 'created',
+    'core_externalpriceshistory': 'created',
+}
+
+LEGACY_SUFFIX = '_legacy'
+PARTITION_NAME = '{table}_p{month:%Y%m}'
+PARTITION_RE = re.compile(r'_p(\d{6})$')
+
+
+def month_start(dt) -> datetime.datetime:
+    return datetime.datetime(dt.year, dt.month, 1, tzinfo=timezone.utc)
+
+
+def next_month(dt) -> datetime.datetime:
+    return month_start(month_start(dt) + datetime.timedelta(days=32))
+
+
+def is_partitioned(table) -> bool:
+    with connection.cursor() as cursor:
+        cursor.execute("""
+            select 1 from pg_partitioned_table p
+            join pg_class c on c.oid = p.partrelid
+            where c.relname = %s
+        """, [table])
+        return cursor.fetchone() is not None
+
+
+def get_partitions(table) -> list:
+    """
+    Returns monthly partitions of table as [(name, month_start)], sorted by month.
+    Rows saved before the conversion live in legacy partition, which is not returned
+    """
+    with connection.cursor() as cursor:
+        cursor.execute("""
+            select c.relname from pg_inherits i
+            join pg_class c on c.oid = i.inhrelid
+            join pg_class p on p.oid = i.inhparent
+            where p.relname = %s
+        """, [table])
+        names = [row[0] for row in cursor.fetchall()]
+
+    partitions = []
+    for name in names:
+        match = PARTITION_RE.search(name)
+        if match:
+            month = datetime.datetime.strptime(match.group(1), '%Y%m').replace(tzinfo=timezone.utc)
+            partitions.append((name, month))
+    return sorted(partitions, key=lambda i: i[1])
+
+
+def convert_to_partitioned(table, column):
+    """
+    Replaces table with the same one range partitioned by column.
+    Existing rows are not copied: old table is attached as legacy partition for everything before next month.
+    Partitioned tables need partition key in primary and unique keys, so primary key becomes (id, column)
+    and unique constraints are extended with column. Rows of the legacy partition keep the original ones,
+    new rows are unique only with their partition key, e.g. execution results by (order, matched_order, created).
+    Foreign keys of the table are created again on partitioned one.
+
+    Partitioned tables can not be referenced by foreign keys, so constraints referencing the table are dropped
+    and logged with their definitions. It is not reflected in migrations: Django still expects these constraints,
+    so later migrations altering referencing fields need the constraint removal faked or done by hand
+    """
+    legacy = f'{table}{LEGACY_SUFFIX}'
+    bound = next_month(timezone.now())
+
+    with atomic(), connection.cursor() as cursor:
+        cursor.execute("""
+            select c.conname, r.relname, pg_get_constraintdef(c.oid) from pg_constraint c
+            join pg_class r on r.oid = c.conrelid
+            where c.contype = 'f' and c.confrelid = %s::regclass and c.conparentid = 0
+        """, [table])
+        for name, referencing_table, definition in cursor.fetchall():
+            log.warning('%s: drop %s constraint of %s: %s', table, name, referencing_table, definition)
+            cursor.execute(f'alter table "{referencing_table}" drop constraint "{name}"')
+
+        cursor.execute("""
+            select conname, pg_get_constraintdef(oid) from pg_constraint
+            where conrelid = %s::regclass and contype = 'f'
+        """, [table])
+        foreign_keys = cursor.fetchall()
+
+        cursor.execute("""
+            select indexname, indexdef from pg_indexes
+            where tablename = %s and indexdef not like 'CREATE UNIQUE%%'
+        """, [table])
+        indexes = cursor.fetchall()
+
+        cursor.execute("""
+            select conname, array(
+                select a.attname from unnest(conkey) with ordinality k(attnum, n)
+                join pg_attribute a on a.attrelid = conrelid and a.attnum = k.attnum
+                order by k.n
+            ) from pg_constraint
+            where conrelid = %s::regclass and contype = 'u'
+        """, [table])
+        unique_constraints = cursor.fetchall()
+
+        cursor.execute("""
+            select conname from pg_constraint
+            where conrelid = %s::regclass and contype = 'p'
+        """, [table])
+        primary_key, = cursor.fetchone()
+
+        cursor.execute(f'alter table "{table}" rename to "{legacy}"')
+        # partition can not have primary key other than the parent one, which is created on attach
+        cursor.execute(f'alter table "{legacy}" drop constraint "{primary_key}"')
+        cursor.execute(f"""
+            create table "{table}" (like "{legacy}" including defaults including constraints including storage)
+            partition by range ("{column}")
+        """)
+        cursor.execute(f'alter table "{table}" add primary key (id, "{column}")')
+        cursor.execute(f'alter sequence "{table}_id_seq" owned by "{table}".id')
+
+        # create table like does not copy foreign keys, legacy partition ones are reused on attach
+        for name, definition in foreign_keys:
+            cursor.execute(f'alter table "{table}" add constraint "{name}_part" {definition}')
+
+        for name, columns in unique_constraints:
+            columns = columns if column in columns else columns + [column]
+            columns = ', '.join(f'"{i}"' for i in columns)
+            log.warning('%s: unique constraint %s is extended with partition key: (%s)', table, name, columns)
+            cursor.execute(f'alter table "{table}" add constraint "{name}_part" unique ({columns})')
+
+        for name, definition in indexes:
+            definition = re.sub(r' ON (\S+\.)?"?' + re.escape(table) + '"? ', f' ON "{table}" ', definition)
+            definition = definition.replace(f'INDEX {name} ', f'INDEX {name}_part ', 1)
+            cursor.execute(definition)
+
+        # attach checks every legacy row, bounds fit all of them
+        cursor.execute(f"""
+            alter table "{table}" attach partition "{legacy}"
+            for values from (minvalue) to (%s)
+        """, [bound])
+
+    log.info('%s: partitioned by %s, legacy partition till %s', table, column, bound)
+    create_partitions(table)
+
+
+def create_partitions(table, months=None):
+    """
+    Creates monthly partitions from the last existing one till months ahead
+    """
+    months = settings.PARTITIONS_PREMAKE_MONTHS if months is None else months
+    existing = get_partitions(table)
+    month = next_month(existing[-1][1]) if existing else next_month(timezone.now())
+    stop = month_start(timezone.now())
+    for _ in range(months + 1):
+        stop = next_month(stop)
+
+    with connection.cursor() as cursor:
+        while month < stop:
+            name = PARTITION_NAME.format(table=table, month=month)
+            cursor.execute(f"""
+                create table if not exists "{name}" partition of "{table}"
+                for values from (%s) to (%s)
+            """, [month, next_month(month)])
+            log.info('%s: partition %s created', table, name)
+            month = next_month(month)
+
+
+def detach_partitions(table, before, drop=False) -> list:
+    """
+    Detaches partitions with all rows older than before.
+    Detached partitions are dropped or moved to archive schema, returns their names
+    """
+    detached = []
+    with connection.cursor() as cursor:
+        for name, month in get_partitions(table):
+            if next_month(month) > before:
+                break
+            cursor.execute(f'alter table "{table}" detach partition "{name}"')
+            if drop:
+                cursor.execute(f'drop table "{name}"')
+            else:
+                cursor.execute(f'create schema if not exists "{settings.PARTITIONS_ARCHIVE_SCHEMA}"')
+                cursor.execute(f'alter table "{name}" set schema "{settings.PARTITIONS_ARCHIVE_SCHEMA}"')
+            log.info('%s: partition %s %s', table, name, 'dropped' if drop else 'archived')
+            detached.append(name)
+    return detached
+
+
+def cleanup_before(queryset, before):
+    """
+    Retention for partitioned tables drops whole months, delete touches only the rest
+    """
+    table = queryset.model._meta.db_table
+    if is_partitioned(table):
+        detach_partitions(table, before, drop=True)
+    return queryset.filter(**{f'{PARTITIONED_TABLES[table]}__lt': before}).delete()
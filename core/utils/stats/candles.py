@@ -0,0 +1,233 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict
+from typing import List
+from typing import Optional
+
+from django.conf import settings
+from django.db.models import Count
+from django.db.models import DateTimeField
+from django.db.models import F
+from django.db.models import Max
+from django.db.models import Min
+from django.db.models import Sum
+from django.db.models.functions import Trunc
+from django.utils import timezone
+
+from core.cache import orders_app_cache
+from core.consts.orders import SELL
+from lib.helpers import to_decimal
+
+CANDLES_CACHE_KEY = 'candles-{}-{}'  # pair, period
+CANDLE_PERIODS = OrderedDict([
+    ('minute', 60),
+    ('hour', 60 * 60),
+    ('day', 24 * 60 * 60),
+])
+# fresh periods restored from execution results on start, older ones are aggregated by TradesAggregator
+LOAD_PERIODS = {
+    'minute': 5,
+    'hour': 2,
+    'day': 1,
+}
+
+
+# chart record layout
+CHART_FIELDS = [
+    'ts',
+    'max_price',
+    'min_price',
+    'amount',
+    'open_price',
+    'close_price'
+]
+
+
+def ts_to_dt(ts):
+    return timezone.datetime.fromtimestamp(ts, tz=timezone.utc)
+
+
+def to_record(candle: dict) -> list:
+    record = [candle[f] for f in CHART_FIELDS]
+    record[0] = str(record[0])
+    return record
+
+
+class Candle(object):
+    __slots__ = ('ts', 'open', 'high', 'low', 'close', 'amount', 'volume', 'num_trades')
+
+    def __init__(self, ts, price):
+        self.ts = ts  # period start timestamp
+        self.open = self.high = self.low = self.close = price
+        self.amount = to_decimal(0)
+        self.volume = to_decimal(0)
+        self.num_trades = 0
+
+    def add(self, price, quantity):
+        self.high = max(self.high, price)
+        self.low = min(self.low, price)
+        self.close = price
+        self.amount += quantity
+        self.volume += price * quantity
+        self.num_trades += 1
+
+    def to_dict(self) -> dict:
+        """
+        Same fields as chart records made from TradesAggregatedStats
+        """
+        return {
+            'ts': ts_to_dt(self.ts),
+            'max_price': self.high,
+            'min_price': self.low,
+            'open_price': self.open,
+            'close_price': self.close,
+            'amount': self.amount,
+            'volume': self.volume,
+            'num_trades': self.num_trades,
+        }
+
+
+class PairCandles(object):
+    """
+    OHLC candles of a pair for every chart period, built by the stack worker from fills.
+    Open and recently closed candles are published to cache and pushed to chart channels
+    """
+    PUBLISH_PERIOD = settings.CANDLES_PUBLISH_PERIOD  # in seconds
+    KEEP_CLOSED = settings.CANDLES_KEEP_CLOSED  # closed candles per period
+    TIMEOUT = 60  # in seconds
+
+    def __init__(self, pair_code):
+        self.pair_code = pair_code
+        self.open: Dict[str, Optional[Candle]] = {period: None for period in CANDLE_PERIODS}
+        self.closed: Dict[str, List[Candle]] = {period: [] for period in CANDLE_PERIODS}
+        self.updated = set()  # periods to push
+        self.lock = threading.Lock()
+        self.last_publish = 0
+
+    def add_trade(self, price, quantity, ts=None):
+        price = to_decimal(price)
+        quantity = to_decimal(quantity)
+        if not quantity:
+            return
+        ts = ts or time.time()
+
+        with self.lock:
+            for period, seconds in CANDLE_PERIODS.items():
+                self.roll(period, ts)
+                candle = self.open[period]
+                if candle is None:
+                    candle = self.open[period] = Candle(int(ts // seconds) * seconds, price)
+                candle.add(price, quantity)
+                self.updated.add(period)
+
+    def roll(self, period, ts):
+        """
+        Closes open candle of the finished period
+        """
+        candle = self.open[period]
+        if candle is None or ts < candle.ts + CANDLE_PERIODS[period]:
+            return
+        closed = self.closed[period]
+        closed.append(candle)
+        del closed[:-self.KEEP_CLOSED]
+        self.open[period] = None
+        self.updated.add(period)
+
+    def load(self):
+        """
+        Restores open and fresh closed candles from execution results
+        """
+        from core.models.inouts.pair import Pair
+        from core.models.orders import ExecutionResult
+
+        pair = Pair.get(self.pair_code)
+        now = time.time()
+
+        for period, seconds in CANDLE_PERIODS.items():
+            start = (int(now // seconds) - LOAD_PERIODS[period]) * seconds
+            rows = list(ExecutionResult.objects.filter(
+                pair=pair,
+                cancelled=False,
+                order__operation=SELL,  # count only one side of match
+                created__gte=ts_to_dt(start),
+            ).annotate(
+                ts=Trunc('created', period, output_field=DateTimeField()),
+            ).values('ts').annotate(
+                high=Max('price'),
+                low=Min('price'),
+                amount=Sum('quantity'),
+                volume=Sum(F('price') * F('quantity')),
+                num_trades=Count('id'),
+                first_id=Min('id'),
+                last_id=Max('id'),
+            ).order_by('ts'))
+
+            prices = dict(ExecutionResult.objects.filter(
+                id__in=[i['first_id'] for i in rows] + [i['last_id'] for i in rows],
+            ).values_list('id', 'price'))
+
+            candles = []
+            for row in rows:
+                candle = Candle(int(row['ts'].timestamp()), prices[row['first_id']])
+                candle.high = row['high']
+                candle.low = row['low']
+                candle.close = prices[row['last_id']]
+                candle.amount = row['amount']
+                candle.volume = row['volume']
+                candle.num_trades = row['num_trades']
+                candles.append(candle)
+
+            with self.lock:
+                self.closed[period] = candles
+                self.open[period] = None
+                if candles:
+                    self.open[period] = self.closed[period].pop()
+                    self.roll(period, now)
+                self.updated.add(period)
+
+    def publish(self):
+        """
+        Saves candles for readers and pushes updated ones to chart channels, once per PUBLISH_PERIOD
+        """
+        from exchange.notifications import chart_notificator
+
+        now = time.time()
+        if now - self.last_publish < self.PUBLISH_PERIOD:
+            return
+        self.last_publish = now
+
+        with self.lock:
+            for period in CANDLE_PERIODS:
+                self.roll(period, now)
+            updated, self.updated = self.updated, set()
+            data = {
+                period: {
+                    'open': self.open[period] and self.open[period].to_dict(),
+                    'closed': [i.to_dict() for i in self.closed[period]],
+                } for period in CANDLE_PERIODS
+            }
+
+        # candles disappear with stopped worker, readers fall back to db
+        orders_app_cache.set_many(
+            {CANDLES_CACHE_KEY.format(self.pair_code, period): data[period] for period in CANDLE_PERIODS},
+            timeout=self.TIMEOUT,
+        )
+
+        for period in updated:
+            candles = data[period]['closed'][-1:]
+            if data[period]['open']:
+                candles.append(data[period]['open'])
+            if candles:
+                chart_notificator.notify({
+                    'pair': self.pair_code,
+                    'frame': period,
+                    'records': [to_record(i) for i in candles],
+                }, pair=self.pair_code, frame=period)
+
+
+def get_candles(pair_code, period) -> Optional[dict]:
+    """
+    Returns {'open': candle, 'closed': [candle, ...]} published by the stack worker, None if worker is down
+    """
+    return orders_app_cache.get(CANDLES_CACHE_KEY.format(pair_code, period))
@@ -1,4 +1,6 @@
 from django.db.models import F
+from django.db.models import Max
+from django.db.models import Min
 from django.db.models import Sum
 from django.utils import timezone
 
@@ -6,6 +8,7 @@ from core.cache import PAIRS_VOLUME_CACHE_KEY
 from core.cache import last_pair_price_cache
 from core.cache import orders_app_cache
 from core.models.inouts.pair import Pair
+from core.utils.stats.rolling import get_rolling_stats
 
 
 def get_pair_last_price(pair):
@@ -29,11 +32,11 @@ def get_pair_last_price(pair):
     return price
 
 
-def get_last_prices(ts=None):
+def get_last_prices(ts=None, pairs=None):
     from core.models.orders import ExecutionResult
 
     resultq = {}
-    for pair in Pair.objects.all():
+    for pair in pairs or Pair.objects.all():
         q = ExecutionResult.objects.filter(pair=pair, cancelled=False)
         if ts:
             q = q.filter(created__lte=ts)
@@ -44,10 +47,9 @@ def get_last_prices(ts=None):
     return resultq
 
 
-def get_pairs_24h_stats() -> dict:
-    """Returns pairs 24h stats"""
+def calc_pairs_24h_stats(pairs) -> dict:
+    """Calculates 24h stats of pairs from execution results"""
     from core.models.orders import ExecutionResult
-    from core.models.inouts.pair_settings import PairSettings
 
     volume = Sum(F('price') * F('quantity'))
 
@@ -57,24 +59,51 @@ def get_pairs_24h_stats() -> dict:
     ) - timezone.timedelta(hours=24)
 
     qs = ExecutionResult.objects.filter(
+        pair__in=pairs,
         order__operation=1, # count only one operation, other case volume should be /2!
         cancelled=False,
         updated__gte=ts_24h_ago
     ).values('pair').annotate(
         volume=volume,
-        base_volume=Sum('quantity')
+        base_volume=Sum('quantity'),
+        high=Max('price'),
+        low=Min('price'),
     )
+    aggregated = {Pair.get(i['pair']).code: i for i in qs}
+
+    last_prices = get_last_prices(pairs=pairs)
+    prices_24h = get_last_prices(ts_24h_ago, pairs=pairs)
+
+    result = {}
+    for pair in pairs:
+        pair_stats = aggregated.get(pair.code, {})
+        result[pair.code] = {
+            'volume': pair_stats.get('volume'),
+            'base_volume': pair_stats.get('base_volume'),
+            'high': pair_stats.get('high'),
+            'low': pair_stats.get('low'),
+            'price': last_prices.get(pair.code),
+            'price_24h_ago': prices_24h.get(pair.code),
+        }
+    return result
 
-    volumes = {Pair.get(i['pair']).code: i['volume'] for i in qs}
-    base_volumes = {Pair.get(i['pair']).code: i['base_volume'] for i in qs}
 
-    last_prices = get_last_prices()
-    prices_24h = get_last_prices(ts_24h_ago)
+def get_pairs_24h_stats() -> dict:
+    """Returns pairs 24h stats"""
+    from core.models.inouts.pair_settings import PairSettings
+
+    pairs = list(Pair.objects.all())
+    # maintained by the stack worker, db is queried only for pairs without it
+    stats = get_rolling_stats([pair.code for pair in pairs])
+    missing = [pair for pair in pairs if pair.code not in stats]
+    if missing:
+        stats.update(calc_pairs_24h_stats(missing))
 
     result = []
-    for pair in Pair.objects.all():
-        price = last_prices.get(str(pair), None)
-        price24 = prices_24h.get(str(pair), None)
+    for pair in pairs:
+        pair_stats = stats[pair.code]
+        price = pair_stats['price']
+        price24 = pair_stats['price_24h_ago']
         price_24_value = 0
         if price is not None and price24 is not None:
             price_24_value = price - price24
@@ -87,11 +116,14 @@ def get_pairs_24h_stats() -> dict:
         pair_data = pair.to_dict()
         pair_data['stack_precisions'] = PairSettings.get_stack_precisions_by_pair(pair.code)
         result.append({
-            'volume': volumes.get(str(pair), None),
-            'base_volume': base_volumes.get(str(pair), None),
+            'volume': pair_stats['volume'],
+            'base_volume': pair_stats['base_volume'],
             'price': price,
             'price_24h': trend,  # price 24h percent
             'price_24h_value': price_24_value,  # price 24h value
+            'price_24h_ago': price24,
+            'high_24h': pair_stats['high'],
+            'low_24h': pair_stats['low'],
             'pair': str(pair),
             'pair_data': pair_data,
         })
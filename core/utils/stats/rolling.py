@@ -0,0 +1,170 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict
+from typing import List
+
+from django.conf import settings
+from django.db.models import F
+from django.db.models import Max
+from django.db.models import Min
+from django.db.models import Sum
+from django.db.models.functions import TruncMinute
+from django.utils import timezone
+
+from core.cache import orders_app_cache
+from core.consts.orders import SELL
+from lib.helpers import to_decimal
+
+ROLLING_STATS_CACHE_KEY = 'rolling-24h-stats-{}'
+WINDOW = 24 * 60  # in minutes
+
+
+class MinuteBucket(object):
+    __slots__ = ('open', 'high', 'low', 'last', 'volume', 'base_volume')
+
+    def __init__(self, price, volume=0, base_volume=0):
+        self.open = self.high = self.low = self.last = price
+        self.volume = to_decimal(volume)
+        self.base_volume = to_decimal(base_volume)
+
+    def add(self, price, quantity):
+        self.high = max(self.high, price)
+        self.low = min(self.low, price)
+        self.last = price
+        self.volume += price * quantity
+        self.base_volume += quantity
+
+
+class PairRollingStats(object):
+    """
+    24h trade stats of a pair kept in minute buckets by the stack worker.
+    Buckets older than the window expire, so readers get precomputed values instead of scanning a day of trades
+    """
+    PUBLISH_PERIOD = settings.ROLLING_STATS_PUBLISH_PERIOD  # in seconds
+    TIMEOUT = 60  # in seconds
+
+    def __init__(self, pair_code):
+        self.pair_code = pair_code
+        self.buckets: Dict[int, MinuteBucket] = OrderedDict()  # {minute: bucket}
+        self.volume = to_decimal(0)
+        self.base_volume = to_decimal(0)
+        self.last_price = None
+        self.price_24h_ago = None  # last trade price before the window
+        self.lock = threading.Lock()
+        self.last_publish = 0
+
+    def add_trade(self, price, quantity, ts=None):
+        price = to_decimal(price)
+        quantity = to_decimal(quantity)
+        if not quantity:
+            return
+        minute = int((ts or time.time()) // 60)
+
+        with self.lock:
+            bucket = self.buckets.get(minute)
+            if bucket is None:
+                bucket = self.buckets[minute] = MinuteBucket(price)
+            bucket.add(price, quantity)
+            self.volume += price * quantity
+            self.base_volume += quantity
+            self.last_price = price
+
+    def expire(self, now=None):
+        start = int((now or time.time()) // 60) - WINDOW
+        with self.lock:
+            while self.buckets:
+                minute, bucket = next(iter(self.buckets.items()))
+                if minute >= start:
+                    break
+                del self.buckets[minute]
+                self.volume -= bucket.volume
+                self.base_volume -= bucket.base_volume
+                self.price_24h_ago = bucket.last
+
+    def load(self):
+        """
+        Restores buckets of the current window from execution results
+        """
+        from core.models.inouts.pair import Pair
+        from core.models.orders import ExecutionResult
+
+        pair = Pair.get(self.pair_code)
+        start = int(time.time() // 60) - WINDOW
+        start_dt = timezone.datetime.fromtimestamp(start * 60, tz=timezone.utc)
+        qs = ExecutionResult.objects.filter(pair=pair, cancelled=False)
+
+        rows = list(qs.filter(
+            order__operation=SELL,  # count only one side of match
+            created__gte=start_dt,
+        ).annotate(
+            minute=TruncMinute('created'),
+        ).values('minute').annotate(
+            high=Max('price'),
+            low=Min('price'),
+            volume=Sum(F('price') * F('quantity')),
+            base_volume=Sum('quantity'),
+            first_id=Min('id'),
+            last_id=Max('id'),
+        ).order_by('minute'))
+
+        prices = dict(ExecutionResult.objects.filter(
+            id__in=[i['first_id'] for i in rows] + [i['last_id'] for i in rows],
+        ).values_list('id', 'price'))
+
+        price_24h_ago = qs.filter(
+            created__lt=start_dt,
+        ).order_by('-created').values_list('price', flat=True).first()
+
+        with self.lock:
+            self.buckets.clear()
+            self.volume = to_decimal(0)
+            self.base_volume = to_decimal(0)
+            for row in rows:
+                bucket = MinuteBucket(prices[row['first_id']], row['volume'], row['base_volume'])
+                bucket.high = row['high']
+                bucket.low = row['low']
+                bucket.last = prices[row['last_id']]
+                self.buckets[int(row['minute'].timestamp() // 60)] = bucket
+                self.volume += bucket.volume
+                self.base_volume += bucket.base_volume
+            self.price_24h_ago = price_24h_ago
+            self.last_price = bucket.last if rows else price_24h_ago
+
+    def to_dict(self) -> dict:
+        with self.lock:
+            buckets = list(self.buckets.values())
+            return {
+                'volume': self.volume if buckets else None,
+                'base_volume': self.base_volume if buckets else None,
+                'high': max(i.high for i in buckets) if buckets else None,
+                'low': min(i.low for i in buckets) if buckets else None,
+                'open': buckets[0].open if buckets else None,
+                'price': self.last_price,
+                'price_24h_ago': self.price_24h_ago,
+            }
+
+    def publish(self):
+        """
+        Saves stats for readers once per PUBLISH_PERIOD
+        """
+        now = time.time()
+        if now - self.last_publish < self.PUBLISH_PERIOD:
+            return
+
+        self.last_publish = now
+        self.expire(now)
+        # stats disappear with stopped worker, readers fall back to db
+        orders_app_cache.set(
+            ROLLING_STATS_CACHE_KEY.format(self.pair_code),
+            self.to_dict(),
+            timeout=self.TIMEOUT,
+        )
+
+
+def get_rolling_stats(pair_codes: List[str]) -> Dict[str, dict]:
+    """
+    Returns published 24h stats by pair code, pairs without running stack worker are skipped
+    """
+    keys = {ROLLING_STATS_CACHE_KEY.format(i): i for i in pair_codes}
+    return {keys[k]: v for k, v in orders_app_cache.get_many(list(keys)).items()}
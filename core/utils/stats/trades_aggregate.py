@@ -1,6 +1,10 @@
+from itertools import groupby
+
 from dateutil.relativedelta import relativedelta
 from django.db.models import F
+from django.db.models import Q
 from django.db.models.aggregates import Avg
+from django.db.models.aggregates import Count
 from django.db.models.aggregates import Max
 from django.db.models.aggregates import Min
 from django.db.models.aggregates import Sum
@@ -11,20 +15,27 @@ from django.db.models.expressions import Window
 from django.db.models.fields import IntegerField
 from django.db.models.functions.window import FirstValue
 from django.db.models.functions.window import LastValue
+from django.db.transaction import atomic
 from django.utils.timezone import now
 
 from lib.batch import BatchProcessor
+from lib.batch import chunks
 from core.consts.orders import BUY
 from core.consts.orders import SELL
 from core.models.orders import ExecutionResult
 from core.models.inouts.pair import Pair
 from core.models.stats import TradesAggregatedStats
+from core.models.stats import TradesAggregationWatermark
 from core.utils.stats.periodic_data_aggregator import PeriodicDataAggregator
 from lib.fields import MoneyField
 
 
 class TradesAggregator(BatchProcessor):
-    """ Creates TradesAggregatedStats from execution results """
+    """
+    Creates TradesAggregatedStats: minute candles from execution results,
+    hour candles from minute ones and day candles from hour ones.
+    Every (pair, period) continues from its watermark, so a run reads only new data
+    """
 
     PERIODS = {
         'minute': relativedelta(minutes=1),
@@ -32,6 +43,17 @@ class TradesAggregator(BatchProcessor):
         'day': relativedelta(days=1),
 
     }
+    SOURCE_PERIODS = {
+        'hour': 'minute',
+        'day': 'hour',
+    }
+    # range of one run, the rest is caught up by the next runs
+    MAX_RANGE = {
+        'minute': relativedelta(days=1),
+        'hour': relativedelta(days=30),
+        'day': relativedelta(years=1),
+    }
+    ITERATE_BATCH_SIZE = 10_000
 
     def __init__(self, pair, period):
         self.period = period
@@ -113,7 +135,7 @@ class TradesAggregator(BatchProcessor):
         )
 
     @classmethod
-    def filter_to_last_period(cls, period):
+    def trunc(cls, dt, period):
         trunc = {
             'microsecond': 0,
             'second': 0
@@ -124,19 +146,150 @@ class TradesAggregator(BatchProcessor):
         if period == 'day':
             trunc['minute'] = 0
             trunc['hour'] = 0
-        return {'created__lt': now().replace(**trunc)}
+        return dt.replace(**trunc)
 
     @classmethod
-    def filter_from_last_record(cls, pair, period):
+    def aggregate_pair(cls, pair):
+        """ minute candles first, then their rollups """
+        for period in cls.PERIODS:
+            cls(pair, period).start()
+
+    def start(self):
+        watermark, _ = TradesAggregationWatermark.objects.get_or_create(
+            pair=self.pair,
+            period=TradesAggregatedStats.PERIODS[self.period],
+        )
+        with atomic():
+            # one aggregator per pair and period at a time
+            watermark = TradesAggregationWatermark.objects.select_for_update().get(id=watermark.id)
+            start = watermark.ts or self.initial_start()
+            stop = self.available_stop()
+            if start is None or stop is None:
+                return
+            stop = self.trunc(min(stop, start + self.MAX_RANGE[self.period]), self.period)
+            if stop <= start:
+                return
+
+            self.rebuild(start, stop)
+            watermark.ts = stop
+            watermark.save()
+
+    def rebuild(self, start, stop):
+        """ replaces candles of [start, stop) range """
+        TradesAggregatedStats.objects.filter(
+            pair=self.pair,
+            period=TradesAggregatedStats.PERIODS[self.period],
+            ts__gte=start,
+            ts__lt=stop,
+        ).delete()
+
+        if self.period in self.SOURCE_PERIODS:
+            rows = self.rollup(start, stop)
+        else:
+            rows = self.group_trades(start, stop)
+
+        for items in chunks(rows, self.ITERATE_BATCH_SIZE):
+            self.process_batch([self.make_item(i) for i in items])
+
+    def initial_start(self):
+        """ continues after the last candle or from the first source record """
         obj = TradesAggregatedStats.objects.filter(
-            pair=pair,
-            period=TradesAggregatedStats.PERIODS[period]
-        ).order_by('-ts').first()
+            pair=self.pair,
+            period=TradesAggregatedStats.PERIODS[self.period],
+        ).order_by('-ts').only('ts').first()
+        if obj:
+            return obj.ts + self.PERIODS[self.period]
+
+        source = self.SOURCE_PERIODS.get(self.period)
+        if source:
+            first = TradesAggregatedStats.objects.filter(
+                pair=self.pair,
+                period=TradesAggregatedStats.PERIODS[source],
+            ).order_by('ts').values_list('ts', flat=True).first()
+        else:
+            first = ExecutionResult.objects.filter(
+                pair=self.pair,
+                cancelled=False,
+            ).order_by('created').values_list('created', flat=True).first()
+        return first and self.trunc(first, self.period)
+
+    def available_stop(self):
+        """ closed periods only, rollups wait for the source candles """
+        stop = self.trunc(now(), self.period)
+        source = self.SOURCE_PERIODS.get(self.period)
+        if source:
+            source_ts = TradesAggregationWatermark.objects.filter(
+                pair=self.pair,
+                period=TradesAggregatedStats.PERIODS[source],
+            ).values_list('ts', flat=True).first()
+            if source_ts is None:
+                return None
+            stop = min(stop, source_ts)
+        return stop
+
+    def group_trades(self, start, stop):
+        """ minute candles from execution results """
+        qs = ExecutionResult.objects.filter(
+            cancelled=False,
+            pair=self.pair,
+            created__gte=start,
+            created__lt=stop,
+        )
+        qs = PeriodicDataAggregator.trunc_period(qs, self.period).values('ts').annotate(
+            min_price=Min('price'),
+            max_price=Max('price'),
+            avg_price=Avg('price'),
+            amount=Sum(F('quantity') / 2.0, output_field=MoneyField()),
+            volume=Sum(F('quantity') * F('price') / 2.0, output_field=MoneyField()),
+            num_trades=Count('id', filter=Q(order__operation=BUY)),
+            fee_base=Sum('fee_amount', filter=Q(order__operation=BUY)),
+            fee_quoted=Sum('fee_amount', filter=Q(order__operation=SELL)),
+            first_id=Min('id'),
+            last_id=Max('id'),
+        ).order_by('ts')
+
+        for rows in chunks(qs.iterator(), self.ITERATE_BATCH_SIZE):
+            prices = dict(ExecutionResult.objects.filter(
+                id__in=[i['first_id'] for i in rows] + [i['last_id'] for i in rows],
+            ).values_list('id', 'price'))
 
-        if not obj:
-            return {}
+            for row in rows:
+                row['open_price'] = prices[row.pop('first_id')]
+                row['close_price'] = prices[row.pop('last_id')]
+                row['pair_id'] = self.pair.id
+                yield row
 
-        return {'created__gte': obj.ts + cls.PERIODS[period]}
+    def rollup(self, start, stop):
+        """ hour candles from minute ones, day candles from hour ones """
+        qs = TradesAggregatedStats.objects.filter(
+            pair=self.pair,
+            period=TradesAggregatedStats.PERIODS[self.SOURCE_PERIODS[self.period]],
+            ts__gte=start,
+            ts__lt=stop,
+        ).order_by('ts').values('ts', *TradesAggregatedStats.STATS_FIELDS)
+
+        for ts, group in groupby(qs.iterator(), key=lambda i: self.trunc(i['ts'], self.period)):
+            group = list(group)
+            num_trades = sum(i['num_trades'] for i in group)
+            if num_trades:
+                avg_price = sum(i['avg_price'] * i['num_trades'] for i in group) / num_trades
+            else:
+                avg_price = sum(i['avg_price'] for i in group) / len(group)
+
+            yield {
+                'ts': ts,
+                'pair_id': self.pair.id,
+                'min_price': min(i['min_price'] for i in group),
+                'max_price': max(i['max_price'] for i in group),
+                'avg_price': avg_price,
+                'open_price': group[0]['open_price'],
+                'close_price': group[-1]['close_price'],
+                'volume': sum(i['volume'] for i in group),
+                'amount': sum(i['amount'] for i in group),
+                'num_trades': num_trades,
+                'fee_base': sum(i['fee_base'] for i in group),
+                'fee_quoted': sum(i['fee_quoted'] for i in group),
+            }
 
     def make_item(self, obj):
         for k, v in obj.items():
@@ -150,17 +303,3 @@ class TradesAggregator(BatchProcessor):
 
     def process_batch(self, items):
         TradesAggregatedStats.objects.bulk_create(items)
-
-    def make_qs(self):
-        filters = self.filter_from_last_record(self.pair, self.period)
-        filters.update(self.filter_to_last_period(self.period))
-        qs = ExecutionResult.objects.filter(cancelled=False, pair=self.pair)
-
-        pda = PeriodicDataAggregator(
-            qs=qs,
-            period=self.period,
-            aggregates=self.aggregates(),
-            group_by=['pair_id']
-        )
-
-        return pda.aggregate(filters=filters)
@@ -278,7 +278,7 @@ class CoinsStatusView(GenericAPIView):
         ]
     )
     def get(self, request):
-        coins = DisabledCoin.get_coins_status()
+        coins = {coin: dict(restrictions) for coin, restrictions in DisabledCoin.get_coins_status().items()}
         if not request.user.is_anonymous:
             for coin, restrictions in coins.items():
                 restrictions['disable_topups'] = restrictions['disable_topups'] \
@@ -6,6 +6,8 @@ from collections import Counter
 from itertools import chain
 
 from django.conf import settings
+from django.db.models import Max
+from django.db.models import Min
 from django.utils import timezone
 from django.utils.translation import get_language
 from drf_spectacular.types import OpenApiTypes
@@ -26,6 +28,8 @@ from core.consts.orders import ORDER_CLOSED
 from core.consts.orders import ORDER_OPENED
 from core.exceptions.orders import OrderNotFoundError, OrderNotOpenedError, OrderMinQuantityError
 from core.filters.orders import OrdersFilter, ExchangeFilter
+from core.utils.stats.candles import CANDLE_PERIODS
+from core.utils.stats.candles import get_candles
 from core.utils.stats.daily import get_filtered_pairs_24h_stats, get_pair_last_price
 from core.orderbook.helpers import get_stack_by_pair
 from core.models import PairSettings
@@ -308,11 +312,12 @@ class StackView(APIView):
 
     @classmethod
     def stack_limited(cls, pair, sell_limit=None, buy_limit=None):
-        data = cls.get_stack_by_name(pair)
+        # only requested entries are decoded
+        data = get_stack_by_pair(pair, sell_limit=sell_limit, buy_limit=buy_limit)
         if sell_limit is not None:
-            data['sells'] = data.get('sells', [])[:sell_limit]
+            data.setdefault('sells', [])
         if buy_limit is not None:
-            data['buys'] = data.get('buys', [])[:buy_limit]
+            data.setdefault('buys', [])
         return data
 
     @classmethod
@@ -561,32 +566,45 @@ class LatestCandleView(APIView):
 
     @extend_schema(exclude=True)
     def get(self, request):
-        pair = request.query_params['pair']
+        pair = Pair.get(request.query_params['pair'])
         interval = int(request.query_params.get('interval', 1))  # minutes
 
         ts_now = int(timezone.now().timestamp())
         interval_sec = interval * 60
-        next_ts = (ts_now // interval_sec) * interval_sec + interval_sec
-        end_time = datetime.datetime.fromtimestamp(next_ts)
-        start_time = end_time - datetime.timedelta(seconds=interval_sec)
-
-        qs = ExecutionResult.objects.filter(
-            cancelled=False,
-            pair=pair,
-            created__gte=start_time,
-            created__lte=end_time
-        ).order_by('created')
-
-        open_match = qs.first()
-        close_match = qs.last()
+        start_ts = (ts_now // interval_sec) * interval_sec
+        start_time = datetime.datetime.fromtimestamp(start_ts, tz=datetime.timezone.utc)
+        end_time = start_time + datetime.timedelta(seconds=interval_sec)
 
         open = close = high = low = 0
 
-        if open_match:
-            open = open_match.price
-
-        if close_match:
-            close = close_match.price
+        period = next((k for k, v in CANDLE_PERIODS.items() if v == interval_sec), None)
+        candles = get_candles(pair.code, period) if period else None
+
+        if candles is not None:
+            # live candle of the stack worker
+            candle = candles['open']
+            if candle and candle['ts'] == start_time:
+                open = candle['open_price']
+                close = candle['close_price']
+                high = candle['max_price']
+                low = candle['min_price']
+        else:
+            qs = ExecutionResult.objects.filter(
+                cancelled=False,
+                pair=pair,
+                created__gte=start_time,
+                created__lte=end_time
+            ).order_by('created')
+
+            open_match = qs.first()
+            close_match = qs.last()
+
+            if open_match:
+                open = open_match.price
+                close = close_match.price
+                aggregation = qs.aggregate(high=Max('price'), low=Min('price'))
+                high = aggregation['high']
+                low = aggregation['low']
 
         return Response({
             'time': start_time,
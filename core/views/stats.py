@@ -11,10 +11,18 @@ from rest_framework.response import Response
 from rest_framework.views import APIView
 
 from core.models.orders import ExecutionResult
+from core.cache import CHART_BLOCK_CACHE_KEY
+from core.cache import CHART_LAST_PRICE_CACHE_KEY
+from core.cache import CHART_RESPONSE_CACHE_KEY
+from core.cache import chart_cache
 from core.models.stats import TradesAggregatedStats
+from core.models.stats import TradesAggregationWatermark
 from core.models.inouts.pair import Pair
 from core.models.inouts.pair import PairSerialField
 from core.serializers.stats import StatsSerializer
+from core.utils.stats.candles import CANDLE_PERIODS
+from core.utils.stats.candles import get_candles
+from core.utils.stats.candles import ts_to_dt
 from core.utils.stats.chart import ChartTool
 from core.utils.stats.chart import TimelineGenerator
 from core.utils.stats.periodic_data_aggregator import PeriodicDataAggregator
@@ -113,6 +121,7 @@ class PairTradeChartData:
 
 class PairTradeChartDataWithPreAggregattion(PairTradeChartData):
     """ uses TradesAggregatedStats as main data source and execution results only for fresh data """
+    BLOCK_SIZE = 500  # candles per cached block
 
     def prev_periods(self, period):
         if period == 'minute':
@@ -139,6 +148,17 @@ class PairTradeChartDataWithPreAggregattion(PairTradeChartData):
         )
         return qs
 
+    def fresh_data_map(self):
+        """ live candles of the stack worker, execution results if it is down """
+        candles = get_candles(self.pair.code, self.period)
+        if candles is None:
+            return self.chart_tool.map_qs(self.queryset(), 'ts')
+
+        records = candles['closed']
+        if candles['open']:
+            records = records + [candles['open']]
+        return self.chart_tool.map_qs(records, 'ts')
+
     def get_cached_qs(self, period=None, start=None, stop=None):
         if not period:
             period = self.period
@@ -160,24 +180,112 @@ class PairTradeChartDataWithPreAggregattion(PairTradeChartData):
         )
         return qs
 
-    def chart_data_map(self):
+    def stored_data_map(self, start, stop):
+        """ TradesAggregatedStats records, hour ones for minutes already cleaned up """
         week_ago = now() - relativedelta(days=settings.STATS_CLEANUP_MINUTE_INTERVAL_DAYS_AGO)
-        before_data_qs = None
 
-        if self.period == 'minute' and self.start < week_ago:
-            before_data_qs = self.get_cached_qs('hour', stop=week_ago)
-            cached_qs = self.get_cached_qs(start=week_ago)
-        else:
-            cached_qs = self.get_cached_qs()
+        if self.period == 'minute' and start < week_ago:
+            data = self.chart_tool.map_qs(self.get_cached_qs(start=week_ago, stop=stop), 'ts')
+            data.update(self.chart_tool.map_qs(self.get_cached_qs('hour', start=start, stop=week_ago), 'ts'))
+            return data
 
-        qs = self.queryset()  # fresh only data
-        data = self.chart_tool.map_qs(cached_qs, 'ts')
-        data.update(self.chart_tool.map_qs(qs, 'ts'))
+        return self.chart_tool.map_qs(self.get_cached_qs(start=start, stop=stop), 'ts')
 
-        if before_data_qs:
-            data.update(self.chart_tool.map_qs(before_data_qs, 'ts'))
+    def get_closed_ts(self):
+        """ candles before aggregation watermark never change """
+        return TradesAggregationWatermark.objects.filter(
+            pair=self.pair,
+            period=TradesAggregatedStats.PERIODS[self.period],
+        ).values_list('ts', flat=True).first()
+
+    def closed_data_map(self, stop):
+        """
+        Records of closed blocks of BLOCK_SIZE candles, cached by block.
+        Returns data and the start of the first not closed block
+        """
+        period_seconds = CANDLE_PERIODS[self.period]
+        block_seconds = period_seconds * self.BLOCK_SIZE
+        stop_ts = stop.timestamp()
+        block_ts = int(self.start.timestamp()) // block_seconds * block_seconds
+
+        blocks = {}
+        while block_ts + block_seconds <= stop_ts and block_ts <= self.stop.timestamp():
+            blocks[CHART_BLOCK_CACHE_KEY.format(self.pair.code, self.period, block_ts)] = block_ts
+            block_ts += block_seconds
+
+        data = {}
+        cached = chart_cache.get_many(list(blocks))
+        for key, block_start in blocks.items():
+            if key not in cached:
+                cached[key] = self.stored_data_map(
+                    ts_to_dt(block_start),
+                    ts_to_dt(block_start + block_seconds - period_seconds),
+                )
+                chart_cache.set(key, cached[key], timeout=settings.CHART_BLOCK_CACHE_TTL)
+            data.update(cached[key])
+
+        return data, ts_to_dt(block_ts)
+
+    def chart_data_map(self):
+        data = {}
+        start = self.start
+        closed_ts = self.get_closed_ts()
+        if closed_ts:
+            data, start = self.closed_data_map(closed_ts)
+            start = max(start, self.start)
+
+        data.update(self.stored_data_map(start, self.stop))
+        data.update(self.fresh_data_map())
         return data
 
+    def get_last_price(self, before_ts):
+        key = CHART_LAST_PRICE_CACHE_KEY.format(self.pair.code, int(before_ts.timestamp()))
+        price = chart_cache.get(key)
+        if price is None:
+            price = super().get_last_price(before_ts)
+            closed_ts = self.get_closed_ts()
+            # trades before closed candles never change
+            if closed_ts and before_ts <= closed_ts:
+                chart_cache.set(key, price, timeout=settings.CHART_BLOCK_CACHE_TTL)
+        return price
+
+
+def get_chart_data(spec, data_source=PairTradeChartDataWithPreAggregattion) -> dict:
+    """
+    Chart response, records of the same candles range are cached for CHART_RESPONSE_CACHE_TTL
+    """
+    start = dt_from_js(spec['start_ts'])
+    stop = dt_from_js(spec['stop_ts'])
+
+    if stop > now():
+        stop = now()
+
+    period = spec['frame']
+    key = CHART_RESPONSE_CACHE_KEY.format(
+        spec['pair'],
+        period,
+        int(TimelineGenerator.get_start_for_period(start, period).timestamp()),
+        int(TimelineGenerator.get_start_for_period(stop, period).timestamp()),
+    )
+    records = chart_cache.get(key)
+    if records is None:
+        st = data_source(
+            start=start,
+            stop=stop,
+            period=period,
+            pair=spec['pair']
+        )
+        records = st.get()
+        chart_cache.set(key, records, timeout=settings.CHART_RESPONSE_CACHE_TTL)
+
+    return {
+        'records': records,
+        'start': spec['start_ts'],
+        'stop': spec['stop_ts'],
+        'frame': spec['frame'],
+        'last_record_dt': None if not records else str((records[-1][0]))
+    }
+
 
 class StatsView(APIView):
     permission_classes = (AllowAny,)
@@ -217,31 +325,7 @@ class StatsView(APIView):
     def post(self, request, **kwargs):
         serializer = StatsSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
-        spec = serializer.data
-
-        start = dt_from_js(spec['start_ts'])
-        stop = dt_from_js(spec['stop_ts'])
-
-        if stop > now():
-            stop = now()
-
-        st = self.CHART_DATA_SOURCE(
-            start=start,
-            stop=stop,
-            period=spec['frame'],
-            pair=spec['pair']
-        )
-
-        records = st.get()
-
-        response = {
-            'records': records,
-            'start': spec['start_ts'],
-            'stop': spec['stop_ts'],
-            'frame': spec['frame'],
-            'last_record_dt': None if not records else str((records[-1][0]))
-        }
-        return Response(response)
+        return Response(get_chart_data(serializer.data, self.CHART_DATA_SOURCE))
 
 
 class PairSerializer(serializers.Serializer):
@@ -19,6 +19,7 @@ from exchange.notifications import opened_orders_by_pair_notificator
 from exchange.notifications import opened_orders_notificator
 from exchange.notifications import pairs_notificator
 from exchange.notifications import pairs_volume_notificator
+from exchange.notifications import stack_diff_notificator
 from exchange.notifications import stack_notificator
 from exchange.notifications import trades_notificator
 from exchange.notifications import user_notificator
@@ -94,7 +95,19 @@ class LiveNotificationsConsumer(AsyncJsonWebsocketConsumer):
 
         params['user_id'] = self.scope['user'] and getattr(self.scope['user'], 'id')
 
-        if command == 'add_stack':
+        if command == 'add_stack' and params.get('diff'):
+            await self.join_group(stack_diff_notificator.gen_channel(**params))
+            data = await sync_to_async(stack_diff_notificator.get_data)(**params)
+            data = stack_diff_notificator.prepare_data(data, snapshot=True, **params)
+            await self.send_json(data)
+        elif command == 'del_stack' and params.get('diff'):
+            await self.leave_group(stack_diff_notificator.gen_channel(**params))
+        elif command == 'resync_stack':
+            data = await sync_to_async(stack_diff_notificator.get_data)(**params)
+            data = stack_diff_notificator.prepare_data(data, snapshot=True, **params)
+            await self.send_json(data)
+
+        elif command == 'add_stack':
             await self.join_group(stack_notificator.gen_channel(**params))
             data = await sync_to_async(stack_notificator.get_data)(**params)
             data = stack_notificator.prepare_data(data, **params)
@@ -126,6 +139,11 @@ class LiveNotificationsConsumer(AsyncJsonWebsocketConsumer):
         elif command == 'get_chart':
             data = chart_notificator.get_data(**params)
             await self.send_json(chart_notificator.prepare_data(data))
+        elif command == 'add_chart':
+            # open candle updates of the pair and frame
+            await self.join_group(chart_notificator.gen_channel(**params))
+        elif command == 'del_chart':
+            await self.leave_group(chart_notificator.gen_channel(**params))
 
         elif command == 'get_coins_status':
             data = await sync_to_async(coins_status_notificator.get_data)(**params)
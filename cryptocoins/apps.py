@@ -7,4 +7,5 @@ class CryptocoinsConfig(AppConfig):
     name = 'cryptocoins'
 
     def ready(self):
+        import cryptocoins.signal_handlers
         register_tokens_and_pairs()
@@ -25,7 +25,13 @@ from cryptocoins.exceptions import CoinServiceError, TransferAmountLowError, Sig
 from cryptocoins.models.keeper import Keeper
 from cryptocoins.models.scoring import ScoringSettings, TransactionInputScore
 from cryptocoins.utils import commons
+from cryptocoins.utils.address_index import AddressIndex
+from cryptocoins.utils.address_index import USERS_ADDRESS_INDEX
+from cryptocoins.utils.btc import P2PKH, P2SH, P2WPKH, P2WSH
+from cryptocoins.utils.btc import estimate_tx_vsize, get_input_size, parse_multisig_redeem_script
 from cryptocoins.utils.btc import pubkey_to_address
+from cryptocoins.utils.utxo_index import UtxoIndex
+from lib.batch import chunks
 from lib.cipher import AESCoderDecoder
 from lib.helpers import to_decimal
 from lib.utils import memcache_lock
@@ -44,6 +50,11 @@ class CoinServiceBase:
         if self.currency is None:
             raise ValueError('currency must be set')
 
+        self._address_index = AddressIndex(
+            USERS_ADDRESS_INDEX.format(self.currency.code),
+            lambda: self.get_users_addresses_qs().iterator(),
+        )
+
     @property
     def withdrawal_fee(self):
         """
@@ -173,9 +184,17 @@ class CoinServiceBase:
             redeem_script=keeper.extra.get('redeem_script')
         )
 
-    @cachetools.func.ttl_cache(ttl=5)
     def get_users_addresses(self, exclude_blocked=False):
-        qs = UserWallet.objects.filter(
+        if exclude_blocked:
+            return self.get_not_blocked_users_addresses()
+        return self._address_index.get_addresses()
+
+    @cachetools.func.ttl_cache(ttl=5)
+    def get_not_blocked_users_addresses(self):
+        return list(self.get_users_addresses_qs().exclude(block_type=UserWallet.BLOCK_TYPE_DEPOSIT_AND_ACCUMULATION))
+
+    def get_users_addresses_qs(self):
+        return UserWallet.objects.filter(
             currency=self.currency,
             keeper=None,
         ).exclude(
@@ -184,9 +203,6 @@ class CoinServiceBase:
             'address',
             flat=True,
         )
-        if exclude_blocked:
-            qs = qs.exclude(block_type=UserWallet.BLOCK_TYPE_DEPOSIT_AND_ACCUMULATION)
-        return list(qs)
 
     def get_accumulation_ready_wallet_transactions(self) -> List[WalletTransactions]:
         return WalletTransactions.get_ready_for_accumulation(self.currency)
@@ -229,9 +245,15 @@ class CoinServiceBase:
 
     def process_block(self, block_id):
         """
-        Run check_tx_for_deposit for transaction by block_id
+        Run check_block_for_deposits for transactions by block_id
+        """
+        self.check_block_for_deposits(self.get_block_transactions(block_id))
+
+    def check_block_for_deposits(self, transactions):
         """
-        for tx_data in self.get_block_transactions(block_id):
+        check all block transactions for deposits
+        """
+        for tx_data in transactions:
             self.check_tx_for_deposit(tx_data)
 
     def get_withdrawal_requests(self) -> QuerySet:
@@ -317,6 +339,7 @@ class BitCoreCoinServiceBase(CoinServiceBase):
             raise ValueError('withdrawal_fee attribute must be set')
 
         self.rpc_url = 'http://{username}:{password}@{host}:{port}'.format(**self.node_config, timeout=60)
+        self.utxo_index = UtxoIndex(self.currency.code)
 
     def get_transfer_fee(self, size):
         raise NotImplementedError
@@ -398,7 +421,7 @@ class BitCoreCoinServiceBase(CoinServiceBase):
         """
         get unspent by user addresses
         """
-        addresses = self.get_users_addresses(exclude_blocked)
+        addresses = list(self.get_users_addresses(exclude_blocked))
 
         if not addresses:
             self.log.info('Have no user addresses for %s', self.currency.code)
@@ -406,6 +429,35 @@ class BitCoreCoinServiceBase(CoinServiceBase):
 
         return self.get_unspent(addresses=addresses)
 
+    def get_indexed_unspent(self, addresses: Optional[list] = None):
+        """
+        get unspent by user addresses from utxo index, listunspent is called only to fill empty or outdated index
+        """
+        if not self.utxo_index.is_ready():
+            self.log.info('Reconcile %s utxo index', self.currency.code)
+            self.utxo_index.fill(self.get_users_unspent())
+
+        if addresses is None:
+            addresses = self.get_users_addresses()
+
+        return self.utxo_index.get_unspent(addresses)
+
+    def filter_spendable(self, inputs: list) -> list:
+        """
+        check inputs with batched gettxout including mempool spends.
+        Spent inputs are skipped only for this run: mempool spend can be evicted or replaced,
+        utxo index drops inputs by processed blocks and on reconcile
+        """
+        checked_inputs = []
+        for chunk in chunks(inputs, settings.UTXO_CHECK_BATCH_SIZE):
+            results = self.rpc.batch_([['gettxout', i['txid'], i['vout']] for i in chunk])
+            checked_inputs.extend(item for item, result in zip(chunk, results) if result)
+
+        if len(checked_inputs) < len(inputs):
+            self.log.info('%s spent inputs skipped', len(inputs) - len(checked_inputs))
+
+        return checked_inputs
+
     def get_wallet_balance(self, address: str) -> Decimal:
         unspent = self.get_unspent(addresses=[address])
         return self.get_balance_from_unspent(unspent)
@@ -424,18 +476,9 @@ class BitCoreCoinServiceBase(CoinServiceBase):
     def accumulate(self):
         self.log.info('Starting accumulation: %s', self.currency.code)
 
-        inputs = self.get_users_unspent()
+        inputs = self.get_indexed_unspent()
         # check if spendable
-        checked_inputs = []
-        for item in inputs:
-            result = self.rpc.gettxout(
-                item['txid'],
-                item['vout'],
-            )
-            if not result:
-                continue
-
-            checked_inputs.append(item)
+        checked_inputs = self.filter_spendable(inputs)
 
         # total_amount = self.get_users_total_balance()
         total_amount = sum([to_decimal(i['amount']) for i in checked_inputs])
@@ -460,19 +503,24 @@ class BitCoreCoinServiceBase(CoinServiceBase):
 
         self.transfer_to(checked_inputs, accumulation_address, total_amount, private_keys)
 
-    def get_tx_size(self, inputs: list, outputs: dict, private_keys: list):
+    def get_tx_size(self, inputs: list, outputs: dict, private_keys=None, redeem_script: Optional[str] = None):
         """
-        get transaction size in byte
+        get estimated transaction size in vbytes by inputs and outputs script types, nothing is signed
         """
-        tx_hex = self.rpc.createrawtransaction(inputs, outputs)
-        signed_tx_without_fee = self._sign_transaction(tx_hex, private_keys)
-
-        if not signed_tx_without_fee['complete']:
-            self.log.error('Unable to sign TX')
-            raise SignTxError
+        multisig = parse_multisig_redeem_script(redeem_script) if redeem_script else None
+        return estimate_tx_vsize(
+            [get_input_size(self.get_script_type(i['address']), multisig) for i in inputs],
+            [self.get_script_type(address) for address in outputs],
+        )
 
-        tx_decode = self.rpc.decoderawtransaction(signed_tx_without_fee['hex'])
-        return tx_decode.get('size')
+    def get_script_type(self, address: str) -> str:
+        if self.crypto_coin.is_p2wsh(address):
+            return P2WSH
+        if self.crypto_coin.is_native_segwit(address):
+            return P2WPKH
+        if self.crypto_coin.is_p2sh(address):
+            return P2SH
+        return P2PKH
 
     def transfer(self, inputs: list, outputs: dict, private_keys: list):
         """
@@ -528,20 +576,37 @@ class BitCoreCoinServiceBase(CoinServiceBase):
         block_hash = self.rpc.getblockhash(block_id)
         return self.rpc.getblock(block_hash, 2)['tx']
 
+    def process_block(self, block_id):
+        transactions = self.get_block_transactions(block_id)
+        self.check_block_for_deposits(transactions)
+        self.utxo_index.update(transactions, self.get_users_addresses(), self.get_output_address)
+
     def check_tx_for_deposit(self, tx_data):
-        tx_id = tx_data['txid']
-        outputs_amount = defaultdict(Decimal)
+        self.check_block_for_deposits([tx_data])
 
-        # get total amount for each address
-        for addr, amount in self.parse_tx_outputs(tx_data):
-            outputs_amount[addr] += amount
+    def check_block_for_deposits(self, transactions):
+        users_addresses = self.get_users_addresses()
 
-        # process only our addresses
-        for addr, amount in outputs_amount.items():
-            if addr not in self.get_users_addresses():
-                continue
+        for tx_id, outputs_amount in self.get_txs_outputs(transactions):
+            # process only our addresses
+            for addr, amount in outputs_amount.items():
+                if addr not in users_addresses:
+                    continue
+
+                self.process_deposit(tx_id, addr, amount)
 
-            self.process_deposit(tx_id, addr, amount)
+    def get_txs_outputs(self, transactions) -> List[Tuple[str, dict]]:
+        """
+        Returns [(tx_id, {address: total amount})] for transactions
+        """
+        txs_outputs = []
+        for tx_data in transactions:
+            outputs_amount = defaultdict(Decimal)
+            # get total amount for each address
+            for addr, amount in self.parse_tx_outputs(tx_data):
+                outputs_amount[addr] += amount
+            txs_outputs.append((tx_data['txid'], outputs_amount))
+        return txs_outputs
 
     def get_current_block_id(self):
         return self.rpc.getblockcount()
@@ -659,22 +724,28 @@ class BitCoreCoinServiceBase(CoinServiceBase):
         return self.rpc.signrawtransaction(tx_hex, [], private_keys)
 
     @staticmethod
-    def estimate_tx_size(inputs_num: int, outputs_num: int) -> int:
-        return inputs_num * 148 + outputs_num * 34 + 10
+    def estimate_tx_size(inputs_num: int, outputs_num: int, input_type: str = P2PKH, output_type: str = P2PKH,
+                         multisig: Optional[Tuple[int, int]] = None) -> int:
+        return estimate_tx_vsize([get_input_size(input_type, multisig)] * inputs_num, [output_type] * outputs_num)
 
     @staticmethod
     def estimate_script_sig_size(required_num: int, address_num: int) -> int:
         return 5 + 74 * address_num + 34 * required_num
 
     @staticmethod
-    def parse_tx_outputs(tx_data):
+    def get_output_address(item) -> Optional[str]:
+        address = None
+        if 'addresses' in item['scriptPubKey']:
+            address = item['scriptPubKey']['addresses'][0]
+        if 'address' in item['scriptPubKey']:
+            address = item['scriptPubKey']['address']
+        return address
+
+    @classmethod
+    def parse_tx_outputs(cls, tx_data):
         outputs = []
         for item in tx_data['vout']:
-            address = None
-            if 'addresses' in item['scriptPubKey']:
-                address = item['scriptPubKey']['addresses'][0]
-            if 'address' in item['scriptPubKey']:
-                address = item['scriptPubKey']['address']
+            address = cls.get_output_address(item)
             if not address:
                 continue
             outputs.append((
@@ -1,4 +1,3 @@
-from collections import defaultdict
 from decimal import Decimal
 
 from cryptos import Bitcoin, apply_multisignatures, serialize
@@ -55,12 +54,10 @@ class BTCCoinService(BitCoreCoinServiceBase):
         # need to fill chargeback amount later
         tx_outputs[keeper_wallet.address] = 0
 
-        estimated_tx_size = self.get_multi_tx_size(
-            self.prepare_inputs(keeper_unspent),
-            self.prepare_outs(tx_outputs),
-            keeper_wallet.private_key,
-            private_key,
-            keeper_wallet.redeem_script,
+        estimated_tx_size = self.get_tx_size(
+            keeper_unspent,
+            tx_outputs,
+            redeem_script=keeper_wallet.redeem_script,
         )
         transfer_fee = self.get_transfer_fee(estimated_tx_size)
 
@@ -138,63 +135,66 @@ class BTCCoinService(BitCoreCoinServiceBase):
 
         return tx_id
 
-    def get_multi_tx_size(self, inputs: list, outputs: list, private_key: str, private_key_s: str, redeem_script: str):
-        """
-        get size raw_tx in bytes
-        """
-        raw_tx = self.multi_tx_sign(inputs, outputs, private_key, private_key_s, redeem_script)
-        tx_decode = self.rpc.decoderawtransaction(raw_tx)
-        return tx_decode.get('size')
-
-    def check_tx_for_deposit(self, tx_data):
-        tx_id = tx_data['txid']
-        outputs_amount = defaultdict(Decimal)
-
-        # get total amount for each address
-        for addr, amount in self.parse_tx_outputs(tx_data):
-            outputs_amount[addr] += amount
+    def check_block_for_deposits(self, transactions):
+        txs_outputs = self.get_txs_outputs(transactions)
 
-        output_address = ', '.join(outputs_amount)
-        accumulation_transaction: AccumulationTransaction = AccumulationTransaction.objects.filter(
-            tx_hash=tx_id,
-            tx_state=AccumulationTransaction.STATE_PENDING,
-        ).first()
+        accumulation_transactions = {
+            i.tx_hash: i for i in AccumulationTransaction.objects.filter(
+                tx_hash__in=[tx_id for tx_id, _ in txs_outputs],
+                tx_state=AccumulationTransaction.STATE_PENDING,
+            ).select_related('wallet_transaction__wallet')
+        }
+        if accumulation_transactions:
+            self.complete_accumulations(accumulation_transactions, dict(txs_outputs))
+
+        users_addresses = self.get_users_addresses()
+        min_deposit = FeesAndLimits.get_limit(self.currency.code, FeesAndLimits.DEPOSIT, FeesAndLimits.MIN_VALUE)
+
+        for tx_id, outputs_amount in txs_outputs:
+            # process only our addresses
+            for addr, amount in outputs_amount.items():
+                if addr not in users_addresses:
+                    continue
+
+                if amount < min_deposit:
+                    self.log.info('Amount %s less than min deposit limit', amount)
+                    continue
+
+                # self.process_deposit(tx_id, addr, amount)
+                if ScoreManager.need_to_check_score(tx_id, addr, amount, self.currency.code):
+                    defer_time = ScoringSettings.get_deffered_scoring_time(self.currency.code)
+                    process_deffered_deposit.apply_async((tx_id, addr, amount, self.currency.code), queue='btc', countdown=defer_time)
+                else:
+                    self.log.info('Tx amount too low for scoring')
+                    self.process_deposit(tx_id, addr, amount)
+
+    def complete_accumulations(self, accumulation_transactions, txs_outputs):
+        accumulation_details = {
+            (i.txid, i.from_address): i for i in AccumulationDetails.objects.filter(
+                txid__in=list(accumulation_transactions),
+            )
+        }
 
-        if accumulation_transaction:
+        to_create = []
+        for tx_id, accumulation_transaction in accumulation_transactions.items():
+            output_address = ', '.join(txs_outputs[tx_id])
             addr = accumulation_transaction.wallet_transaction.wallet.address
             self.log.info(f'Found accumulation from {addr} to {output_address}')
-            accumulation_details = AccumulationDetails.objects.filter(
-                txid=tx_id,
-                from_address=addr
-            ).first()
-            if not accumulation_details:
-                AccumulationDetails.objects.create(
+            details = accumulation_details.get((tx_id, addr))
+            if not details:
+                to_create.append(AccumulationDetails(
                     currency=BTC_CURRENCY,
                     txid=tx_id,
                     from_address=addr,
                     to_address=output_address,
-                )
+                ))
             else:
-                accumulation_details.to_address = output_address
-                accumulation_details.complete()
+                details.to_address = output_address
+                details.complete()
             accumulation_transaction.complete()
 
-        # process only our addresses
-        for addr, amount in outputs_amount.items():
-            if addr not in self.get_users_addresses():
-                continue
-
-            if amount < FeesAndLimits.get_limit(self.currency.code, FeesAndLimits.DEPOSIT, FeesAndLimits.MIN_VALUE):
-                self.log.info('Amount %s less than min deposit limit', amount)
-                continue
-
-            # self.process_deposit(tx_id, addr, amount)
-            if ScoreManager.need_to_check_score(tx_id, addr, amount, self.currency.code):
-                defer_time = ScoringSettings.get_deffered_scoring_time(self.currency.code)
-                process_deffered_deposit.apply_async((tx_id, addr, amount, self.currency.code), queue='btc', countdown=defer_time)
-            else:
-                self.log.info('Tx amount too low for scoring')
-                self.process_deposit(tx_id, addr, amount)
+        if to_create:
+            AccumulationDetails.objects.bulk_create(to_create)
 
     def accumulate_deposit(self, wallet_transaction, inputs_dict, private_keys_dict):
         #private_keys = {}
@@ -243,7 +243,7 @@ class BTCCoinService(BitCoreCoinServiceBase):
             self.log.warning('There are no addresses to accumulate')
             return
 
-        inputs = self.get_unspent(addresses=to_accumulate_from_addresses)
+        inputs = self.filter_spendable(self.get_indexed_unspent(to_accumulate_from_addresses))
         inputs_dict = {i['txid']: i for i in inputs}
 
         private_keys_dict = dict(UserWallet.objects.filter(
@@ -269,7 +269,7 @@ class BTCCoinService(BitCoreCoinServiceBase):
             self.log.warning('There are no addresses to accumulate')
             return
 
-        inputs = self.get_unspent(addresses=to_accumulate_from_addresses)
+        inputs = self.filter_spendable(self.get_indexed_unspent(to_accumulate_from_addresses))
         inputs_dict = {i['txid']: i for i in inputs}
 
         private_keys_dict = dict(UserWallet.objects.filter(
@@ -301,17 +301,6 @@ class BTCCoinService(BitCoreCoinServiceBase):
 
         return tx_id
 
-    def get_tx_size(self, inputs: list, outputs: dict, private_keys: dict):
-
-        inputs = self.prepare_inputs(inputs)
-        outputs = self.prepare_outs(outputs)
-        tx_hex = self.crypto_coin.mktx(inputs, outputs)
-        signed_tx_without_fee = self.crypto_coin.signall(tx_hex, private_keys)
-        signed_tx_without_fee_s = serialize(signed_tx_without_fee)
-
-        tx_decode = self.rpc.decoderawtransaction(signed_tx_without_fee_s)
-        return tx_decode.get('size')
-
     def transfer_to(self, inputs: list, address_to: str, amount: Decimal, private_keys: dict) -> [str, Decimal]:
 
         pre_outputs = {
@@ -164,6 +164,18 @@ class TronManager(BlockchainManager):
     def get_block(self, block_id):
         return self.client.get_block(block_id)
 
+    def get_blocks(self, block_ids):
+        """
+        Fetches range of blocks with one request, missing ones are None
+        """
+        response = self.client.provider.make_request('wallet/getblockbylimitnext', {
+            'startNum': block_ids[0],
+            'endNum': block_ids[-1] + 1,
+            'visible': True,
+        })
+        blocks = {i['block_header']['raw_data']['number']: i for i in response.get('block', [])}
+        return [blocks.get(block_id) for block_id in block_ids]
+
     def get_balance_in_base_denomination(self, address: str):
         return self.get_base_denomination_from_amount(self.get_balance(address))
 
@@ -241,19 +253,19 @@ class TronHandler(BaseEVMCoinHandler):
     IS_ENABLED = env('COMMON_TASKS_TRON', default=True)
 
     @classmethod
-    def process_block(cls, block_id):
+    def process_block(cls, block_id, block=None):
         started_at = time.time()
-        time.sleep(0.1)
         log.info('Processing block #%s', block_id)
 
-        try:
-            block = cls.COIN_MANAGER.get_block(block_id)
-        except BlockNotFound:
-            log.warning(f'Block not found: {block_id}')
-            return
-        except Exception as e:
-            store_last_processed_block_id(currency=cls.CURRENCY, block_id=block_id - 1)
-            raise e
+        if block is None:
+            try:
+                block = cls.COIN_MANAGER.get_block(block_id)
+            except BlockNotFound:
+                log.warning(f'Block not found: {block_id}')
+                return
+            except Exception as e:
+                store_last_processed_block_id(currency=cls.CURRENCY, block_id=block_id - 1)
+                raise e
 
         transactions = block.get('transactions', [])
 
@@ -301,16 +313,13 @@ class TronHandler(BaseEVMCoinHandler):
 
         keeper_wallet = cls.COIN_MANAGER.get_keeper_wallet()
         gas_keeper_wallet = cls.COIN_MANAGER.get_keeper_wallet()
-        trx_addresses = set(cls.COIN_MANAGER.get_user_addresses())
-
-        trx_addresses_deps = set(trx_addresses)
-        trx_addresses_deps.add(TRX_SAFE_ADDR)
+        trx_addresses = cls.COIN_MANAGER.get_user_addresses()
 
         # Deposits
         for tx in all_valid_transactions:
             # process TRX deposit
 
-            if tx.to_addr in trx_addresses_deps:
+            if tx.to_addr in trx_addresses or tx.to_addr == TRX_SAFE_ADDR:
                 # Process TRX
                 if not tx.contract_address:
                     coin_deposit_jobs.append(process_coin_deposit_task.s(cls.CURRENCY.code, tx.as_dict()))
@@ -1,10 +1,12 @@
 import logging
 
 from celery import group
+from django.conf import settings
 
 from core.models.inouts.wallet import WalletTransactions
 from core.utils.withdrawal import get_withdrawal_requests_to_process
 from cryptocoins.accumulation_manager import AccumulationManager
+from cryptocoins.evm.scanner import BlockPrefetcher
 from cryptocoins.models.accumulation_transaction import AccumulationTransaction
 from cryptocoins.tasks.evm import (
     withdraw_coin_task,
@@ -37,7 +39,7 @@ class BaseEVMCoinHandler:
     IS_ENABLED = True
 
     @classmethod
-    def process_block(cls, block_id):
+    def process_block(cls, block_id, block=None):
         """Check block for deposit, accumulation, withdrawal transactions and schedules jobs"""
         raise NotImplementedError
 
@@ -89,14 +91,18 @@ class BaseEVMCoinHandler:
                 blocks_to_process = blocks_to_process[:cls.DEFAULT_BLOCK_ID_DELTA]
 
                 if len(blocks_to_process) > 1:
-                    log.info('Need to process blocks #%s..#%s', last_processed_block_id + 1, current_block_id)
+                    log.info('Need to process blocks #%s..#%s', last_processed_block_id + 1, blocks_to_process[-1])
                 else:
                     log.info('Need to process block #%s', last_processed_block_id + 1)
 
-                for block_id in blocks_to_process:
-                    cls.process_block(block_id)
+                prefetcher = BlockPrefetcher(cls.COIN_MANAGER.get_blocks)
+                for i, (block_id, block) in enumerate(prefetcher.iter_blocks(blocks_to_process), 1):
+                    cls.process_block(block_id, block=block)
+                    # next run goes on from here if processing fails
+                    if i % settings.BLOCKS_COMMIT_PERIOD == 0:
+                        store_last_processed_block_id(currency=cls.CURRENCY, block_id=block_id)
 
-                store_last_processed_block_id(currency=cls.CURRENCY, block_id=current_block_id)
+                store_last_processed_block_id(currency=cls.CURRENCY, block_id=blocks_to_process[-1])
 
     @classmethod
     def process_coin_deposit(cls, tx_data: dict):
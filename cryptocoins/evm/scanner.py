@@ -0,0 +1,44 @@
+import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+from typing import Iterator
+from typing import List
+from typing import Tuple
+
+from django.conf import settings
+
+log = logging.getLogger(__name__)
+
+
+class BlockPrefetcher:
+    """
+    Fetches blocks ahead of processing with a bounded pool of workers and yields them in order.
+    get_blocks takes list of block ids and returns blocks in the same order, so any node or fake can be used
+    """
+
+    def __init__(self, get_blocks: Callable[[List[int]], list], workers=None, batch_size=None):
+        self.get_blocks = get_blocks
+        self.workers = workers or settings.BLOCKS_PREFETCH_WORKERS
+        self.batch_size = batch_size or settings.BLOCKS_PREFETCH_BATCH_SIZE
+
+    def iter_blocks(self, block_ids: List[int]) -> Iterator[Tuple[int, object]]:
+        batches = iter([block_ids[i:i + self.batch_size] for i in range(0, len(block_ids), self.batch_size)])
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            # at most two batches per worker in flight
+            pending = deque()
+
+            def submit():
+                batch = next(batches, None)
+                if batch:
+                    pending.append((batch, executor.submit(self.get_blocks, batch)))
+
+            for _ in range(self.workers * 2):
+                submit()
+
+            while pending:
+                batch, future = pending.popleft()
+                blocks = future.result()
+                submit()
+                yield from zip(batch, blocks)
@@ -2,7 +2,7 @@ import datetime
 import logging
 import time
 from decimal import Decimal
-from typing import Tuple, Union, List, Dict, Type, Optional
+from typing import Tuple, Union, List, Dict, Type, Optional, Set
 
 import cachetools.func
 from django.utils import timezone
@@ -14,6 +14,8 @@ from core.models import FeesAndLimits, UserWallet
 from cryptocoins.evm.base import BaseEVMCoinHandler
 from cryptocoins.exceptions import UnknownTokenSymbol, UnknownTokenAddress
 from cryptocoins.models import AccumulationDetails, AccumulationTransaction
+from cryptocoins.utils.address_index import AddressIndex
+from cryptocoins.utils.address_index import BLOCKCHAIN_ADDRESS_INDEX
 from cryptocoins.utils.commons import get_user_addresses, BlockchainAccount, get_keeper_wallet, get_user_wallet
 from cryptocoins.utils.helpers import get_amount_from_base_denomination
 from cryptocoins.utils.helpers import get_base_denomination_from_amount
@@ -206,6 +208,10 @@ class BlockchainManager:
         self._tokens: List[Token] = []
         self._token_by_address_dict: Dict[str, Token] = {}
         self._token_by_symbol_dict: Dict[str, Token] = {}
+        self._address_index = AddressIndex(
+            BLOCKCHAIN_ADDRESS_INDEX.format(self.CURRENCY.code),
+            lambda: get_user_addresses(blockchain_currency=self.CURRENCY),
+        )
         self._register_tokens()
 
     def get_latest_block_num(self):
@@ -214,6 +220,12 @@ class BlockchainManager:
     def get_block(self, block_id):
         raise NotImplementedError
 
+    def get_blocks(self, block_ids):
+        """
+        Returns blocks in order of ids, called concurrently by block prefetcher
+        """
+        return [self.get_block(block_id) for block_id in block_ids]
+
     def get_balance_in_base_denomination(self, address: str):
         raise NotImplementedError
 
@@ -282,9 +294,8 @@ class BlockchainManager:
             raise UnknownTokenAddress(address)
         return token
 
-    @cachetools.func.ttl_cache(ttl=5)
-    def get_user_addresses(self) -> List[str]:
-        return get_user_addresses(blockchain_currency=self.CURRENCY)
+    def get_user_addresses(self) -> Set[str]:
+        return self._address_index.get_addresses()
 
     @cachetools.func.ttl_cache(ttl=60)
     def get_keeper_wallet(self) -> BlockchainAccount:
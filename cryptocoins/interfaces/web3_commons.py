@@ -3,14 +3,19 @@ import time
 from decimal import Decimal
 from typing import Type, Union, Optional
 
+import requests
 from celery import group
 from django.core.cache import cache
 from eth_abi.codec import ABICodec
 from eth_abi.exceptions import NonEmptyPaddingBytes
 from eth_abi.registry import registry
 from web3 import Web3
+from web3._utils.method_formatters import block_formatter
 from web3._utils.threads import Timeout
+from web3.datastructures import AttributeDict
 from web3.exceptions import TransactionNotFound
+from web3.middleware import geth_poa_middleware
+from web3.middleware.geth_poa import geth_poa_cleanup
 
 from core.models import FeesAndLimits
 from core.models.inouts.withdrawal import PENDING as WR_PENDING
@@ -131,6 +136,7 @@ class Web3Token(Token):
 class Web3Manager(BlockchainManager):
     GAS_PRICE_CACHE_CLASS: Type[GasPriceCache] = None
     DEFAULT_RECEIPT_WAIT_TIMEOUT: int = 1 * 60
+    BLOCKS_BATCH_TIMEOUT: int = 30
     BASE_DENOMINATION_DECIMALS: int = 18
     CHAIN_ID: int
 
@@ -157,6 +163,54 @@ class Web3Manager(BlockchainManager):
     def get_block(self, block_id):
         return self.client.eth.get_block(block_id, full_transactions=True)
 
+    def get_blocks(self, block_ids):
+        """
+        Fetches blocks with one batched JSON-RPC request, falls back to single requests
+        if node does not support batches
+        """
+        endpoint_uri = getattr(self.client.provider, 'endpoint_uri', None)
+        if not endpoint_uri or len(block_ids) == 1:
+            return super().get_blocks(block_ids)
+
+        payload = [{
+            'jsonrpc': '2.0',
+            'id': i,
+            'method': 'eth_getBlockByNumber',
+            'params': [hex(block_id), True],
+        } for i, block_id in enumerate(block_ids)]
+
+        try:
+            response = requests.post(str(endpoint_uri), json=payload, timeout=self.BLOCKS_BATCH_TIMEOUT)
+            response.raise_for_status()
+            results = response.json()
+        except (requests.RequestException, ValueError):
+            log.warning('Batch request of blocks #%s..#%s failed', block_ids[0], block_ids[-1])
+            return super().get_blocks(block_ids)
+
+        if not isinstance(results, list):
+            return super().get_blocks(block_ids)
+
+        results = {i.get('id'): i.get('result') for i in results}
+        blocks = []
+        for i, block_id in enumerate(block_ids):
+            block = None
+            if results.get(i):
+                try:
+                    block = self.format_block(results[i])
+                except (ValueError, TypeError, KeyError):
+                    log.warning('Unable to format block #%s from batch', block_id, exc_info=True)
+            # not found, errored in batch or unknown format
+            blocks.append(block or self.get_block(block_id))
+        return blocks
+
+    def format_block(self, result):
+        """
+        Batched requests bypass client middlewares, so POA chains cleanup is applied here
+        """
+        if geth_poa_middleware in self.client.middleware_onion:
+            result = geth_poa_cleanup(result)
+        return AttributeDict.recursive(block_formatter(result))
+
     def get_balance_in_base_denomination(self, address: str):
         return self.client.eth.get_balance(Web3.to_checksum_address(address))
 
@@ -321,11 +375,12 @@ class Web3CommonHandler(BaseEVMCoinHandler):
     W3_CLIENT = None
 
     @classmethod
-    def process_block(cls, block_id):
+    def process_block(cls, block_id, block=None):
         started_at = time.time()
         log.info('Processing block #%s', block_id)
 
-        block = cls.COIN_MANAGER.get_block(block_id)
+        if block is None:
+            block = cls.COIN_MANAGER.get_block(block_id)
 
         if block is None:
             log.error('Failed to get block #%s, skip...', block_id)
@@ -365,7 +420,15 @@ class Web3CommonHandler(BaseEVMCoinHandler):
         check_coin_withdrawal_jobs = []
         check_tokens_withdrawal_jobs = []
 
-        # Withdrawals
+        user_addresses = cls.COIN_MANAGER.get_user_addresses()
+        coin_keeper = cls.COIN_MANAGER.get_keeper_wallet()
+        coin_gas_keeper = cls.COIN_MANAGER.get_gas_keeper_wallet()
+
+        keeper_addresses = {coin_keeper.address, coin_gas_keeper.address, cls.SAFE_ADDR}
+
+        accumulation_txs = []
+
+        # every tx is decoded once and checked for withdrawal, deposit and accumulation
         for tx_data in transactions:
             tx = cls.TRANSACTION_CLASS.from_node(tx_data)
             if not tx:
@@ -377,33 +440,18 @@ class Web3CommonHandler(BaseEVMCoinHandler):
                 check_coin_withdrawal_jobs.append(
                     check_tx_withdrawal_task.s(cls.CURRENCY.code, withdrawal_id, tx.as_dict())
                 )
-                continue
 
             # is TOKENS withdrawal request tx?
-            if tx.hash in tokens_withdrawal_requests_pending_txs:
+            elif tx.hash in tokens_withdrawal_requests_pending_txs:
                 withdrawal_id = tokens_withdrawal_requests_pending_txs[tx.hash]
                 check_tokens_withdrawal_jobs.append(
                     check_tx_withdrawal_task.s(cls.CURRENCY.code, withdrawal_id, tx.as_dict())
                 )
-                continue
-
-        user_addresses = set(cls.COIN_MANAGER.get_user_addresses())
-        coin_keeper = cls.COIN_MANAGER.get_keeper_wallet()
-        coin_gas_keeper = cls.COIN_MANAGER.get_gas_keeper_wallet()
-
-        deposit_addresses = set(user_addresses)
-        deposit_addresses.add(cls.SAFE_ADDR)
-
-        # Deposits
-        for tx_data in transactions:
-            tx = cls.TRANSACTION_CLASS.from_node(tx_data)
-            if not tx:
-                continue
 
             if tx.to_addr is None:
                 continue
 
-            if tx.to_addr in deposit_addresses:
+            if tx.to_addr in user_addresses or tx.to_addr == cls.SAFE_ADDR:
                 # process coin deposit
                 if not tx.contract_address:
                     coin_deposit_jobs.append(process_coin_deposit_task.s(cls.CURRENCY.code, tx.as_dict()))
@@ -411,6 +459,11 @@ class Web3CommonHandler(BaseEVMCoinHandler):
                 else:
                     tokens_deposit_jobs.append(process_tokens_deposit_task.s(cls.CURRENCY.code, tx.as_dict()))
 
+            # accumulations are exchange addresses withdrawals outside the exchange, except keepers ones
+            if tx.from_addr in user_addresses and tx.from_addr not in keeper_addresses \
+                    and tx.to_addr not in user_addresses:
+                accumulation_txs.append(tx)
+
         if coin_deposit_jobs:
             log.info('Need to check %s deposits count: %s', cls.CURRENCY.code, len(coin_deposit_jobs))
             group(coin_deposit_jobs).apply_async(queue=f'{cls.CURRENCY.code.lower()}_deposits')
@@ -428,71 +481,58 @@ class Web3CommonHandler(BaseEVMCoinHandler):
                      len(check_coin_withdrawal_jobs))
             group(check_tokens_withdrawal_jobs).apply_async(queue=f'{cls.CURRENCY.code.lower()}_check_balances')
 
-        # check accumulations
-        for tx_data in transactions:
-            tx = cls.TRANSACTION_CLASS.from_node(tx_data)
-            if not tx:
-                continue
-
-            # checks only exchange addresses withdrawals
-            if tx.from_addr not in user_addresses:
-                continue
-
-            # skip txs from keepers
-            if tx.from_addr in [coin_keeper.address, coin_gas_keeper.address, cls.SAFE_ADDR]:
-                continue
-
-            # checks only if currency flows outside the exchange
-            if tx.to_addr in user_addresses:
-                continue
-
-            # check TOKENS accumulations
-            if tx.contract_address:
-                token = cls.COIN_MANAGER.get_token_by_address(tx.contract_address)
-
-                accumulation_details, created = AccumulationDetails.objects.get_or_create(
-                    txid=tx.hash,
-                    defaults=dict(
-                        txid=tx.hash,
-                        from_address=tx.from_addr,
-                        to_address=tx.to_addr,
-                        currency=cls.CURRENCY,
-                        token_currency=token.currency,
-                        state=AccumulationDetails.STATE_COMPLETED,
-                    )
-                )
-                if not created:
-                    log.info(f'Found accumulation {token.currency} from {tx.from_addr} to {tx.to_addr}')
-                    accumulation_details.to_address = tx.to_addr
-                    accumulation_details.complete()
-                else:
-                    log.info(f'Unexpected accumulation {token.currency} from {tx.from_addr} to {tx.to_addr}')
-
-            # check coin accumulations
-            else:
-                accumulation_details, created = AccumulationDetails.objects.get_or_create(
-                    txid=tx.hash,
-                    defaults=dict(
-                        txid=tx.hash,
-                        from_address=tx.from_addr,
-                        to_address=tx.to_addr,
-                        currency=cls.CURRENCY,
-                        state=AccumulationDetails.STATE_COMPLETED,
-                    )
-                )
-                if not created:
-                    log.info(f'Found accumulation {cls.CURRENCY.code} from {tx.from_addr} to {tx.to_addr}')
-                    # Use to_address only from node
-                    accumulation_details.to_address = Web3.to_checksum_address(tx.to_addr)
-                    accumulation_details.complete()
-                else:
-                    log.info(f'Unexpected accumulation {cls.CURRENCY.code} from {tx.from_addr} to {tx.to_addr}')
+        if accumulation_txs:
+            cls._complete_accumulations(accumulation_txs)
 
         execution_time = time.time() - started_at
         log.info('Block #%s processed in %.2f sec. (%s TX count: %s, %s TOKENS TX count: %s, WR TX count: %s)',
                  block_id, execution_time, cls.CURRENCY.code, len(coin_deposit_jobs), cls.CURRENCY.code,
                  len(tokens_deposit_jobs), len(check_tokens_withdrawal_jobs) + len(check_coin_withdrawal_jobs))
 
+    @classmethod
+    def _complete_accumulations(cls, txs):
+        """
+        Completes accumulation details of txs, unexpected accumulations are saved as completed
+        """
+        existing = {}
+        for accumulation_details in AccumulationDetails.objects.filter(txid__in=[tx.hash for tx in txs]):
+            existing.setdefault(accumulation_details.txid, accumulation_details)
+
+        to_update = []
+        to_create = []
+        for tx in txs:
+            token_currency = None
+            if tx.contract_address:
+                token_currency = cls.COIN_MANAGER.get_token_by_address(tx.contract_address).currency
+                currency = token_currency
+                to_address = tx.to_addr
+            else:
+                currency = cls.CURRENCY.code
+                # Use to_address only from node
+                to_address = Web3.to_checksum_address(tx.to_addr)
+
+            accumulation_details = existing.get(tx.hash)
+            if accumulation_details:
+                log.info(f'Found accumulation {currency} from {tx.from_addr} to {tx.to_addr}')
+                accumulation_details.to_address = to_address
+                accumulation_details.state = AccumulationDetails.STATE_COMPLETED
+                to_update.append(accumulation_details)
+            else:
+                log.info(f'Unexpected accumulation {currency} from {tx.from_addr} to {tx.to_addr}')
+                to_create.append(AccumulationDetails(
+                    txid=tx.hash,
+                    from_address=tx.from_addr,
+                    to_address=tx.to_addr,
+                    currency=cls.CURRENCY,
+                    token_currency=token_currency,
+                    state=AccumulationDetails.STATE_COMPLETED,
+                ))
+
+        if to_update:
+            AccumulationDetails.objects.bulk_update(to_update, ['to_address', 'state'])
+        if to_create:
+            AccumulationDetails.objects.bulk_create(to_create)
+
     @classmethod
     def check_tx_withdrawal(cls, withdrawal_id, tx_data):
         tx = cls.TRANSACTION_CLASS(tx_data)
@@ -0,0 +1,48 @@
+from django.db import transaction
+from django.db.models.signals import post_delete
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from core.models.cryptocoins import UserWallet
+from cryptocoins.models.keeper import Keeper
+from cryptocoins.utils.address_index import AddressIndex
+from cryptocoins.utils.address_index import BLOCKCHAIN_ADDRESS_INDEX
+from cryptocoins.utils.address_index import USERS_ADDRESS_INDEX
+
+
+@receiver(post_save, sender=UserWallet)
+def on_user_wallet_saved(sender, instance: UserWallet, created, **kwargs):
+    if not created:
+        return
+    # index reload before commit would not see the wallet and skip its log entry
+    names = [BLOCKCHAIN_ADDRESS_INDEX.format(instance.blockchain_currency.code)]
+    if instance.user_id:
+        names.append(USERS_ADDRESS_INDEX.format(instance.currency.code))
+    address = instance.address
+
+    def add_address():
+        for name in names:
+            AddressIndex.add_address(name, address)
+
+    transaction.on_commit(add_address)
+
+
+@receiver(post_delete, sender=UserWallet)
+def on_user_wallet_deleted(sender, instance: UserWallet, **kwargs):
+    names = [
+        BLOCKCHAIN_ADDRESS_INDEX.format(instance.blockchain_currency.code),
+        USERS_ADDRESS_INDEX.format(instance.currency.code),
+    ]
+
+    def reset():
+        for name in names:
+            AddressIndex.reset(name)
+
+    transaction.on_commit(reset)
+
+
+@receiver(post_save, sender=Keeper)
+def on_keeper_saved(sender, instance: Keeper, **kwargs):
+    # keeper wallets are not user ones
+    name = USERS_ADDRESS_INDEX.format(instance.currency.code)
+    transaction.on_commit(lambda: AddressIndex.reset(name))
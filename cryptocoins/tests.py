@@ -0,0 +1,200 @@
+from decimal import Decimal
+from types import SimpleNamespace
+
+import pytest
+from django.contrib.auth import get_user_model
+from web3 import Web3
+from web3.middleware import geth_poa_middleware
+
+from core.currency import Currency
+from core.models.cryptocoins import UserWallet
+from cryptocoins.evm.scanner import BlockPrefetcher
+from cryptocoins.interfaces import web3_commons
+from cryptocoins.interfaces.web3_commons import Web3Manager
+from cryptocoins.utils.address_index import ADDRESS_INDEX_LOG_KEY
+from cryptocoins.utils.address_index import BLOCKCHAIN_ADDRESS_INDEX
+from cryptocoins.utils.address_index import USERS_ADDRESS_INDEX
+from cryptocoins.utils.btc import P2PKH
+from cryptocoins.utils.btc import P2SH
+from cryptocoins.utils.btc import P2WPKH
+from cryptocoins.utils.btc import P2WSH
+from cryptocoins.utils.btc import estimate_tx_vsize
+from cryptocoins.utils.btc import get_input_size
+from cryptocoins.utils.btc import parse_multisig_redeem_script
+from cryptocoins.utils.utxo_index import UtxoIndex
+from lib.cache import redis_client
+
+
+class FakeNode:
+    """
+    Returns block ids as blocks and records requested batches
+    """
+
+    def __init__(self):
+        self.batches = []
+
+    def get_blocks(self, block_ids):
+        self.batches.append(list(block_ids))
+        return [{'number': i} for i in block_ids]
+
+
+class TestBlockPrefetcher:
+
+    def test_blocks_in_order(self):
+        node = FakeNode()
+        block_ids = list(range(100, 137))
+        prefetcher = BlockPrefetcher(node.get_blocks, workers=4, batch_size=5)
+
+        result = list(prefetcher.iter_blocks(block_ids))
+
+        assert [block_id for block_id, _ in result] == block_ids
+        assert all(block['number'] == block_id for block_id, block in result)
+        assert sorted(i for batch in node.batches for i in batch) == block_ids
+        assert max(len(batch) for batch in node.batches) == 5
+
+    def test_no_blocks(self):
+        node = FakeNode()
+        assert list(BlockPrefetcher(node.get_blocks, workers=2, batch_size=3).iter_blocks([])) == []
+        assert node.batches == []
+
+
+class TestWeb3ManagerGetBlocks:
+
+    def make_manager(self, poa):
+        client = Web3(Web3.HTTPProvider('http://fake-node'))
+        if poa:
+            client.middleware_onion.inject(geth_poa_middleware, layer=0)
+        # tokens registration needs db
+        manager = Web3Manager.__new__(Web3Manager)
+        manager.client = client
+        return manager
+
+    def fake_batch(self, monkeypatch, extra_data, block_hash='0x' + '11' * 32):
+        def post(url, json, timeout):
+            results = [{
+                'jsonrpc': '2.0',
+                'id': i['id'],
+                'result': {
+                    'number': i['params'][0],
+                    'hash': block_hash,
+                    'extraData': extra_data,
+                    'transactions': [],
+                },
+            } for i in json]
+            return SimpleNamespace(raise_for_status=lambda: None, json=lambda: results)
+
+        monkeypatch.setattr(web3_commons.requests, 'post', post)
+
+    def test_poa_blocks(self, monkeypatch):
+        # BSC and Polygon extraData is longer than 32 bytes
+        self.fake_batch(monkeypatch, '0x' + '00' * 97)
+        manager = self.make_manager(poa=True)
+
+        blocks = manager.get_blocks([16, 17])
+
+        assert [i.number for i in blocks] == [16, 17]
+        assert len(blocks[0].proofOfAuthorityData) == 97
+
+    def test_unformatted_block_fallback(self, monkeypatch):
+        self.fake_batch(monkeypatch, '0x', block_hash='not-hex')
+        manager = self.make_manager(poa=True)
+        monkeypatch.setattr(manager, 'get_block', lambda block_id: {'number': block_id})
+
+        assert manager.get_blocks([16, 17]) == [{'number': 16}, {'number': 17}]
+
+
+class TestTxSize:
+
+    def test_single_key_inputs(self):
+        assert estimate_tx_vsize([get_input_size(P2PKH)], [P2PKH]) == 192
+        assert estimate_tx_vsize([get_input_size(P2WPKH)], [P2WPKH]) == 110
+        # P2SH-P2WPKH
+        assert estimate_tx_vsize([get_input_size(P2SH)], [P2SH]) == 134
+
+    def test_many_inputs(self):
+        assert estimate_tx_vsize([get_input_size(P2WPKH)] * 300, [P2WPKH]) == 20444
+        # mixed inputs have empty witness for legacy ones
+        assert estimate_tx_vsize([get_input_size(P2PKH), get_input_size(P2WPKH)], [P2PKH, P2WSH]) == 304
+
+    def test_multisig(self):
+        redeem_script = '52' + ('21' + '02' * 33) * 3 + '53ae'
+        multisig = parse_multisig_redeem_script(redeem_script)
+        assert multisig == (2, 3)
+        assert get_input_size(P2SH, multisig) == (297, 0)
+        assert get_input_size(P2WSH, multisig) == (41, 254)
+        with pytest.raises(ValueError):
+            get_input_size(P2WSH)
+
+
+def make_tx(txid, vin, vout):
+    return {
+        'txid': txid,
+        'vin': [{'txid': i, 'vout': n} for i, n in vin] or [{'coinbase': '00'}],
+        'vout': [{'n': n, 'value': Decimal(value), 'scriptPubKey': {'address': address}}
+                 for n, (address, value) in enumerate(vout)],
+    }
+
+
+def get_output_address(item):
+    return item['scriptPubKey'].get('address')
+
+
+class TestUtxoIndex:
+
+    @pytest.fixture
+    def index(self):
+        index = UtxoIndex('TEST')
+        yield index
+        redis_client.delete(index.key, index.ready_key, index.fill_key)
+
+    def test_fill(self, index):
+        assert not index.is_ready()
+        index.fill([{'txid': 'a', 'vout': 0, 'address': 'user1', 'amount': Decimal('0.1')}])
+        assert index.is_ready()
+        assert index.get_unspent() == [{'txid': 'a', 'vout': 0, 'address': 'user1', 'amount': Decimal('0.1')}]
+
+        # refill replaces stale entries
+        index.fill([{'txid': 'b', 'vout': 1, 'address': 'user2', 'amount': Decimal('0.2')}])
+        assert [i['txid'] for i in index.get_unspent()] == ['b']
+
+        # lost hash is refilled
+        redis_client.delete(index.key)
+        assert not index.is_ready()
+
+    def test_update_from_blocks(self, index):
+        addresses = {'user1', 'user2'}
+        index.update([
+            make_tx('a', [], [('user1', '0.1'), ('other', '5')]),
+            make_tx('b', [('x', 0)], [('user2', '0.2'), ('user1', '0.3')]),
+        ], addresses, get_output_address)
+        assert sorted((i['txid'], i['vout']) for i in index.get_unspent()) == [('a', 0), ('b', 0), ('b', 1)]
+        assert [i['amount'] for i in index.get_unspent(['user2'])] == [Decimal('0.2')]
+
+        # spent in a processed block, including outputs created in the same block
+        index.update([
+            make_tx('c', [('a', 0)], [('user2', '0.05')]),
+            make_tx('d', [('c', 0), ('b', 1)], [('other', '0.3')]),
+        ], addresses, get_output_address)
+        assert [(i['txid'], i['vout']) for i in index.get_unspent()] == [('b', 0)]
+
+
+@pytest.mark.django_db
+class TestAddressIndexLog:
+
+    @pytest.fixture
+    def log_keys(self):
+        keys = [ADDRESS_INDEX_LOG_KEY.format(i.format('BTC')) for i in (BLOCKCHAIN_ADDRESS_INDEX, USERS_ADDRESS_INDEX)]
+        redis_client.delete(*keys)
+        yield keys
+        redis_client.delete(*keys)
+
+    def test_address_logged_after_commit(self, log_keys, django_capture_on_commit_callbacks):
+        user = get_user_model().objects.create_user(username='wallet@test.local', email='wallet@test.local')
+        btc = Currency.get('BTC')
+
+        with django_capture_on_commit_callbacks(execute=True):
+            UserWallet.objects.create(user=user, currency=btc, blockchain_currency=btc, address='test-address')
+            # reload before commit would not find the wallet in db
+            assert [redis_client.llen(i) for i in log_keys] == [0, 0]
+
+        assert [redis_client.lrange(i, 0, -1) for i in log_keys] == [[b'test-address'], [b'test-address']]
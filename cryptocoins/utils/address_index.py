@@ -0,0 +1,74 @@
+import threading
+import time
+from typing import Callable
+from typing import Iterable
+from typing import Set
+
+from django.conf import settings
+
+from lib.cache import redis_client
+
+ADDRESS_INDEX_LOG_KEY = 'address-index:{}'
+ADDRESS_INDEX_GENERATION_KEY = 'address-index:{}:generation'
+
+BLOCKCHAIN_ADDRESS_INDEX = 'blockchain-{}'  # all wallets of blockchain currency
+USERS_ADDRESS_INDEX = 'users-{}'  # user wallets of currency
+
+
+class AddressIndex:
+    """
+    Process-local set of wallet addresses, loaded from db only once.
+    New addresses are appended to shared redis log, every process applies new log entries
+    at most once per ADDRESS_INDEX_CHECK_PERIOD instead of reloading all addresses.
+    After reset() all processes reload addresses from db.
+    Returned set is shared by the process, callers must not modify it
+    """
+
+    def __init__(self, name: str, loader: Callable[[], Iterable[str]]):
+        self.log_key = ADDRESS_INDEX_LOG_KEY.format(name)
+        self.generation_key = ADDRESS_INDEX_GENERATION_KEY.format(name)
+        self.loader = loader
+        self.addresses: Set[str] = None
+        self.generation = None
+        self.version = 0  # applied log entries
+        self.checked = 0
+        self.lock = threading.Lock()
+
+    def __contains__(self, address):
+        return address in self.get_addresses()
+
+    def get_addresses(self) -> Set[str]:
+        now = time.monotonic()
+        if self.addresses is not None and now - self.checked < settings.ADDRESS_INDEX_CHECK_PERIOD:
+            return self.addresses
+
+        with self.lock:
+            pipe = redis_client.pipeline()
+            pipe.get(self.generation_key)
+            pipe.llen(self.log_key)
+            generation, length = pipe.execute()
+
+            if self.addresses is None or generation != self.generation or length < self.version:
+                # log entries made before the load are in db already
+                self.addresses = set(self.loader())
+            elif length > self.version:
+                self.addresses.update(i.decode() for i in redis_client.lrange(self.log_key, self.version, length - 1))
+
+            self.generation = generation
+            self.version = length
+            self.checked = now
+        return self.addresses
+
+    @classmethod
+    def add_address(cls, name: str, address: str):
+        redis_client.rpush(ADDRESS_INDEX_LOG_KEY.format(name), address)
+
+    @classmethod
+    def reset(cls, name: str):
+        """
+        Makes all processes reload index, needed after wallets removal
+        """
+        pipe = redis_client.pipeline()
+        pipe.delete(ADDRESS_INDEX_LOG_KEY.format(name))
+        pipe.incr(ADDRESS_INDEX_GENERATION_KEY.format(name))
+        pipe.execute()
@@ -1,6 +1,7 @@
 import json
+import math
 from collections import OrderedDict
-from typing import Tuple, Any
+from typing import Tuple, Any, List, Optional
 
 from cryptos import Bitcoin
 from django.conf import settings
@@ -14,6 +15,20 @@ from lib.helpers import to_decimal
 from hashlib import sha256, new
 from base58 import b58encode
 
+P2PKH = 'p2pkh'
+P2SH = 'p2sh'
+P2WPKH = 'p2wpkh'
+P2WSH = 'p2wsh'
+
+# scriptPubKey sizes by script type
+OUTPUT_SCRIPT_SIZES = {
+    P2PKH: 25,
+    P2SH: 23,
+    P2WPKH: 22,
+    P2WSH: 34,
+}
+SIGNATURE_SIZE = 72  # the longest DER signature with sighash type
+PUBKEY_SIZE = 33  # compressed
 
 def sha256d(bstr):
     return sha256(sha256(bstr).digest()).digest()
@@ -41,6 +56,87 @@ def sat2btc(sat):
     return to_decimal(sat) / to_decimal(10**8)
 
 
+def var_int_size(n: int) -> int:
+    if n < 0xfd:
+        return 1
+    if n <= 0xffff:
+        return 3
+    return 5
+
+
+def push_size(n: int) -> int:
+    """
+    Size of opcodes pushing n bytes to stack
+    """
+    if n < 0x4c:
+        return 1
+    if n <= 0xff:
+        return 2
+    return 3
+
+
+def parse_multisig_redeem_script(redeem_script: str) -> Tuple[int, int]:
+    """
+    Returns (required, total) keys of OP_m <pubkeys> OP_n OP_CHECKMULTISIG script hex
+    """
+    return int(redeem_script[:2], 16) - 0x50, int(redeem_script[-4:-2], 16) - 0x50
+
+
+def get_input_size(script_type: str, multisig: Optional[Tuple[int, int]] = None) -> Tuple[int, int]:
+    """
+    Returns (non-witness, witness) sizes of signed input spending script_type output.
+    multisig is (required, total) keys of P2SH or P2WSH script, P2SH without it is P2SH-P2WPKH
+    """
+    outpoint = 32 + 4 + 4  # prev txid, vout, sequence
+    p2wpkh_witness = 1 + push_size(SIGNATURE_SIZE) + SIGNATURE_SIZE + push_size(PUBKEY_SIZE) + PUBKEY_SIZE
+
+    if script_type == P2PKH:
+        script_sig = push_size(SIGNATURE_SIZE) + SIGNATURE_SIZE + push_size(PUBKEY_SIZE) + PUBKEY_SIZE
+        return outpoint + var_int_size(script_sig) + script_sig, 0
+
+    if script_type == P2WPKH:
+        return outpoint + 1, p2wpkh_witness
+
+    if script_type == P2SH and not multisig:
+        script_sig = 1 + OUTPUT_SCRIPT_SIZES[P2WPKH]
+        return outpoint + 1 + script_sig, p2wpkh_witness
+
+    if not multisig:
+        raise ValueError(f'Keys number required for {script_type} input')
+
+    required, total = multisig
+    redeem_script = 3 + total * (1 + PUBKEY_SIZE)
+    signatures = required * (1 + SIGNATURE_SIZE)
+
+    if script_type == P2WSH:
+        # items number, empty item for CHECKMULTISIG, signatures, redeem script
+        witness = 1 + 1 + signatures + var_int_size(redeem_script) + redeem_script
+        return outpoint + 1, witness
+
+    # OP_0, signatures, redeem script
+    script_sig = 1 + signatures + push_size(redeem_script) + redeem_script
+    return outpoint + var_int_size(script_sig) + script_sig, 0
+
+
+def estimate_tx_vsize(inputs: List[Tuple[int, int]], output_types: List[str]) -> int:
+    """
+    Virtual size of signed transaction by get_input_size results and output script types
+    """
+    # version, inputs and outputs number, locktime
+    size = 4 + var_int_size(len(inputs)) + var_int_size(len(output_types)) + 4
+    size += sum(i[0] for i in inputs)
+    for script_type in output_types:
+        script_size = OUTPUT_SCRIPT_SIZES[script_type]
+        size += 8 + var_int_size(script_size) + script_size
+
+    witness = sum(i[1] for i in inputs)
+    if witness:
+        # marker, flag and empty witness of non segwit inputs
+        witness += 2 + sum(1 for i in inputs if not i[1])
+
+    return math.ceil(size + witness / 4)
+
+
 def generate_btc_multisig_keeper(log=None) -> Tuple[OrderedDict, Keeper]:
     from cryptocoins.coins.btc.service import BTCCoinService
     service = BTCCoinService()
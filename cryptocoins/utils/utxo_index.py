@@ -0,0 +1,113 @@
+import json
+from typing import Iterable
+from typing import List
+from typing import Optional
+
+from django.conf import settings
+
+from lib.batch import chunks
+from lib.cache import redis_client
+from lib.helpers import to_decimal
+
+UTXO_INDEX_KEY = 'utxo-index:{}'  # currency
+UTXO_INDEX_READY_KEY = 'utxo-index:{}:ready'  # currency
+UTXO_INDEX_FILL_KEY = 'utxo-index:{}:fill'  # currency
+
+UTXO_INDEX_WRITE_BATCH_SIZE = 1000
+
+
+class UtxoIndex:
+    """
+    Unspent outputs of user addresses in shared redis hash {txid:vout: {address, amount}}.
+    Processed blocks add outputs to user addresses and remove spent ones, so listunspent over every
+    user address is needed only to refill the index once per UTXO_INDEX_RECONCILE_PERIOD.
+    Entries spent in mempool stay till the spend is confirmed, callers check them with gettxout before spending.
+    Entries left by reorgs are dropped on refill
+    """
+
+    def __init__(self, currency_code: str):
+        self.key = UTXO_INDEX_KEY.format(currency_code)
+        self.ready_key = UTXO_INDEX_READY_KEY.format(currency_code)
+        self.fill_key = UTXO_INDEX_FILL_KEY.format(currency_code)
+
+    @staticmethod
+    def outpoint(txid: str, vout: int) -> str:
+        return f'{txid}:{vout}'
+
+    def is_ready(self) -> bool:
+        """
+        Index is filled and not due for reconcile, empty hash with ready key means lost redis data
+        """
+        pipe = redis_client.pipeline()
+        pipe.exists(self.ready_key)
+        pipe.exists(self.key)
+        ready, filled = pipe.execute()
+        return bool(ready and filled)
+
+    def fill(self, unspent: list):
+        """
+        Atomically replaces index with listunspent results.
+        Outputs of blocks processed during listunspent call could be missed till the next refill
+        """
+        pipe = redis_client.pipeline()
+        pipe.delete(self.fill_key)
+        for chunk in chunks(unspent, UTXO_INDEX_WRITE_BATCH_SIZE):
+            pipe.hset(self.fill_key, mapping={
+                self.outpoint(i['txid'], i['vout']): self.dump(i['address'], i['amount']) for i in chunk
+            })
+        if unspent:
+            pipe.rename(self.fill_key, self.key)
+        else:
+            pipe.delete(self.key)
+        pipe.set(self.ready_key, 1, ex=settings.UTXO_INDEX_RECONCILE_PERIOD)
+        pipe.execute()
+
+    def update(self, transactions: list, addresses: Iterable[str], get_output_address):
+        """
+        Applies block transactions: indexes outputs to addresses, removes spent outputs
+        """
+        added = {}
+        spent = []
+        for tx_data in transactions:
+            for vin in tx_data['vin']:
+                # coinbase inputs have no previous output
+                if 'txid' in vin:
+                    spent.append(self.outpoint(vin['txid'], vin['vout']))
+
+            for item in tx_data['vout']:
+                address = get_output_address(item)
+                if address and address in addresses:
+                    added[self.outpoint(tx_data['txid'], item['n'])] = self.dump(address, item['value'])
+
+        pipe = redis_client.pipeline()
+        if added:
+            pipe.hset(self.key, mapping=added)
+        # outputs spent in the same block are removed after adding
+        for chunk in chunks(spent, UTXO_INDEX_WRITE_BATCH_SIZE):
+            pipe.hdel(self.key, *chunk)
+        pipe.execute()
+
+    def get_unspent(self, addresses: Optional[Iterable[str]] = None) -> List[dict]:
+        """
+        Returns indexed outputs of addresses in listunspent format
+        """
+        if addresses is not None and not isinstance(addresses, (set, frozenset)):
+            addresses = set(addresses)
+
+        unspent = []
+        for outpoint, value in redis_client.hgetall(self.key).items():
+            data = json.loads(value)
+            if addresses is not None and data['address'] not in addresses:
+                continue
+            txid, vout = outpoint.decode().rsplit(':', 1)
+            unspent.append({
+                'txid': txid,
+                'vout': int(vout),
+                'address': data['address'],
+                'amount': to_decimal(data['amount']),
+            })
+        return unspent
+
+    @staticmethod
+    def dump(address: str, amount) -> str:
+        return json.dumps({'address': address, 'amount': str(amount)})
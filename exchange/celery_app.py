@@ -285,6 +285,13 @@ if is_section_enabled('cleanup'):
                 'queue': 'cleanup',
             },
         },
+        'create_future_partitions': {
+            'task': 'core.tasks.stats.create_future_partitions',
+            'schedule': crontab(minute='16', hour='0'),
+            'options': {
+                'queue': 'cleanup',
+            },
+        },
         'clean_old_difbalances': {
             'task': 'core.tasks.inouts.clean_old_difbalances',
             'schedule': crontab(minute='15', hour='0'),
@@ -376,23 +383,7 @@ if is_section_enabled('stats'):
         'trades_agg_minute': {
             'task': 'core.tasks.stats.plan_trades_aggregation',
             'schedule': crontab(minute='*'),
-            'args': ('minute',),
-            'options': {
-                'queue': 'stats',
-            }
-        },
-        'trades_agg_hour': {
-            'task': 'core.tasks.stats.plan_trades_aggregation',
-            'schedule': crontab(minute='1'),
-            'args': ('hour',),
-            'options': {
-                'queue': 'stats',
-            }
-        },
-        'trades_agg_day': {
-            'task': 'core.tasks.stats.plan_trades_aggregation',
-            'schedule': crontab(minute='1', hour='0'),
-            'args': ('day',),
+            'args': (),
             'options': {
                 'queue': 'stats',
             }
@@ -418,6 +409,13 @@ if is_section_enabled('stats'):
                 'queue': 'stats',
             },
         },
+        'reconcile_amount_in_orders': {
+            'task': 'core.tasks.inouts.reconcile_amount_in_orders',
+            'schedule': crontab(minute='*/30'),
+            'options': {
+                'queue': 'stats',
+            },
+        },
         'calculate_dif_balances_1m': {
             'task': 'core.tasks.inouts.calculate_dif_balances',
             'schedule': crontab(minute='0', hour='1', day_of_month='*/10'),
@@ -1,11 +1,22 @@
+import asyncio
+import copy
+import itertools
 import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from collections import defaultdict
 
 from asgiref.sync import async_to_sync
 from channels.layers import get_channel_layer
+from django.conf import settings
 from django.core.cache import cache
-from django.utils.timezone import now
+from django.db import close_old_connections
+from django.db import transaction
 
 from core.orderbook.helpers import get_stack_by_pair
+from core.orderbook.helpers import get_stack_levels
 from core.orderbook.helpers import mark_self_stack
 from core.models.cryptocoins import UserWallet
 from core.models.inouts.balance import Balance
@@ -19,11 +30,12 @@ from core.serializers.orders import ExecutionResultSerializer
 from core.serializers.orders import OrderSerializer
 from core.serializers.wallet_history import WalletHistoryItemSerializer
 from core.utils.stats.daily import get_filtered_pairs_24h_stats
-from core.views.stats import PairTradeChartDataWithPreAggregattion
+from core.views.stats import get_chart_data
 from core.views.stats import StatsSerializer
 from lib.helpers import dt_from_js
 from lib.helpers import find_similar_entry_by_field
 from lib.helpers import normalize_data
+from lib.utils import threaded_daemon
 
 channel_layer = get_channel_layer()
 MSG_TYPE = 'exchange.message'
@@ -31,9 +43,90 @@ MSG_TYPE = 'exchange.message'
 log = logging.getLogger(__name__)
 
 
+class NotificationsBuffer:
+    """
+    Per-process outbound queue for websocket messages.
+
+    Messages are flushed by background thread in batches, so callers (e.g. matching worker)
+    don't wait for channel layer. Coalesced messages replace not yet sent message
+    of the same channel, so only the latest state is sent.
+    """
+    FLUSH_PERIOD = settings.NOTIFICATIONS_FLUSH_PERIOD  # in seconds
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.messages = OrderedDict()
+        self.counter = itertools.count()
+        self.pid = None
+        self.debounced = []  # notificators collecting changes till the next flush
+
+    @property
+    def started(self):
+        # flusher thread doesn't survive fork
+        return self.pid == os.getpid()
+
+    def start(self, flusher=True):
+        """
+        Starts buffering, without flusher thread caller should flush by itself
+        """
+        if self.started:
+            return
+        self.pid = os.getpid()
+        if flusher:
+            self.flusher_thread = self.flusher()
+
+    def add(self, channel, message, coalesce=False):
+        key = channel if coalesce else (channel, next(self.counter))
+        with self.lock:
+            self.messages.pop(key, None)
+            self.messages[key] = (channel, message)
+
+    def flush(self):
+        for notificator in self.debounced:
+            notificator.flush_pending()
+
+        with self.lock:
+            messages, self.messages = self.messages, OrderedDict()
+
+        if not messages:
+            return
+
+        by_channel = defaultdict(list)
+        for channel, message in messages.values():
+            by_channel[channel].append(message)
+        async_to_sync(self.send)(by_channel)
+
+    async def send(self, by_channel):
+        async def send_channel(channel, messages):
+            # keep order of messages inside channel
+            for message in messages:
+                await channel_layer.group_send(channel, message)
+
+        results = await asyncio.gather(
+            *[send_channel(channel, messages) for channel, messages in by_channel.items()],
+            return_exceptions=True,
+        )
+        for result in results:
+            if isinstance(result, Exception):
+                log.error('Notification send failed: %r', result)
+
+    @threaded_daemon
+    def flusher(self):
+        while True:
+            time.sleep(self.FLUSH_PERIOD)
+            try:
+                self.flush()
+            except Exception:
+                log.exception('Notifications flush failed')
+
+
+notifications_buffer = NotificationsBuffer()
+
+
 class BaseNotificator:
     MSG_KIND: str = ''
     PARAMS = []  # required parameters
+    COALESCE = False  # message is a full state, only the latest one should be sent
 
     def gen_channel(self, **kwargs) -> str:
         ch_name = f'{self.MSG_KIND}_' + '_'.join(str(kwargs.get(k)) for k in self.PARAMS)
@@ -51,6 +144,9 @@ class BaseNotificator:
 
     def notify(self, data, **kwargs):
         data = self.prepare_data(data, is_notification=True, **kwargs)
+        if notifications_buffer.started:
+            notifications_buffer.add(self.gen_channel(**kwargs), data, coalesce=self.COALESCE)
+            return
         async_to_sync(channel_layer.group_send)(self.gen_channel(**kwargs), data)
 
     def get_data(self, **kwargs):
@@ -68,6 +164,7 @@ class UserNotificator(BaseNotificator):
 class StackNotificator(BaseNotificator):
     MSG_KIND = 'stack'
     PARAMS = ['pair_name', 'precision']
+    COALESCE = True
 
     def prepare_data(self, data, is_notification=False, **kwargs):
         pair = kwargs['pair_name']
@@ -97,6 +194,39 @@ class StackNotificator(BaseNotificator):
         return get_stack_by_pair(pair, precision)
 
 
+class StackDiffNotificator(BaseNotificator):
+    """
+    Incremental stack feed: snapshot of price levels on subscribe, then changed levels.
+    Each message has seq, client should resync if seq is not previous + 1
+    """
+    MSG_KIND = 'stack_diff'
+    PARAMS = ['pair_name', 'precision']
+
+    def prepare_data(self, data, is_notification=False, **kwargs):
+        data = {
+            'kind': self.MSG_KIND,
+            'pair': kwargs['pair_name'],
+            'precision': kwargs.get('precision'),
+            'snapshot': kwargs.get('snapshot', False),
+            'seq': data.get('seq', 0),
+            'buys': data.get('buys', []),
+            'sells': data.get('sells', []),
+        }
+        data = normalize_data(data)
+
+        if is_notification:
+            return {
+                'type': MSG_TYPE,
+                'data': data,
+            }
+        return data
+
+    def get_data(self, **kwargs):
+        pair = kwargs['pair_name']
+        precision = kwargs.get('precision')
+        return get_stack_levels(pair, precision)
+
+
 class PairsNotificator(BaseNotificator):
     MSG_KIND = 'pairs'
     PARAMS = []
@@ -110,11 +240,44 @@ class PairsNotificator(BaseNotificator):
 class BalanceNotificator(BaseNotificator):
     MSG_KIND = 'balance'
     PARAMS = ['user_id']
+    COALESCE = True
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pending = set()
 
     def add_data(self, **kwargs):
+        if notifications_buffer.started:
+            # balance is sent once per flush period, after changes are committed
+            user_id = kwargs['user_id']
+            transaction.on_commit(lambda: self.add_pending(user_id))
+            return
+
         data = self.get_data(**kwargs)
         self.notify(data, **kwargs)
 
+    def add_pending(self, user_id):
+        with self.lock:
+            self.pending.add(user_id)
+
+    def flush_pending(self):
+        with self.lock:
+            user_ids, self.pending = self.pending, set()
+
+        if not user_ids:
+            return
+
+        close_old_connections()
+        try:
+            balances = Balance.for_users(user_ids)
+        except Exception:
+            with self.lock:
+                self.pending |= user_ids
+            raise
+
+        for user_id, balance in balances.items():
+            self.notify({'balance': balance}, user_id=user_id)
+
     def get_data(self, **kwargs):
         user_id = kwargs['user_id']
         return {'balance': Balance.for_user(user_id)}
@@ -152,47 +315,25 @@ class FeesAndLimitsNotificator(BaseNotificator):
     PARAMS = []
 
     def get_data(self, **kwargs):
-        data = FeesAndLimits.get_fees_and_limits()
+        # normalize_data casts decimals in place, keep process cache intact
+        data = copy.deepcopy(FeesAndLimits.get_fees_and_limits())
         return {'data': data}
 
 
 class ChartNotificator(BaseNotificator):
     MSG_KIND = 'chart'
-    PARAMS = []
+    PARAMS = ['pair', 'frame']
 
     def get_data(self, **kwargs):
         serializer = StatsSerializer(data=kwargs)
         serializer.is_valid(raise_exception=True)
-        spec = serializer.data
-
-        start = dt_from_js(spec['start_ts'])
-        stop = dt_from_js(spec['stop_ts'])
-
-        if stop > now():
-            stop = now()
-
-        st = PairTradeChartDataWithPreAggregattion(
-            start=start,
-            stop=stop,
-            period=spec['frame'],
-            pair=spec['pair']
-        )
-
-        records = st.get()
-
-        response = {
-            'records': records,
-            'start': spec['start_ts'],
-            'stop': spec['stop_ts'],
-            'frame': spec['frame'],
-            'last_record_dt': None if not records else str((records[-1][0]))
-        }
-        return response
+        return get_chart_data(serializer.data)
 
 
 class PairsVolumeNotificator(BaseNotificator):
     MSG_KIND = 'pairs_volume'
     PARAMS = []
+    COALESCE = True
 
     def add_data(self, **kwargs):
         data = self.get_data(**kwargs)
@@ -207,6 +348,7 @@ class BasePaginatedNotificator(BaseNotificator):
     LIMIT: int = 10
     SERIALIZER = None
     PARAMS = []
+    COALESCE = True  # first page is sent as a whole
 
     def get_cache(self, default=None, **kwargs):
         key = f'wsdata-' + self.gen_channel(**kwargs)
@@ -621,8 +763,10 @@ class WalletHistoryTickerNotificator(BasePaginatedNotificator):
 
 user_notificator = UserNotificator()
 stack_notificator = StackNotificator()
+stack_diff_notificator = StackDiffNotificator()
 chart_notificator = ChartNotificator()
 balance_notificator = BalanceNotificator()
+notifications_buffer.debounced.append(balance_notificator)
 trades_notificator = TradesNotificator()
 opened_orders_notificator = OpenedOrdersNotificator()
 closed_orders_notificator = ClosedOrdersNotificator()
@@ -17,6 +17,13 @@ TRX_SAFE_ADDR = env('TRX_SAFE_ADDR')
 
 MATIC_SAFE_ADDR = env('MATIC_SAFE_ADDR')
 
+# block scanners
+BLOCKS_PREFETCH_WORKERS = env.int('BLOCKS_PREFETCH_WORKERS', default=8)
+BLOCKS_PREFETCH_BATCH_SIZE = env.int('BLOCKS_PREFETCH_BATCH_SIZE', default=10)  # blocks per node request
+BLOCKS_COMMIT_PERIOD = 50  # processed blocks between last processed block saves
+ADDRESS_INDEX_CHECK_PERIOD = 1  # new wallet addresses check period, in seconds
+UTXO_CHECK_BATCH_SIZE = env.int('UTXO_CHECK_BATCH_SIZE', default=500)  # gettxout calls per node request
+UTXO_INDEX_RECONCILE_PERIOD = 60 * 60  # utxo index refill from listunspent period, in seconds
 
 BTC_BLOCK_GENERATION_TIME = 5 * 60.0
 BTC_NODE_CONNECTION_RETRIES = 5
@@ -16,6 +16,19 @@ STACK_EXPORT_LIMIT = 100  # limit to export stack via memcache
 STACK_UPDATE_PERIOD = 1  # once a second
 STACK_DOWN_TIMEOUT = 60 * 15  # 15 min
 STACK_DOWN_MULTI = 3  # multiplier STACK_DOWN_TIMEOUT - etc 15,45,135
+STACK_SNAPSHOT_NOTIFY_ENABLED = True  # broadcast full stack, disable when clients use stack diffs
+NOTIFICATIONS_FLUSH_PERIOD = 0.1  # websocket messages buffer flush period of the stack worker, in seconds
+STACK_SETTLEMENT_ENABLED = False  # match in memory, persist fills in batches
+STACK_SETTLEMENT_PERIOD = 0.05  # in seconds
+STACK_SETTLEMENT_BATCH_SIZE = 500  # fills per db transaction
+ROLLING_STATS_PUBLISH_PERIOD = 1  # pairs 24h stats publish period of the stack worker, in seconds
+CANDLES_PUBLISH_PERIOD = 1  # live chart candles publish period of the stack worker, in seconds
+CANDLES_KEEP_CLOSED = 60  # closed candles kept by the stack worker per chart period
+
+SETTINGS_VERSION_CHECK_PERIOD = 1  # pair settings, fees and disabled coins reload check period, in seconds
+
+IN_ORDERS_RECONCILE_BATCH_SIZE = 1000  # users per reconciliation query
+IN_ORDERS_RECONCILE_FIX = False  # overwrite drifted amount_in_orders with recalculated holds
 
 LAST_CRYPTO_WITHDRAWAL_ADDRESSES_COUNT = 3
 CRYPTO_TOPUP_REQUIRED_CONFIRMATIONS_COUNT = 1
@@ -58,6 +71,12 @@ ORDER_DELETE_ATTEMPT_CACHE = True
 CRYPTOCOMPARE_API_KEY = env('CRYPTOCOMPARE_API_KEY')
 
 STATS_CLEANUP_MINUTE_INTERVAL_DAYS_AGO = 7  # days
+CHART_BLOCK_CACHE_TTL = 24 * 60 * 60  # closed candles blocks, in seconds
+CHART_RESPONSE_CACHE_TTL = 1  # whole chart responses, in seconds
+PARTITIONS_PREMAKE_MONTHS = 3  # monthly partitions created ahead
+PARTITIONS_ARCHIVE_SCHEMA = 'archive'  # detached partitions are moved there
+DIF_BALANCE_BATCH_SIZE = 1000  # users per batch
+DIF_BALANCE_WORKERS = 4  # parallel tasks over user id ranges
 
 EXCHANGE_DESCRIPTION = 'Exchange description'
 EXCHANGE_INFO = {
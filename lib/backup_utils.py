@@ -1,9 +1,12 @@
+import gzip
 import logging
 import os
 import shutil
 import tarfile
 
 from django.conf import settings
+from django.core.exceptions import EmptyResultSet
+from django.db import connection
 from django.db import models
 from django.utils import timezone
 from import_export import resources
@@ -11,7 +14,7 @@ from import_export.widgets import Widget
 from tablib import Dataset
 
 from core.currency import Currency
-from core.models import Order, Transaction, ExecutionResult
+from core.models import Order, Transaction, ExecutionResult, WalletHistoryItem
 from core.models.inouts.pair import Pair
 
 log = logging.getLogger(__name__)
@@ -46,7 +49,7 @@ def prepare_backup():
 
 def finish_backup():
     log.info(f'Creating backup archive')
-    filenames = ['transaction.csv', 'order.csv', 'executionresult.csv']
+    filenames = sorted(os.listdir(TEMP_DIR))
     now = timezone.now().date()
     name = f'backup_{now}'
     filepath = os.path.join(BACKUP_PATH, name)
@@ -56,30 +59,37 @@ def finish_backup():
 
 
 def backup_qs_to_csv(queryset):
-    filename = f'{queryset.model._meta.model_name}.csv'
+    filename = f'{queryset.model._meta.model_name}.csv.gz'
     filename = os.path.join(TEMP_DIR, filename)
     res = queryset_to_csv(queryset, filename)
     return res
 
 
 def queryset_to_csv(queryset, filename):
-    resource = create_import_export_resource(queryset.model)
-    dataset = resource.export(queryset)
-    csv = dataset.csv
-
-    # delete header if file already exists
-    if os.path.exists(filename):
-        csv = csv.split('\r\n',1)[1]
-
-    with open(filename, 'a') as csvfile:
-        csvfile.write(csv)
-    log.info(f'{len(dataset)} rows written to {filename}')
+    """
+    Streams queryset rows with COPY into gzipped csv, rows never get into python memory.
+    Every call appends new gzip member, header is written only once
+    """
+    try:
+        sql, params = queryset.query.get_compiler(using=queryset.db).as_sql()
+    except EmptyResultSet:
+        # filter can not match any row, e.g. id__in=[]
+        log.info(f'0 rows written to {filename}')
+        return filename
+    header = '' if os.path.exists(filename) else 'HEADER'
+
+    with connection.cursor() as cursor, gzip.open(filename, 'ab') as csvfile:
+        query = cursor.mogrify(sql, params).decode()
+        cursor.copy_expert(f'COPY ({query}) TO STDOUT WITH CSV {header}', csvfile)
+        rowcount = cursor.rowcount
+    log.info(f'{rowcount} rows written to {filename}')
     return filename
 
 
 def archive_files(arc_name, filenames):
-    arc_name = f'{arc_name}.tar.gz'
-    tar = tarfile.open(arc_name, 'w:gz')
+    # files are gzipped already
+    arc_name = f'{arc_name}.tar'
+    tar = tarfile.open(arc_name, 'w')
     for filename in filenames:
         filepath = os.path.join(TEMP_DIR, filename)
         if not os.path.exists(filepath):
@@ -97,21 +107,33 @@ def restore_from_backup(arch_name):
     backup_arch_name = os.path.join(BACKUP_PATH, arch_name)
     extract_archive(backup_arch_name, RESTORE_DIR)
 
-    models = [Transaction, Order, ExecutionResult]
-    # models = [ Order, ExecutionResult]
+    models = [Transaction, WalletHistoryItem, Order, ExecutionResult]
     for model in models:
         filename = f'{model._meta.model_name}.csv'
         filepath = os.path.join(RESTORE_DIR, filename)
 
-        if not os.path.exists(filepath):
+        if os.path.exists(f'{filepath}.gz'):
+            copy_model_from_csv(f'{filepath}.gz', model)
+        elif os.path.exists(filepath):
+            # archives made before streaming backups
+            restore_model_from_csv(filepath, model)
+        else:
             log.warning(f'{filepath} not exists')
-            continue
-
-        restore_model_from_csv(filepath, model)
     log.info('Deleting temp restore folder')
     shutil.rmtree(RESTORE_DIR)
 
 
+def copy_model_from_csv(csv_name, model):
+    """
+    Streams gzipped csv made by queryset_to_csv into model table with COPY
+    """
+    log.info(f'Restoring {csv_name}')
+    with gzip.open(csv_name, 'rt') as csvfile, connection.cursor() as cursor:
+        columns = ', '.join(f'"{i}"' for i in csvfile.readline().strip().split(','))
+        cursor.copy_expert(f'COPY "{model._meta.db_table}" ({columns}) FROM STDIN WITH CSV', csvfile)
+        log.info(f'Restored {cursor.rowcount} entries')
+
+
 def extract_archive(archive_name, extraction_dirname='.'):
     tar = tarfile.open(archive_name, "r")
     tar.extractall(extraction_dirname)
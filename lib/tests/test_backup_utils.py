@@ -0,0 +1,30 @@
+import gzip
+
+import pytest
+
+from core.models import Order
+from core.models.inouts.pair import Pair
+from lib.backup_utils import queryset_to_csv
+
+
+@pytest.mark.django_db
+class TestQuerysetToCsv:
+
+    def test_backup(self, tmp_path):
+        filename = str(tmp_path / 'pair.csv.gz')
+        queryset = Pair.objects.order_by('id')
+
+        queryset_to_csv(queryset.filter(id__lte=2), filename)
+        queryset_to_csv(queryset.filter(id__gt=2), filename)
+
+        with gzip.open(filename, 'rt') as csvfile:
+            lines = csvfile.read().splitlines()
+        # header is written only by the first call
+        assert lines[0] == 'id,base,quote'
+        assert [int(i.split(',')[0]) for i in lines[1:]] == list(queryset.values_list('id', flat=True))
+
+    def test_empty_queryset(self, tmp_path):
+        filename = str(tmp_path / 'order.csv.gz')
+
+        assert queryset_to_csv(Order.objects.filter(id__in=[]), filename) == filename
+        assert queryset_to_csv(Order.objects.none(), filename) == filename
@@ -1,4 +1,3 @@
-import datetime
 import logging
 import os
 import time
@@ -7,10 +6,7 @@ from itertools import groupby
 import markdown
 from django.conf import settings
 from django.db.models import F
-from django.db.models.aggregates import Max
-from django.db.models.aggregates import Min
 from django.shortcuts import render
-from django.utils.timezone import now
 from rest_framework import status
 from rest_framework.decorators import api_view
 from rest_framework.decorators import permission_classes
@@ -61,7 +57,6 @@ class TickersView(APIView):
         data = []
         pairs_data = get_filtered_pairs_24h_stats()
         pairs_data = {pair['pair']: pair for pair in pairs_data['pairs']}
-        yesterday = now() - datetime.timedelta(hours=24)
 
         for pair in Pair.objects.all():
             if is_pair_disabled(pair):
@@ -81,21 +76,8 @@ class TickersView(APIView):
                 'low': 0.0,
             }
 
-            pair = Pair.get(pair)
-            qs = ExecutionResult.objects.filter(
-                pair=pair,
-                cancelled=False
-            ).select_related('order')
-
-            aggregation = qs.filter(
-                updated__gte=yesterday
-            ).aggregate(
-                high_24h=Max(F('price')),
-                low_24h=Min(F('price')),
-            )
-
-            result['high'] = aggregation['high_24h']
-            result['low'] = aggregation['low_24h']
+            result['high'] = pair_data.get('high_24h')
+            result['low'] = pair_data.get('low_24h')
 
             stack_data = StackView.stack_limited(pair, 1, 1)
             if stack_data:
@@ -1,6 +1,5 @@
 """Public API views"""
 
-import datetime
 import logging
 import os
 import time
@@ -8,10 +7,7 @@ import time
 import markdown
 from django.conf import settings
 from django.db.models import F
-from django.db.models.aggregates import Max
-from django.db.models.aggregates import Min
 from django.shortcuts import render
-from django.utils.timezone import now
 from drf_spectacular.types import OpenApiTypes
 from drf_spectacular.utils import OpenApiParameter
 from drf_spectacular.utils import extend_schema, OpenApiExample
@@ -189,34 +185,6 @@ class SummaryView(NoAuthMixin, ThrottlingViewMixin, APIView):
         data = {}
         pairs_data = get_filtered_pairs_24h_stats(DISABLE_STACK)
         pairs_data = {pair['pair']: pair for pair in pairs_data['pairs']}
-        yesterday = now() - datetime.timedelta(hours=24)
-
-        def id_filter(**kwargs):
-            return ExecutionResult.objects.filter(
-                **kwargs
-            ).values(
-                'pair'
-            ).annotate(
-                id=Max('id')
-            ).values_list(
-                'id', flat=True
-            )
-
-        prices_24h = {Pair.get(i['pair']).code: i['price'] for i in
-                      ExecutionResult.objects.filter(
-                          id__in=id_filter(updated__lte=yesterday)
-                      ).values('pair', 'price')}
-
-        high_low_qs = ExecutionResult.objects.filter(
-            updated__gt=yesterday,
-            cancelled=False,
-        ).values(
-            'pair'
-        ).annotate(
-            high=Max('price'),
-            low=Min('price'),
-        )
-        high_lows_dict = {Pair.get(i['pair']): i for i in high_low_qs}
 
         for pair in Pair.objects.all():
             if is_pair_disabled(pair, DISABLE_STACK):
@@ -236,10 +204,8 @@ class SummaryView(NoAuthMixin, ThrottlingViewMixin, APIView):
 
             pair_data = pairs_data.get(pair.code, {})
 
-            pair = Pair.get(pair)
-
             last_price = pair_data.get('price') or 0
-            price_24h = prices_24h.get(pair.code, 0.0)
+            price_24h = pair_data.get('price_24h_ago') or 0.0
 
             if last_price:
                 result['last_price'] = last_price
@@ -247,12 +213,10 @@ class SummaryView(NoAuthMixin, ThrottlingViewMixin, APIView):
             if last_price and price_24h:
                 result['percent_change'] = (last_price - price_24h) / price_24h
 
-            high_low = high_lows_dict.get(pair) or {}
-
             result['quote_volume'] = pair_data.get('volume') or 0
             result['base_volume'] = pair_data.get('base_volume') or 0
-            result['high_24h'] = high_low.get('high')
-            result['low_24h'] = high_low.get('low')
+            result['high_24h'] = pair_data.get('high_24h')
+            result['low_24h'] = pair_data.get('low_24h')
 
             stack_data = StackView.stack_limited(pair, 1, 1)
             if stack_data: